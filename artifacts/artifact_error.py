@@ -0,0 +1,10 @@
+class ArtifactError(Exception):
+    """
+    Exception to indicate an invalid or unreadable Qiime2 artifact.
+    """
+
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return f'{self.msg}'
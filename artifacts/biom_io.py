@@ -0,0 +1,109 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .artifact_error import ArtifactError
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# Feature table in compressed sparse row format. Rows are features and columns are samples. The counts of feature i are
+# data[indptr[i]:indptr[i + 1]] and their sample indices are indices[indptr[i]:indptr[i + 1]].
+SparseTable = namedtuple('SparseTable', ['feature_ids', 'sample_ids', 'data', 'indices', 'indptr'])
+
+
+def is_available():
+    """
+    Return true if BIOM HDF5 files can be read, i.e. h5py is installed.
+    """
+    return h5py is not None
+
+
+def read_biom(file):
+    """
+    Read a BIOM 2.1 HDF5 feature table from the given path or file object and return a SparseTable. Raise an
+    ArtifactError if the file cannot be read.
+    """
+    if h5py is None:
+        raise ArtifactError(msg='h5py is required to read BIOM HDF5 files.')
+
+    try:
+        with h5py.File(file, 'r') as f:
+            return SparseTable(feature_ids=decode_ids(f['observation/ids'][:]),
+                               sample_ids=decode_ids(f['sample/ids'][:]),
+                               data=f['observation/matrix/data'][:],
+                               indices=f['observation/matrix/indices'][:].astype(np.int64),
+                               indptr=f['observation/matrix/indptr'][:].astype(np.int64))
+    except (OSError, KeyError) as e:
+        raise ArtifactError(msg=f'Invalid BIOM HDF5 file: {e}')
+
+
+def write_biom(table, file, table_id='data_engineering'):
+    """
+    Write the given SparseTable to the given path or file object as a BIOM 2.1 HDF5 feature table. Raise an
+    ArtifactError if the file cannot be written.
+    """
+    if h5py is None:
+        raise ArtifactError(msg='h5py is required to write BIOM HDF5 files.')
+
+    n_features, n_samples = len(table.feature_ids), len(table.sample_ids)
+    csc_data, csc_indices, csc_indptr = transpose(table)
+
+    try:
+        with h5py.File(file, 'w') as f:
+            f.attrs['id'] = table_id
+            f.attrs['type'] = 'OTU table'
+            f.attrs['format-url'] = 'http://biom-format.org'
+            f.attrs['format-version'] = (2, 1)
+            f.attrs['generated-by'] = table_id
+            f.attrs['creation-date'] = datetime.now(timezone.utc).isoformat()
+            f.attrs['shape'] = (n_features, n_samples)
+            f.attrs['nnz'] = len(table.data)
+
+            for axis, ids, (data, indices, indptr) in (
+                    ('observation', table.feature_ids, (table.data, table.indices, table.indptr)),
+                    ('sample', table.sample_ids, (csc_data, csc_indices, csc_indptr))):
+                group = f.create_group(axis)
+                group.create_dataset('ids', data=np.array(list(ids), dtype=object), dtype=h5py.string_dtype())
+                group.create_group('metadata')
+                group.create_group('group-metadata')
+                matrix = group.create_group('matrix')
+                matrix.create_dataset('data', data=np.asarray(data, dtype=np.float64))
+                matrix.create_dataset('indices', data=np.asarray(indices, dtype=np.int32))
+                matrix.create_dataset('indptr', data=np.asarray(indptr, dtype=np.int32))
+    except OSError as e:
+        raise ArtifactError(msg=f'Unable to write the BIOM HDF5 file: {e}')
+
+
+def transpose(table):
+    """
+    Return the data, indices and indptr arrays of the table in compressed sparse column format, i.e. one row per
+    sample.
+    """
+    n_samples = len(table.sample_ids)
+    rows = np.repeat(np.arange(len(table.feature_ids), dtype=np.int64), np.diff(table.indptr))
+    order = np.lexsort((rows, table.indices))
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(table.indices, minlength=n_samples))))
+    return table.data[order], rows[order], indptr
+
+
+def decode_ids(ids):
+    """
+    Return the given array of ids as an array of strings.
+    """
+    return np.array([value.decode() if isinstance(value, bytes) else str(value) for value in ids], dtype=object)
+
+
+def densify_rows(table, start, stop):
+    """
+    Return the counts of the features in rows start to stop of the table as a dense features x samples array.
+    """
+    stop = min(stop, len(table.feature_ids))
+    begin, end = table.indptr[start], table.indptr[stop]
+    dense = np.zeros((stop - start, len(table.sample_ids)), dtype=table.data.dtype)
+    rows = np.repeat(np.arange(stop - start), np.diff(table.indptr[start:stop + 1]))
+    dense[rows, table.indices[begin:end]] = table.data[begin:end]
+    return dense
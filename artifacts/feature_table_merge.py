@@ -0,0 +1,109 @@
+import numpy as np
+
+from .biom_io import SparseTable
+
+# Methods for handling the (feature, sample) pairs that occur in more than one table. Same as
+# `qiime feature-table merge`.
+OVERLAP_METHODS = ('average', 'error_on_overlapping_feature', 'error_on_overlapping_sample', 'sum')
+
+
+def merge_tables(tables, overlap_method='sum'):
+    """
+    Merge the given SparseTables into one. Feature and sample IDs are unioned in the order they first occur. The counts
+    of a feature in a sample that occurs in more than one table are summed, or averaged over the tables that include the
+    sample. Raise a ValueError if the overlap method is error_on_overlapping_feature or error_on_overlapping_sample and
+    a feature or sample occurs in more than one table.
+    """
+    if overlap_method not in OVERLAP_METHODS:
+        raise ValueError(f'Invalid overlap method: {overlap_method}')
+
+    feature_index, feature_tables = {}, []
+    sample_index, sample_tables = {}, []
+    rows, columns, data = [], [], []
+
+    for table in tables:
+        features = index_ids(table.feature_ids, feature_index, feature_tables)
+        samples = index_ids(table.sample_ids, sample_index, sample_tables)
+        rows.append(np.repeat(features, np.diff(table.indptr)))
+        columns.append(samples[table.indices])
+        data.append(table.data)
+
+    if overlap_method == 'error_on_overlapping_feature':
+        check_overlap(feature_index, feature_tables, 'Features')
+    elif overlap_method == 'error_on_overlapping_sample':
+        check_overlap(sample_index, sample_tables, 'Samples')
+
+    n_features, n_samples = len(feature_index), len(sample_index)
+    if n_samples == 0:
+        return SparseTable(feature_ids=np.array([], dtype=object), sample_ids=np.array([], dtype=object),
+                           data=np.zeros(0), indices=np.zeros(0, dtype=np.int64), indptr=np.zeros(1, dtype=np.int64))
+
+    # Sum the counts of each (feature, sample) pair. Keys sort by feature, then sample.
+    keys = np.concatenate(rows) * n_samples + np.concatenate(columns)
+    data = np.concatenate(data).astype(np.float64)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=data, minlength=len(keys))
+
+    if overlap_method == 'average':
+        sums /= np.asarray(sample_tables, dtype=np.float64)[keys % n_samples]
+
+    nonzero = sums != 0
+    keys, sums = keys[nonzero], sums[nonzero]
+    rows = keys // n_samples
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n_features))))
+
+    return SparseTable(feature_ids=np.array(list(feature_index), dtype=object),
+                       sample_ids=np.array(list(sample_index), dtype=object),
+                       data=sums, indices=keys % n_samples, indptr=indptr)
+
+
+def index_ids(ids, index, counts):
+    """
+    Return the indices of the given IDs in the index. IDs that are not indexed yet are added. counts holds the number
+    of tables that include each indexed ID.
+    """
+    indices = np.empty(len(ids), dtype=np.int64)
+    for i, id_ in enumerate(ids):
+        position = index.setdefault(id_, len(index))
+        if position == len(counts):
+            counts.append(0)
+        counts[position] += 1
+        indices[i] = position
+    return indices
+
+
+def check_overlap(index, counts, title):
+    overlapping = [id_ for id_, position in index.items() if counts[position] > 1]
+    if overlapping:
+        raise ValueError(f'{title} occur in more than one table: {", ".join(overlapping[:10])}')
+
+
+def remove_samples(table, sample_ids):
+    """
+    Return the table without the given samples. Features that no longer occur in any sample are removed as well.
+    """
+    keep_samples = np.array([sample_id not in sample_ids for sample_id in table.sample_ids], dtype=bool)
+    new_samples = np.cumsum(keep_samples) - 1
+
+    rows = np.repeat(np.arange(len(table.feature_ids), dtype=np.int64), np.diff(table.indptr))
+    keep = keep_samples[table.indices] & (table.data != 0)
+    rows, indices, data = rows[keep], new_samples[table.indices[keep]], table.data[keep]
+
+    keep_features = np.bincount(rows, minlength=len(table.feature_ids)) > 0
+    new_features = np.cumsum(keep_features) - 1
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(new_features[rows], minlength=int(keep_features.sum())))))
+
+    return SparseTable(feature_ids=table.feature_ids[keep_features], sample_ids=table.sample_ids[keep_samples],
+                       data=data, indices=indices, indptr=indptr)
+
+
+def merge_taxonomies(taxonomies):
+    """
+    Merge the given dictionaries that map feature IDs to (taxon, confidence) tuples. A feature keeps the taxonomy of
+    the first dictionary that includes it, like `qiime feature-table merge-taxa`.
+    """
+    merged = {}
+    for taxonomy in taxonomies:
+        for feature_id, taxon in taxonomy.items():
+            merged.setdefault(feature_id, taxon)
+    return merged
@@ -0,0 +1,73 @@
+import csv
+import io
+from zipfile import ZipFile
+
+from .artifact_error import ArtifactError
+from .biom_io import read_biom
+
+
+def find_member(zip_file, file_name):
+    """
+    Return the name of the payload file with the given name in an opened Qiime2 artifact. Raise an ArtifactError if
+    the artifact doesn't include it.
+    """
+    for member in zip_file.namelist():
+        if member.endswith(f'/data/{file_name}'):
+            return member
+
+    raise ArtifactError(msg=f'{file_name} is missing in {zip_file.filename}.')
+
+
+def read_payload(qza_path, file_name):
+    """
+    Return the contents of the payload file with the given name in a Qiime2 artifact as a binary stream.
+    """
+    with ZipFile(qza_path, 'r') as z:
+        return io.BytesIO(z.read(find_member(z, file_name)))
+
+
+def read_feature_table(qza_path):
+    """
+    Return the SparseTable in a FeatureTable[Frequency] artifact without exporting it.
+    """
+    return read_biom(read_payload(qza_path, 'feature-table.biom'))
+
+
+def read_sequences(qza_path):
+    """
+    Return a dictionary that maps feature IDs to sequences in a FeatureData[Sequence] artifact.
+    """
+    sequences = {}
+    with ZipFile(qza_path, 'r') as z:
+        with z.open(find_member(z, 'dna-sequences.fasta')) as f:
+            feature_id = None
+            for line in io.TextIOWrapper(f, encoding='utf-8'):
+                line = line.strip()
+                if line.startswith('>'):
+                    feature_id = line[1:].split()[0]
+                    sequences[feature_id] = ''
+                elif feature_id is not None:
+                    sequences[feature_id] += line
+
+    return sequences
+
+
+def read_taxonomy(qza_path):
+    """
+    Return a dictionary that maps feature IDs to (taxon, confidence) tuples in a FeatureData[Taxonomy] artifact.
+    """
+    taxonomy = {}
+    with ZipFile(qza_path, 'r') as z:
+        with z.open(find_member(z, 'taxonomy.tsv')) as f:
+            reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8'), delimiter='\t')
+            header = next(reader, None)
+            if not header or 'Taxon' not in header or 'Confidence' not in header:
+                raise ArtifactError(msg=f'Taxon or Confidence column is missing in {qza_path}.')
+            taxon_index = header.index('Taxon')
+            confidence_index = header.index('Confidence')
+            for row in reader:
+                if not row or row[0].startswith('#'):
+                    continue
+                taxonomy[row[0]] = (row[taxon_index], row[confidence_index])
+
+    return taxonomy
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+# Quality string characters of the synthetic reads, Phred scores 2 to 40.
+QUALITY_CHARS = np.frombuffer(bytes(range(35, 74)), dtype=np.uint8)
+
+# Nucleotides of the synthetic reads.
+BASES = np.frombuffer(b'ACGT', dtype=np.uint8)
+
+
+def write_fastq(path, n_reads, read_length=150, seed=0):
+    """
+    Write a fastq file with n_reads random reads whose quality drops towards the end of the reads.
+    """
+    rng = np.random.default_rng(seed)
+    seqs = BASES[rng.integers(len(BASES), size=(n_reads, read_length))]
+    decay = np.linspace(0, len(QUALITY_CHARS) // 2, read_length).astype(np.int64)
+    scores = np.clip(len(QUALITY_CHARS) - 1 - decay - rng.integers(8, size=(n_reads, read_length)), 0, None)
+    quals = QUALITY_CHARS[scores]
+
+    with open(path, 'wb') as f:
+        for i in range(n_reads):
+            f.write(b'@read%d\n%s\n+\n%s\n' % (i, seqs[i].tobytes(), quals[i].tobytes()))
+
+
+def make_fastq_tree(directory, n_studies, n_samples, paired=True, reads_per_file=0, ready=True):
+    """
+    Create n_studies study directories with n_samples samples each in the given directory. Return the paths of the
+    study directories. Fastq files are empty unless reads_per_file is positive.
+    """
+    study_dirs = []
+    for study in range(n_studies):
+        study_dir = os.path.join(directory, f'SRR{study:07d}')
+        os.makedirs(study_dir, exist_ok=True)
+        for sample in range(n_samples):
+            for direction in ((1, 2) if paired else (1,)):
+                path = os.path.join(study_dir, f'ERR{sample:07d}_{direction}.fastq')
+                if reads_per_file:
+                    write_fastq(path, reads_per_file, seed=study * n_samples + sample)
+                else:
+                    open(path, 'w').close()
+        if ready:
+            open(os.path.join(study_dir, 'complete.txt'), 'w').close()
+        study_dirs.append(study_dir)
+
+    return study_dirs
+
+
+def make_feature_table_tsv(path, n_samples, n_features, density=0.1, seed=0):
+    """
+    Write a biom tsv feature table with n_features rows and n_samples columns. About density of the counts are
+    non-zero. Return the feature IDs.
+    """
+    rng = np.random.default_rng(seed)
+    feature_ids = [f'{i:032x}' for i in range(n_features)]
+    sample_ids = [f'ERR{i:07d}' for i in range(n_samples)]
+
+    with open(path, 'w') as f:
+        f.write('# Constructed from biom file\n')
+        f.write('#OTU ID\t' + '\t'.join(sample_ids) + '\n')
+        for feature_id in feature_ids:
+            counts = rng.integers(1, 1000, size=n_samples) * (rng.random(n_samples) < density)
+            f.write(feature_id + '\t' + '\t'.join(map(str, counts.astype(float))) + '\n')
+
+    return feature_ids
+
+
+def make_taxonomy_tsv(path, feature_ids, seed=0):
+    """
+    Write taxonomy results for the given feature IDs.
+    """
+    rng = np.random.default_rng(seed)
+    ranks = ['d__Bacteria', 'p__Firmicutes', 'c__Bacilli', 'o__Lactobacillales', 'f__Streptococcaceae',
+             'g__Streptococcus']
+
+    with open(path, 'w') as f:
+        f.write('Feature ID\tTaxon\tConfidence\n')
+        for feature_id, depth, confidence in zip(feature_ids, rng.integers(1, len(ranks) + 1, len(feature_ids)),
+                                                 rng.random(len(feature_ids))):
+            f.write(f'{feature_id}\t{"; ".join(ranks[:depth])}\t{0.7 + 0.3 * confidence:.6f}\n')
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Microbenchmarks for the Python-side hot paths. Runs without Qiime2 or a database.
+
+    python -m benchmarks.run_benchmarks                  # Run and compare with the saved baselines.
+    python -m benchmarks.run_benchmarks --save-baseline  # Run and save the results as the baselines.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import utils
+from crawler.scan_index import ScanIndex
+from static import constants as const
+from static.layout import Layout
+from study import fastq_profiler, fastq_subsampler
+from study.study import Study
+from . import generators
+
+# Default path of the baselines file.
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# Maps benchmark names to functions that create the data of a benchmark in a directory and return the function to be
+# measured.
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register the decorated function as the benchmark with the given name.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def scaled(n, scale):
+    return max(1, int(n * scale))
+
+
+@benchmark('create_results_csv')
+def setup_create_results_csv(work_dir, scale):
+    table_path = os.path.join(work_dir, 'feature-table.tsv')
+    taxonomy_path = os.path.join(work_dir, 'taxonomy.tsv')
+    feature_ids = generators.make_feature_table_tsv(table_path, n_samples=scaled(1000, scale),
+                                                    n_features=scaled(2000, scale))
+    generators.make_taxonomy_tsv(taxonomy_path, feature_ids)
+    return lambda: utils.create_results_csv('SRR0000000', table_path, taxonomy_path, work_dir)
+
+
+@benchmark('get_file_paths')
+def setup_get_file_paths(work_dir, scale):
+    generators.make_fastq_tree(work_dir, n_studies=scaled(50, scale), n_samples=scaled(200, scale))
+    return lambda: utils.get_file_paths(work_dir, ext=const.SEQUENCING_EXT)
+
+
+@benchmark('generate_manifest_file')
+def setup_generate_manifest_file(work_dir, scale):
+    [study_dir] = generators.make_fastq_tree(work_dir, n_studies=1, n_samples=scaled(5000, scale))
+    study = Study(parent_dir=study_dir, user_id=None, is_public=True)
+    study.layout = Layout.PAIRED
+    return lambda: study.generate_manifest_file(study.map_samples_to_files())
+
+
+@benchmark('is_ready_for_processing')
+def setup_is_ready_for_processing(work_dir, scale):
+    study_dirs = generators.make_fastq_tree(work_dir, n_studies=scaled(500, scale), n_samples=scaled(50, scale))
+    return lambda: [Study.is_ready_for_processing(os.listdir(study_dir)) for study_dir in study_dirs]
+
+
+@benchmark('scan_index_cold_sweep')
+def setup_scan_index_cold_sweep(work_dir, scale):
+    generators.make_fastq_tree(work_dir, n_studies=scaled(500, scale), n_samples=scaled(50, scale))
+    return lambda: ScanIndex(work_dir).sweep()
+
+
+@benchmark('scan_index_warm_sweep')
+def setup_scan_index_warm_sweep(work_dir, scale):
+    generators.make_fastq_tree(work_dir, n_studies=scaled(500, scale), n_samples=scaled(50, scale))
+    # Age the directories so that they are outside of the racy window.
+    for entry in os.scandir(work_dir):
+        os.utime(entry.path, (1000, 1000))
+    index = ScanIndex(work_dir)
+    index.sweep()
+    return index.sweep
+
+
+@benchmark('profile_fastq')
+def setup_profile_fastq(work_dir, scale):
+    path = os.path.join(work_dir, 'sample_1.fastq')
+    generators.write_fastq(path, n_reads=scaled(200000, scale))
+    return lambda: fastq_profiler.profile_fastq(path)
+
+
+@benchmark('subsample_sample')
+def setup_subsample_sample(work_dir, scale):
+    paths = [os.path.join(work_dir, f'sample_{direction}.fastq') for direction in (1, 2)]
+    for path in paths:
+        generators.write_fastq(path, n_reads=scaled(100000, scale))
+    output_dir = os.path.join(work_dir, 'subsampled')
+    os.makedirs(output_dir)
+    return lambda: fastq_subsampler.subsample_sample(paths, scaled(10000, scale), seed=0, output_dir=output_dir)
+
+
+def measure(run, repeat):
+    """
+    Return the minimum and median run time in seconds over repeat runs and the peak memory in MiB allocated by a
+    separate run.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    # Tracing slows the run down, so memory is measured separately.
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'min_s': min(times), 'median_s': statistics.median(times), 'peak_mib': peak / 2 ** 20}
+
+
+def run_benchmarks(names, scale=1.0, repeat=5):
+    """
+    Run the given benchmarks and return a dictionary that maps their names to their results.
+    """
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as work_dir:
+            run = BENCHMARKS[name](work_dir, scale)
+            results[name] = {**measure(run, repeat), 'scale': scale}
+    return results
+
+
+def load_baselines(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baselines(path, results):
+    baselines = load_baselines(path)
+    baselines.update(results)
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+
+def compare(results, baselines, tolerance):
+    """
+    Return a list of (name, metric, baseline, result) tuples for the results that are worse than their baselines by
+    more than the tolerance. Results of a different scale are not compared.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None or baseline.get('scale') != result['scale']:
+            continue
+        for metric in ('min_s', 'peak_mib'):
+            if result[metric] > baseline[metric] * (1 + tolerance):
+                regressions.append((name, metric, baseline[metric], result[metric]))
+    return regressions
+
+
+def print_results(results, baselines):
+    print(f'{"benchmark":<28}{"min (s)":>12}{"median (s)":>12}{"peak (MiB)":>12}{"vs baseline":>14}')
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        change = ''
+        if baseline is not None and baseline.get('scale') == result['scale'] and baseline['min_s']:
+            change = f'{result["min_s"] / baseline["min_s"] - 1:+.1%}'
+        print(f'{name:<28}{result["min_s"]:>12.4f}{result["median_s"]:>12.4f}{result["peak_mib"]:>12.1f}'
+              f'{change:>14}')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run the microbenchmarks.')
+    parser.add_argument('--filter', default='', help='Run only the benchmarks whose name includes this string.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier of the size of the synthetic data.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs of each benchmark.')
+    parser.add_argument('--baselines', default=BASELINES_PATH, help='Path of the baselines file.')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the baselines.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Fraction by which a result may exceed its baseline before it is a regression.')
+    args = parser.parse_args(args)
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    results = run_benchmarks(names, scale=args.scale, repeat=args.repeat)
+    baselines = load_baselines(args.baselines)
+    print_results(results, baselines)
+
+    if args.save_baseline:
+        save_baselines(args.baselines, results)
+        print(f'Saved the baselines to {args.baselines}')
+        return 0
+
+    regressions = compare(results, baselines, args.tolerance)
+    for name, metric, baseline, result in regressions:
+        print(f'Regression in {name}: {metric} {baseline:.4f} -> {result:.4f}')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
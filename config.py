@@ -2,6 +2,10 @@ import os
 
 import yaml
 
+from static.executor_type import ExecutorType
+from static.queue_mode import QueueMode
+from static.watcher_type import WatcherType
+
 CLASSIFIER_FILE_NAME = 'classifier_file_name'
 ENV = 'env'
 CONDA_PATH = 'conda_path'
@@ -19,10 +23,50 @@ DB_NAME = 'db_name'
 DB_TABLE_METADATA = 'db_table_metadata'
 DB_TABLE_RESULTS = 'db_table_results'
 DB_TABLE_STATUS = 'db_table_status'
+N_WORKERS = 'n_workers'
+WATCHER = 'watcher'
+EXECUTOR = 'executor'
+CLASSIFIER_SOCKET = 'classifier_socket'
+TAXONOMY_CACHE_PATH = 'taxonomy_cache_path'
+TAXONOMY_CACHE_MAX_ENTRIES = 'taxonomy_cache_max_entries'
+MAX_PARALLEL_STEPS = 'max_parallel_steps'
+READ_QZA_DIRECTLY = 'read_qza_directly'
+DB_COPY_STREAMS = 'db_copy_streams'
+DB_POOL_SIZE = 'db_pool_size'
+QUEUE_MODE = 'queue_mode'
+DB_TABLE_JOBS = 'db_table_jobs'
+JOB_VISIBILITY_TIMEOUT = 'job_visibility_timeout'
+JOB_MAX_ATTEMPTS = 'job_max_attempts'
+CLAIM_LEASE = 'claim_lease'
+AUTO_TRUNCATION = 'auto_truncation'
+TRUNCATION_QUALITY = 'truncation_quality'
+AMPLICON_LENGTH = 'amplicon_length'
+COMPRESS_FASTQ = 'compress_fastq'
+MAX_READS_PER_SAMPLE = 'max_reads_per_sample'
+SUBSAMPLE_SEED = 'subsample_seed'
+DENOISE_SHARD_SIZE = 'denoise_shard_size'
+SHARD_RETRIES = 'shard_retries'
+METRICS_HOST = 'metrics_host'
+METRICS_PORT = 'metrics_port'
+NOTIFICATION_RATE = 'notification_rate'
+NOTIFICATION_MAX_ATTEMPTS = 'notification_max_attempts'
+NOTIFICATION_RETRY_DELAY = 'notification_retry_delay'
+NOTIFICATION_DIGEST_WINDOW = 'notification_digest_window'
+MERGE_FAN_IN = 'merge_fan_in'
+MERGE_CONCURRENCY = 'merge_concurrency'
+MERGE_RETRIES = 'merge_retries'
 LOGGING_LEVELS = {'CRITICAL': 50, 'ERROR': 40, 'WARNING': 30, 'INFO': 20, 'DEBUG': 10, 'NOTSET': 0}
 CONFIG_KEYS = {CLASSIFIER_FILE_NAME, ENV, CONDA_PATH, INPUT_PATH, PRIVATE_RESULTS_PATH, PUBLIC_RESULTS_PATH,
                AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, LOGGING_LEVEL, DB_HOST, DB_PORT, DB_USERNAME, DB_PASSWORD,
-               DB_NAME, DB_TABLE_METADATA, DB_TABLE_RESULTS, DB_TABLE_STATUS}
+               DB_NAME, DB_TABLE_METADATA, DB_TABLE_RESULTS, DB_TABLE_STATUS, N_WORKERS,
+               WATCHER, EXECUTOR, CLASSIFIER_SOCKET, TAXONOMY_CACHE_PATH, TAXONOMY_CACHE_MAX_ENTRIES,
+               MAX_PARALLEL_STEPS, READ_QZA_DIRECTLY, DB_COPY_STREAMS,
+               DB_POOL_SIZE, QUEUE_MODE, DB_TABLE_JOBS, JOB_VISIBILITY_TIMEOUT, JOB_MAX_ATTEMPTS,
+               CLAIM_LEASE, AUTO_TRUNCATION, TRUNCATION_QUALITY, AMPLICON_LENGTH,
+               COMPRESS_FASTQ, MAX_READS_PER_SAMPLE, SUBSAMPLE_SEED,
+               DENOISE_SHARD_SIZE, SHARD_RETRIES, METRICS_HOST, METRICS_PORT,
+               NOTIFICATION_RATE, NOTIFICATION_MAX_ATTEMPTS, NOTIFICATION_RETRY_DELAY, NOTIFICATION_DIGEST_WINDOW,
+               MERGE_FAN_IN, MERGE_CONCURRENCY, MERGE_RETRIES}
 
 
 class Config:
@@ -66,6 +110,88 @@ class Config:
         if level not in LOGGING_LEVELS:
             raise ValueError(f'Configuration file error! Invalid logging level: {level}')
 
+        # Validate the number of workers
+        n_workers = self.attributes.get(N_WORKERS, 1)
+        if not isinstance(n_workers, int) or n_workers < 1:
+            raise ValueError(f'Configuration file error! Invalid number of workers: {n_workers}')
+
+        # Validate the number of pipeline steps that run concurrently
+        max_parallel_steps = self.attributes.get(MAX_PARALLEL_STEPS, 2)
+        if not isinstance(max_parallel_steps, int) or max_parallel_steps < 1:
+            raise ValueError(f'Configuration file error! Invalid number of parallel steps: {max_parallel_steps}')
+
+        # Validate the watcher type
+        watcher = self.attributes.get(WATCHER, WatcherType.AUTO)
+        if watcher not in {watcher_type.value for watcher_type in WatcherType}:
+            raise ValueError(f'Configuration file error! Invalid watcher: {watcher}')
+
+        # Validate the executor type
+        executor = self.attributes.get(EXECUTOR, ExecutorType.CONDA)
+        if executor not in {executor_type.value for executor_type in ExecutorType}:
+            raise ValueError(f'Configuration file error! Invalid executor: {executor}')
+
+        # Validate the queue mode
+        queue_mode = self.attributes.get(QUEUE_MODE, QueueMode.FILESYSTEM)
+        if queue_mode not in {mode.value for mode in QueueMode}:
+            raise ValueError(f'Configuration file error! Invalid queue mode: {queue_mode}')
+
+        # Validate the job visibility timeout
+        visibility_timeout = self.attributes.get(JOB_VISIBILITY_TIMEOUT, 600)
+        if not isinstance(visibility_timeout, int) or visibility_timeout < 1:
+            raise ValueError(f'Configuration file error! Invalid job visibility timeout: {visibility_timeout}')
+
+        # Validate the claim lease
+        claim_lease = self.attributes.get(CLAIM_LEASE, 600)
+        if not isinstance(claim_lease, int) or claim_lease < 1:
+            raise ValueError(f'Configuration file error! Invalid claim lease: {claim_lease}')
+
+        # Validate the truncation quality
+        truncation_quality = self.attributes.get(TRUNCATION_QUALITY, 25)
+        if not isinstance(truncation_quality, int) or not 0 <= truncation_quality < 64:
+            raise ValueError(f'Configuration file error! Invalid truncation quality: {truncation_quality}')
+
+        # Validate the amplicon length
+        amplicon_length = self.attributes.get(AMPLICON_LENGTH, 292)
+        if amplicon_length is not None and (not isinstance(amplicon_length, int) or amplicon_length < 1):
+            raise ValueError(f'Configuration file error! Invalid amplicon length: {amplicon_length}')
+
+        # Validate the maximum number of reads per sample
+        max_reads_per_sample = self.attributes.get(MAX_READS_PER_SAMPLE, None)
+        if max_reads_per_sample is not None and (not isinstance(max_reads_per_sample, int) or max_reads_per_sample < 1):
+            raise ValueError(f'Configuration file error! Invalid maximum number of reads per sample: '
+                             f'{max_reads_per_sample}')
+
+        # Validate the number of samples per denoising shard
+        denoise_shard_size = self.attributes.get(DENOISE_SHARD_SIZE, None)
+        if denoise_shard_size is not None and (not isinstance(denoise_shard_size, int) or denoise_shard_size < 1):
+            raise ValueError(f'Configuration file error! Invalid denoise shard size: {denoise_shard_size}')
+
+        # Validate the port of the metrics endpoint
+        metrics_port = self.attributes.get(METRICS_PORT, None)
+        if metrics_port is not None and (not isinstance(metrics_port, int) or not 0 <= metrics_port < 65536):
+            raise ValueError(f'Configuration file error! Invalid metrics port: {metrics_port}')
+
+        # Validate the number of notifications per second
+        notification_rate = self.attributes.get(NOTIFICATION_RATE, 14)
+        if not isinstance(notification_rate, (int, float)) or notification_rate <= 0:
+            raise ValueError(f'Configuration file error! Invalid notification rate: {notification_rate}')
+
+        # Validate the number of attempts to send a notification
+        notification_max_attempts = self.attributes.get(NOTIFICATION_MAX_ATTEMPTS, 5)
+        if not isinstance(notification_max_attempts, int) or notification_max_attempts < 1:
+            raise ValueError(f'Configuration file error! Invalid number of notification attempts: '
+                             f'{notification_max_attempts}')
+
+        # Validate the number of results merged by one batch
+        merge_fan_in = self.attributes.get(MERGE_FAN_IN, 50)
+        if not isinstance(merge_fan_in, int) or merge_fan_in < 2:
+            raise ValueError(f'Configuration file error! Invalid merge fan-in: {merge_fan_in}')
+
+        # Validate the number of batches merged at the same time
+        merge_concurrency = self.attributes.get(MERGE_CONCURRENCY, 1)
+        if not isinstance(merge_concurrency, int) or merge_concurrency < 1:
+            raise ValueError(f'Configuration file error! Invalid merge concurrency: {merge_concurrency}')
+
     @property
     def classifier_path(self):
         if CLASSIFIER_FILE_NAME not in self.attributes:
@@ -139,6 +265,134 @@ class Config:
     def db_table_status(self):
         return self.attributes.get(DB_TABLE_STATUS, None)
 
+    @property
+    def n_workers(self):
+        return self.attributes.get(N_WORKERS, 1)
+
+    @property
+    def watcher(self):
+        return WatcherType(self.attributes.get(WATCHER, WatcherType.AUTO))
+
+    @property
+    def executor(self):
+        return ExecutorType(self.attributes.get(EXECUTOR, ExecutorType.CONDA))
+
+    @property
+    def classifier_socket(self):
+        return self.attributes.get(CLASSIFIER_SOCKET, None)
+
+    @property
+    def taxonomy_cache_path(self):
+        return self.attributes.get(TAXONOMY_CACHE_PATH, None)
+
+    @property
+    def taxonomy_cache_max_entries(self):
+        return self.attributes.get(TAXONOMY_CACHE_MAX_ENTRIES, 1000000)
+
+    @property
+    def max_parallel_steps(self):
+        return self.attributes.get(MAX_PARALLEL_STEPS, 2)
+
+    @property
+    def read_qza_directly(self):
+        return self.attributes.get(READ_QZA_DIRECTLY, True)
+
+    @property
+    def db_copy_streams(self):
+        return self.attributes.get(DB_COPY_STREAMS, 1)
+
+    @property
+    def db_pool_size(self):
+        return self.attributes.get(DB_POOL_SIZE, 4)
+
+    @property
+    def queue_mode(self):
+        return QueueMode(self.attributes.get(QUEUE_MODE, QueueMode.FILESYSTEM))
+
+    @property
+    def db_table_jobs(self):
+        return self.attributes.get(DB_TABLE_JOBS, 'jobs')
+
+    @property
+    def job_visibility_timeout(self):
+        return self.attributes.get(JOB_VISIBILITY_TIMEOUT, 600)
+
+    @property
+    def job_max_attempts(self):
+        return self.attributes.get(JOB_MAX_ATTEMPTS, 3)
+
+    @property
+    def claim_lease(self):
+        return self.attributes.get(CLAIM_LEASE, 600)
+
+    @property
+    def auto_truncation(self):
+        return self.attributes.get(AUTO_TRUNCATION, True)
+
+    @property
+    def truncation_quality(self):
+        return self.attributes.get(TRUNCATION_QUALITY, 25)
+
+    @property
+    def amplicon_length(self):
+        return self.attributes.get(AMPLICON_LENGTH, 292)
+
+    @property
+    def compress_fastq(self):
+        return self.attributes.get(COMPRESS_FASTQ, True)
+
+    @property
+    def max_reads_per_sample(self):
+        return self.attributes.get(MAX_READS_PER_SAMPLE, None)
+
+    @property
+    def subsample_seed(self):
+        return self.attributes.get(SUBSAMPLE_SEED, 0)
+
+    @property
+    def denoise_shard_size(self):
+        return self.attributes.get(DENOISE_SHARD_SIZE, None)
+
+    @property
+    def shard_retries(self):
+        return self.attributes.get(SHARD_RETRIES, 1)
+
+    @property
+    def metrics_host(self):
+        return self.attributes.get(METRICS_HOST, '127.0.0.1')
+
+    @property
+    def metrics_port(self):
+        return self.attributes.get(METRICS_PORT, None)
+
+    @property
+    def notification_rate(self):
+        return self.attributes.get(NOTIFICATION_RATE, 14)
+
+    @property
+    def notification_max_attempts(self):
+        return self.attributes.get(NOTIFICATION_MAX_ATTEMPTS, 5)
+
+    @property
+    def notification_retry_delay(self):
+        return self.attributes.get(NOTIFICATION_RETRY_DELAY, 2)
+
+    @property
+    def notification_digest_window(self):
+        return self.attributes.get(NOTIFICATION_DIGEST_WINDOW, 0)
+
+    @property
+    def merge_fan_in(self):
+        return self.attributes.get(MERGE_FAN_IN, 50)
+
+    @property
+    def merge_concurrency(self):
+        return self.attributes.get(MERGE_CONCURRENCY, 1)
+
+    @property
+    def merge_retries(self):
+        return self.attributes.get(MERGE_RETRIES, 1)
+
 
 # Singleton
 app_config = Config()
\ No newline at end of file
@@ -0,0 +1,162 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+from .poll_watcher import PollWatcher
+from .watcher_error import WatcherError
+from static import constants as const
+
+# Flags for inotify_init1.
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# Event masks, see inotify(7).
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+
+# Header of an inotify event: watch descriptor, mask, cookie, and length of the name.
+EVENT_HEADER = struct.Struct('iIII')
+
+# Files whose creation or removal can change the readiness of a study.
+MARKERS = {const.COMPLETE_MARKER, const.CLAIMED_MARKER, const.ERROR_MARKER}
+
+# Number of seconds between two full scans of the input directory. Catches events that are lost, e.g. when a study is
+# moved in before its directory is watched.
+RESCAN_INTERVAL = 600
+
+
+class InotifyWatcher(PollWatcher):
+    """
+    Watcher that reacts to the creation of complete markers using Linux inotify. Only the directories that received
+    an event are reported after the initial scan.
+    """
+
+    def __init__(self, directory, rescan_interval=RESCAN_INTERVAL):
+        super().__init__(directory, interval=rescan_interval)
+        self.libc = load_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise WatcherError(msg=f'Unable to initialize inotify: {os.strerror(ctypes.get_errno())}')
+
+        self.watches = {}           # Maps watch descriptors to directories.
+        self.pending = set()        # Directories that received an event since the last call to find_studies.
+        self.rescan_at = 0          # Time at which the next full scan is due. The first call scans everything.
+
+        self.add_watches(directory)
+
+    def add_watches(self, directory):
+        """
+        Watch the given directory and its subdirectories. Raise a WatcherError if a watch cannot be added.
+        """
+        for root, sub_dirs, file_names in os.walk(directory):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise WatcherError(msg=f'Unable to watch {root}: {os.strerror(error)}')
+            self.watches[wd] = root
+
+    def find_studies(self):
+        if time.monotonic() >= self.rescan_at:
+            self.pending.clear()
+            self.rescan_at = time.monotonic() + self.interval
+            yield from super().find_studies()
+            return
+
+        # Claims whose lease expired don't generate events.
+        pending, self.pending = self.pending | set(self.scan_index.refresh_expired()), set()
+        for directory in sorted(pending):
+            yield directory
+
+    def wait(self, stop_event):
+        while not self.pending and not stop_event.is_set() and time.monotonic() < self.rescan_at and \
+                not self.has_expired_claims():
+            readable, _, _ = select.select([self.fd], [], [], 1)
+            if readable:
+                self.read_events()
+
+    def has_expired_claims(self):
+        """
+        Return true if the lease of a claimed study expired.
+        """
+        next_expiry = self.scan_index.get_next_expiry()
+        return next_expiry is not None and next_expiry <= time.time()
+
+    def read_events(self):
+        """
+        Read the queued inotify events and record the directories that may include a study that became ready.
+        """
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            self.handle_event(wd, mask, os.fsdecode(name))
+
+    def handle_event(self, wd, mask, name):
+        """
+        Update the watches and pending directories based on a single inotify event.
+        """
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped. Fall back to a full scan.
+            self.rescan_at = 0
+            return
+
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+
+        directory = self.watches.get(wd)
+        if directory is None:
+            return
+
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            # A new directory may already include a complete study, e.g. when it is moved in.
+            new_dir = os.path.join(directory, name)
+            try:
+                self.add_watches(new_dir)
+            except WatcherError:
+                self.rescan_at = 0
+            for root, sub_dirs, file_names in os.walk(new_dir):
+                self.pending.add(root)
+        elif name in MARKERS:
+            self.pending.add(directory)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def load_libc():
+    """
+    Return the C library with the inotify functions. Raise a WatcherError if inotify is unavailable.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        raise WatcherError(msg='inotify is not available on this platform.')
+
+    return libc
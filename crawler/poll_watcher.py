@@ -0,0 +1,24 @@
+from .scan_index import ScanIndex
+from .watcher import Watcher
+from static.study_state import StudyState
+
+
+class PollWatcher(Watcher):
+    """
+    Watcher that periodically sweeps the top level of the input directory. Only the study directories that changed
+    since the previous sweep are listed.
+    """
+
+    def __init__(self, directory, interval=3):
+        super().__init__(directory)
+        self.interval = interval                # Number of seconds to wait between two scans of the input directory.
+        self.scan_index = ScanIndex(directory)  # Cached states of the study directories.
+
+    def find_studies(self):
+        yield from self.scan_index.sweep()
+
+    def count_ready(self):
+        return self.scan_index.count(StudyState.READY)
+
+    def wait(self, stop_event):
+        stop_event.wait(self.interval)
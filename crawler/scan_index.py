@@ -0,0 +1,131 @@
+import os
+import time
+from collections import namedtuple
+
+from static import constants as const
+from static.study_state import StudyState
+from study.claim import read_claim
+from study.study import Study
+
+# Cached state of a study directory. mtime_ns is the modification time of the directory when its files were listed.
+# expires_at is the time at which the lease of a claimed study expires.
+IndexEntry = namedtuple('IndexEntry', ['mtime_ns', 'state', 'expires_at'], defaults=[None])
+
+# Directories modified within this many nanoseconds of a sweep are listed again on the next sweep since a change in the
+# same timestamp tick would not update their modification time.
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+
+class ScanIndex:
+    """
+    Incremental index of the study directories in the input directory. A directory's modification time changes whenever
+    a file is created, deleted or renamed in it, so only the directories whose modification time changed since the
+    previous sweep are listed again. Claimed studies are also inspected again once their lease expires, and are reported
+    as ready so that they can be reclaimed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory  # Input directory that includes the study directories.
+        self.entries = {}           # Maps study directory paths to index entries.
+
+    def sweep(self):
+        """
+        Update the index from the top level of the input directory and return the paths of the ready studies.
+        """
+        now_ns = time.time_ns()
+        now = now_ns / 10 ** 9
+        ready = []
+        seen = set()
+
+        with os.scandir(self.directory) as dir_entries:
+            for dir_entry in dir_entries:
+                try:
+                    if not dir_entry.is_dir():
+                        continue
+                    mtime_ns = dir_entry.stat().st_mtime_ns
+                except FileNotFoundError:
+                    continue
+
+                path = dir_entry.path
+                seen.add(path)
+
+                entry = self.entries.get(path)
+                if entry is None or entry.mtime_ns != mtime_ns or now_ns - mtime_ns < RACY_WINDOW_NS or \
+                        is_expired(entry, now):
+                    entry = self.inspect(path, mtime_ns)
+                    if entry is None:
+                        continue
+
+                if entry.state == StudyState.READY:
+                    ready.append(path)
+
+        # Forget the directories that were removed.
+        for path in self.entries.keys() - seen:
+            del self.entries[path]
+
+        ready.sort()
+        return ready
+
+    def inspect(self, path, mtime_ns):
+        """
+        List the files in the given study directory and cache its state. Return None if the directory was removed.
+        """
+        try:
+            file_names = os.listdir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            self.entries.pop(path, None)
+            return None
+
+        state = Study.get_state(file_names)
+        expires_at = None
+        if state == StudyState.CLAIMED:
+            record = read_claim(os.path.join(path, const.CLAIMED_MARKER))
+            if record is None or record['expires_at'] <= time.time():
+                state = StudyState.READY
+            else:
+                expires_at = record['expires_at']
+
+        entry = IndexEntry(mtime_ns=mtime_ns, state=state, expires_at=expires_at)
+        self.entries[path] = entry
+        return entry
+
+    def refresh_expired(self):
+        """
+        Inspect the claimed study directories whose lease expired again. Return the paths of the ones that are ready.
+        """
+        now = time.time()
+        ready = []
+
+        for path, entry in list(self.entries.items()):
+            if not is_expired(entry, now):
+                continue
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self.entries.pop(path, None)
+                continue
+            entry = self.inspect(path, mtime_ns)
+            if entry is not None and entry.state == StudyState.READY:
+                ready.append(path)
+
+        ready.sort()
+        return ready
+
+    def get_next_expiry(self):
+        """
+        Return the time at which the next lease of a claimed study expires, or None if no study is claimed.
+        """
+        return min((entry.expires_at for entry in self.entries.values() if entry.expires_at is not None), default=None)
+
+    def count(self, state):
+        """
+        Return the number of indexed study directories in the given state.
+        """
+        return sum(1 for entry in self.entries.values() if entry.state == state)
+
+
+def is_expired(entry, now):
+    """
+    Return true if the given entry is a claimed study whose lease expired.
+    """
+    return entry.expires_at is not None and entry.expires_at <= now
@@ -0,0 +1,34 @@
+from abc import ABC, abstractmethod
+
+
+class Watcher(ABC):
+    """
+    Abstract class for a watcher that finds studies in the input directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory  # Input directory that includes the studies.
+
+    @abstractmethod
+    def find_studies(self):
+        """
+        Return the directories that may include a study that is ready to be processed. Callers should verify the
+        readiness of each directory before claiming it.
+        """
+
+    @abstractmethod
+    def wait(self, stop_event):
+        """
+        Block until new studies may be available or the stop event is set.
+        """
+
+    def count_ready(self):
+        """
+        Return the number of studies that were ready to be processed when they were last seen, or None if unknown.
+        """
+        return None
+
+    def close(self):
+        """
+        Release the resources held by the watcher.
+        """
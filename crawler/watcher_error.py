@@ -0,0 +1,10 @@
+class WatcherError(Exception):
+    """
+    Exception to indicate that a watcher cannot monitor the input directory.
+    """
+
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return f'{self.msg}'
@@ -0,0 +1,67 @@
+import logging
+import os
+
+from .inotify_watcher import InotifyWatcher
+from .poll_watcher import PollWatcher
+from .watcher_error import WatcherError
+from static.watcher_type import WatcherType
+
+# File systems that do not deliver inotify events for changes made by other hosts.
+REMOTE_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'ceph', 'lustre', 'gpfs', 'glusterfs', 'fuse',
+                      'fuse.sshfs', 'fuse.s3fs', 'fuse.glusterfs', 'fuse.ceph-fuse'}
+
+
+class WatcherFactory:
+    """
+    Factory class to generate watchers.
+    """
+
+    @classmethod
+    def generate_watcher(cls, directory, watcher_type, logger_name):
+        """
+        Return a watcher for the given directory. An inotify watcher is used if it is requested or, in auto mode, if the
+        directory is on a local file system. Fall back to polling if inotify cannot be used.
+        """
+        logger = logging.getLogger(logger_name)
+
+        if watcher_type == WatcherType.POLL:
+            return PollWatcher(directory)
+
+        if watcher_type == WatcherType.AUTO:
+            fs_type = get_filesystem_type(directory)
+            if fs_type in REMOTE_FILESYSTEMS:
+                logger.info(f'{directory} is on a {fs_type} file system. Polling for studies.')
+                return PollWatcher(directory)
+
+        try:
+            watcher = InotifyWatcher(directory)
+        except WatcherError as e:
+            logger.warning(f'{e} Polling for studies.')
+            return PollWatcher(directory)
+
+        logger.info(f'Watching {directory} with inotify.')
+        return watcher
+
+
+def get_filesystem_type(directory, mounts_path='/proc/mounts'):
+    """
+    Return the type of the file system that includes the given directory. Return None if it cannot be identified.
+    """
+    path = os.path.realpath(directory)
+    fs_type = None
+    mount_point_len = -1
+
+    try:
+        with open(mounts_path, 'r') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                if os.path.commonpath([path, mount_point]) == mount_point and len(mount_point) > mount_point_len:
+                    fs_type = fields[2]
+                    mount_point_len = len(mount_point)
+    except OSError:
+        return None
+
+    return fs_type
@@ -1,24 +1,76 @@
 #!/usr/bin/env python
 
+import multiprocessing
 import os
+import signal
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 
-import boto3
-from botocore.exceptions import ClientError
-
+import metrics
 import utils
 from config import app_config
+from crawler.watcher_factory import WatcherFactory
 from database_manager.db_error import DBError
 from database_manager.db_manager import db_manager
+from database_manager.job_queue import JobQueue
+from notification.dispatcher import NotificationDispatcher, Notifier
+from notification.transports import SesTransport
 from pipeline.pipeline_error import PipelineError
 from pipeline.pipeline_factory import PipelineFactory
 from static import constants as const
+from static.job_state import JobState
+from static.queue_mode import QueueMode
 from static.status import Status
+from static.study_state import StudyState
+from study.claim import Claim
 from study.study import InvalidStudyError
 from study.study import Study
 
 LOGGER_NAME = 'data_engineering'
 
+# Data Engineering instance of a worker process.
+_worker = None
+
+
+def init_worker(config_file_name, metrics_queue=None, notification_queue=None):
+    """
+    Initialize a worker process of the pool. Workers ignore termination signals so that the studies in progress can be
+    completed while the main process drains the pool. Workers send their metrics to the main process if it serves them,
+    and their notifications to the dispatcher of the main process.
+    """
+    global _worker
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    utils.set_logging_context(worker=f'worker-{os.getpid()}')
+    if metrics_queue is not None:
+        metrics.forward_to(metrics_queue)
+
+    _worker = DataEngineering()
+    _worker.setup(config_file_name)
+    if notification_queue is not None:
+        _worker.notifier = Notifier(notification_queue)
+
+
+def is_ready(directory):
+    """
+    Return true if the study in the given directory is ready to be processed.
+    """
+    try:
+        return Study.get_state(os.listdir(directory)) == StudyState.READY
+    except FileNotFoundError:
+        return False
+
+
+def process_study_in_worker(directory, claim=None):
+    """
+    Process the study in the given directory in a worker process. Return true if the study was processed successfully.
+    """
+    return _worker.process_study(directory, claim)
+
 
 class DataEngineering:
     """
@@ -26,11 +78,23 @@ class DataEngineering:
     """
     def __init__(self):
         self.logger = None
+        self.config_file_name = None         # Name of the configuration file.
+        self.executor = None                 # Process pool for the studies. None if studies are processed inline.
+        self.in_flight = set()               # Futures of the studies that are being processed by the workers.
+        self.stop_event = threading.Event()  # Set when a shutdown is requested.
+        self.watcher = None                  # Finds the studies in the input directory.
+        self.job_queue = None                # Jobs table of the database queue mode. None in the filesystem mode.
+        self.enqueued = set()                # Directories of the ready studies that were added to the jobs table.
+        self.metrics_server = None           # Serves the metrics over HTTP. None if the endpoint is disabled.
+        self.metrics_queue = None            # Queue to which the workers send their metrics.
+        self.notifier = None                 # Sends the notification emails without blocking.
 
     def setup(self, config_file_name):
         """
         Set up the configuration, logger, and db manager.
         """
+        self.config_file_name = config_file_name
+
         try:
             app_config.setup(config_file_name)
         except FileExistsError as e:
@@ -55,27 +119,339 @@ class DataEngineering:
             raise ValueError(f'{directory} is not a valid directory.')
 
         print(f'Monitoring {directory}')
-        while True:
-            for root, sub_dirs, file_names in os.walk(directory):
-                if Study.is_ready_for_processing(file_names):
-                    # Claim the study
-                    try:
-                        utils.create_txt(file_path=os.path.join(root, const.CLAIMED_MARKER))
-                    except ValueError:
-                        continue
+        self.handle_shutdown_signals()
+
+        if app_config.metrics_port is not None:
+            self.start_metrics_server()
+
+        if self.notifier is None:
+            self.notifier = self.create_dispatcher()
+
+        if app_config.n_workers > 1:
+            self.executor = self.create_executor()
+            self.logger.info(f'Processing studies with {app_config.n_workers} workers.')
+
+        self.watcher = WatcherFactory.generate_watcher(directory, app_config.watcher, LOGGER_NAME)
+
+        if app_config.queue_mode is QueueMode.DATABASE:
+            self.job_queue = self.create_job_queue()
+
+        try:
+            while not self.stop_event.is_set():
+                if self.job_queue is None:
+                    self.claim_from_directory()
+                else:
+                    self.claim_from_queue()
+                self.update_gauges()
+                self.watcher.wait(self.stop_event)
+        finally:
+            self.watcher.close()
+            self.drain()
+            if self.job_queue is not None:
+                self.job_queue.close()
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+                self.metrics_server = None
+            self.notifier.close()
+
+    def claim_from_directory(self):
+        """
+        Claim the ready studies by creating a claimed marker in their directories and process them. Studies whose claim
+        expired are reclaimed. A study that was claimed more than job_max_attempts times, e.g. because processing it
+        crashes its worker, is marked as failed instead.
+        """
+        for root in self.watcher.find_studies():
+            # Wait until a worker is available. The study may be claimed by another process in the meantime.
+            if not self.wait_for_worker():
+                break
+            try:
+                if Study.get_state(os.listdir(root)) not in (StudyState.READY, StudyState.CLAIMED):
+                    continue
+            except FileNotFoundError:
+                continue
+
+            # Claim the study
+            claim = Claim(directory=root, lease=app_config.claim_lease)
+            try:
+                if not claim.acquire():
+                    continue
+            except OSError:
+                continue
+
+            if claim.reclaimed:
+                self.logger.warning(f'{os.path.basename(root)} | Reclaimed the study after its claim expired.')
+
+            if claim.attempts > app_config.job_max_attempts:
+                self.abandon(root, claim)
+                continue
+
+            # Process the study
+            self.dispatch(root, claim)
+
+    def abandon(self, directory, claim):
+        """
+        Mark the study in the given directory as failed after its claim expired too many times.
+        """
+        error_msg = (f'The study was claimed {claim.attempts} times without finishing. Processing it may crash the '
+                     f'worker.')
+        try:
+            self.error_out(study_id=os.path.basename(directory), error_msg=error_msg, directory=directory)
+        except DBError as e:
+            self.logger.error(f'{os.path.basename(directory)} | Unable to update the status: {e}')
+        claim.release()
+
+    def claim_from_queue(self):
+        """
+        Add the ready studies to the jobs table, then claim jobs from it while a worker is available and process them.
+        Directories that are not ready, e.g. studies that are still being downloaded, are left out until the watcher
+        reports them again.
+        """
+        try:
+            ready = {root for root in self.watcher.find_studies() if is_ready(root)}
+            self.job_queue.enqueue([(os.path.basename(root), root) for root in sorted(ready - self.enqueued)])
+            self.enqueued = ready
+
+            for run_id, state in self.job_queue.requeue_expired():
+                self.logger.warning(f'{run_id} | Claim expired. The job is {state}.')
+
+            while self.wait_for_worker():
+                jobs = self.job_queue.claim(limit=1)
+                if not jobs:
+                    break
+                run_id, directory = jobs[0]
+                self.logger.debug(f'{run_id} | Claimed the job.')
+                self.dispatch(directory)
+        except DBError as e:
+            self.logger.error(f'Job queue error: {e}')
+
+    def create_job_queue(self):
+        """
+        Return the jobs table of the database queue mode. Create the table if it doesn't exist.
+        """
+        job_queue = JobQueue(db_manager=db_manager,
+                             table=app_config.db_table_jobs,
+                             visibility_timeout=app_config.job_visibility_timeout,
+                             max_attempts=app_config.job_max_attempts)
+        try:
+            job_queue.create_table()
+        except DBError as e:
+            raise ValueError(e)
+        job_queue.start_heartbeat()
+        self.logger.info(f'Claiming studies from the {app_config.db_table_jobs} table as {job_queue.owner}.')
+
+        return job_queue
+
+    def start_metrics_server(self):
+        """
+        Serve the metrics at the configured address. The workers send their metrics over a queue.
+        """
+        if app_config.n_workers > 1:
+            self.metrics_queue = multiprocessing.Queue()
+        self.metrics_server = metrics.MetricsServer(host=app_config.metrics_host, port=app_config.metrics_port,
+                                                    q=self.metrics_queue)
+        self.metrics_server.start()
+        self.logger.info(f'Serving metrics at http://{app_config.metrics_host}:{self.metrics_server.port}/metrics.')
+
+    def update_gauges(self):
+        """
+        Update the gauges of the studies that are ready to be processed and in progress.
+        """
+        if self.metrics_server is None:
+            return
+
+        metrics.STUDIES_IN_FLIGHT.set(len(self.in_flight))
+
+        if self.job_queue is None:
+            ready = self.watcher.count_ready()
+        else:
+            try:
+                ready = self.job_queue.get_depth()[JobState.QUEUED]
+            except DBError:
+                ready = None
+        if ready is not None:
+            metrics.STUDIES_READY.set(ready)
+
+    def create_dispatcher(self):
+        """
+        Return a running notification dispatcher. The workers hand their notifications to it over a queue.
+        """
+        dispatcher = NotificationDispatcher(transport=SesTransport(),
+                                            q=multiprocessing.Queue() if app_config.n_workers > 1 else None,
+                                            max_rate=app_config.notification_rate,
+                                            max_attempts=app_config.notification_max_attempts,
+                                            retry_delay=app_config.notification_retry_delay,
+                                            digest_window=app_config.notification_digest_window,
+                                            logger_name=LOGGER_NAME)
+        dispatcher.start()
+        return dispatcher
+
+    def create_executor(self):
+        """
+        Return a process pool whose workers process studies.
+        """
+        return ProcessPoolExecutor(max_workers=app_config.n_workers,
+                                   initializer=init_worker,
+                                   initargs=(self.config_file_name, self.metrics_queue, self.notifier.queue))
+
+    def dispatch(self, directory, claim=None):
+        """
+        Process the claimed study in the given directory. Hand it to a worker if a process pool is used.
+        """
+        metrics.STUDIES_CLAIMED.inc()
+        start_time = time.monotonic()
+
+        if self.executor is None:
+            try:
+                succeeded = self.process_study(directory, claim)
+            except Exception:
+                self.record_finished(succeeded=False, start_time=start_time)
+                self.finish_job(directory, succeeded=False, crashed=True)
+                raise
+            self.record_finished(succeeded=succeeded, start_time=start_time)
+            if succeeded is not None:
+                self.finish_job(directory, succeeded=succeeded)
+            return
+
+        try:
+            future = self.executor.submit(process_study_in_worker, directory, claim)
+        except BrokenProcessPool:
+            self.logger.error('The process pool is broken. Creating a new one.')
+            self.executor = self.create_executor()
+            future = self.executor.submit(process_study_in_worker, directory, claim)
+
+        future.directory = directory
+        future.start_time = start_time
+        self.in_flight.add(future)
+
+    def wait_for_worker(self):
+        """
+        Block until a worker is available to process a study. Return false if a shutdown is requested while waiting.
+        """
+        if self.executor is None:
+            return not self.stop_event.is_set()
+
+        self.collect_finished()
+        while len(self.in_flight) >= app_config.n_workers:
+            if self.stop_event.is_set():
+                return False
+            self.collect_finished(timeout=1)
+
+        return not self.stop_event.is_set()
+
+    def collect_finished(self, timeout=0):
+        """
+        Remove finished studies from the in-flight set and log the errors raised by the workers.
+        """
+        if not self.in_flight:
+            return
+
+        done, self.in_flight = wait(self.in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                study_id = os.path.basename(future.directory)
+                self.logger.error(f'{study_id} | Worker failed: {error!r}')
+            succeeded = False if error is not None else future.result()
+            self.record_finished(succeeded=succeeded, start_time=future.start_time)
+            if succeeded is not None:
+                self.finish_job(future.directory, succeeded=succeeded, crashed=error is not None)
+
+    def record_finished(self, succeeded, start_time):
+        """
+        Count a finished study and record its duration. succeeded is None if the study was skipped.
+        """
+        if succeeded is None:
+            metrics.STUDIES_SKIPPED.inc()
+            return
+
+        metrics.STUDY_DURATION.observe(time.monotonic() - start_time)
+        if succeeded:
+            metrics.STUDIES_SUCCEEDED.inc()
+        else:
+            metrics.STUDIES_ERRORED.inc()
+
+    def finish_job(self, directory, succeeded, crashed=False):
+        """
+        Update the job of the study in the given directory in the database queue mode. The jobs of crashed workers are
+        put back in the queue.
+        """
+        if self.job_queue is None:
+            return
+
+        run_id = os.path.basename(directory)
+        try:
+            if succeeded:
+                self.job_queue.complete(run_id)
+            elif crashed:
+                self.job_queue.release(run_id)
+            else:
+                self.job_queue.fail(run_id, error=f'See {const.ERROR_MARKER} in {directory}')
+        except DBError as e:
+            self.logger.error(f'{run_id} | Job queue error: {e}')
+
+    def drain(self):
+        """
+        Wait for the studies in progress to complete and shut down the process pool.
+        """
+        if self.executor is None:
+            return
 
-                    # Process the study
-                    self.process_study(root)
-            time.sleep(3)
+        if self.in_flight:
+            self.logger.info(f'Waiting for {len(self.in_flight)} studies in progress.')
+        self.executor.shutdown(wait=True)
+        self.collect_finished()
+        self.executor = None
 
-    def process_study(self, directory):
+    def handle_shutdown_signals(self):
         """
-        Create a study from the user provided directory. Then create a Qiime2 pipeline and execute it.
+        Stop claiming new studies on SIGINT or SIGTERM. A second signal terminates the process immediately.
         """
-        # Check if the claimed marker belongs to this process
-        if not utils.is_file_owned_by_me(file_path=os.path.join(directory, const.CLAIMED_MARKER)):
+        if threading.current_thread() is not threading.main_thread():
             return
 
+        def request_shutdown(signum, frame):
+            print('Shutdown requested. Finishing the studies in progress.')
+            self.stop_event.set()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        signal.signal(signal.SIGINT, request_shutdown)
+        signal.signal(signal.SIGTERM, request_shutdown)
+
+    def process_study(self, directory, claim=None):
+        """
+        Process the study in the given directory while renewing its claim. Return true if the study was processed
+        successfully, false if it failed, or None if it was skipped because its claim is no longer held. Studies are
+        claimed in the jobs table in the database queue mode.
+        """
+        if app_config.queue_mode is QueueMode.FILESYSTEM and (claim is None or not claim.is_held()):
+            return None
+
+        if claim is None:
+            return bool(self.process_claimed_study(directory))
+
+        claim.start_heartbeat(on_lost=self.on_claim_lost)
+        try:
+            succeeded = bool(self.process_claimed_study(directory))
+        except Exception:
+            # Let the lease expire so that the study is retried later.
+            claim.stop_heartbeat()
+            raise
+        claim.release()
+
+        return succeeded
+
+    def on_claim_lost(self, claim):
+        """
+        Log that another process took over the claim of a study that is being processed.
+        """
+        self.logger.warning(f'{os.path.basename(claim.directory)} | Lost the claim of the study to another process.')
+
+    def process_claimed_study(self, directory):
+        """
+        Create a study from the user provided directory. Then create a Qiime2 pipeline and execute it. Return true if
+        the study was processed successfully.
+        """
         start_time = time.time()
 
         study_id = os.path.basename(directory)
@@ -83,14 +459,16 @@ class DataEngineering:
         # Update the status and retrieve attributes using the run ID.
         try:
             db_manager.update_status(run_id=study_id, status=Status.PROCESSING)
-            user_id = db_manager.get_user_id(run_id=study_id)
-            email = db_manager.get_email(run_id=study_id)
-            email_notification = db_manager.get_email_notification_preference(run_id=study_id)
-            is_public = db_manager.is_run_public(run_id=study_id)
+            run_info = db_manager.get_run_info(run_id=study_id) or {}
         except DBError as e:
             self.error_out(study_id=study_id, error_msg=str(e), directory=directory)
             return
 
+        user_id = run_info.get('user_id')
+        email = run_info.get('email')
+        email_notification = run_info.get('email_notification')
+        is_public = run_info.get('public')
+
         self.logger.debug(f'Processing {study_id}')
         study = Study(parent_dir=directory, user_id=user_id, is_public=is_public)
         try:
@@ -113,21 +491,15 @@ class DataEngineering:
             self.error_out(study_id=study_id, error_msg=str(e), directory=directory)
             return
 
-        self.logger.debug(f'{study.id} | Creating the results csv file.')
-        try:
-            results_csv_path = utils.create_results_csv(study_id=study_id,
-                                                        feature_table_path=pipeline.get_feature_table_path(),
-                                                        taxonomy_results_path=pipeline.get_taxonomy_results_path(),
-                                                        output_dir=pipeline.get_output_dir())
-        except ValueError as e:
-            self.error_out(study_id=study_id, error_msg=str(e), directory=directory)
-            return
-
-        # Post the results
+        # Post the results while they are being built.
+        self.logger.debug(f'{study.id} | Sending results to the database.')
         try:
-            db_manager.post_results(csv_path=results_csv_path)
+            results = utils.iter_results_csv(study_id=study_id,
+                                             feature_table_path=pipeline.get_feature_table_path(),
+                                             taxonomy_results_path=pipeline.get_taxonomy_results_path())
+            db_manager.post_results_stream(study_id=study_id, chunks=results, n_streams=app_config.db_copy_streams)
             self.logger.info(f'{study.id} | Sent results to the database successfully.')
-        except DBError as e:
+        except (ValueError, DBError) as e:
             self.error_out(study_id=study_id, error_msg=str(e), directory=directory)
             return
 
@@ -144,7 +516,9 @@ class DataEngineering:
 
         # Inform the client
         if email and email_notification:
-            self.send_email(recipient=email, run_id=study_id)
+            self.notify(recipient=email, run_id=study_id)
+
+        return True
 
     def error_out(self, study_id, error_msg, directory):
         """
@@ -164,62 +538,11 @@ class DataEngineering:
             # Leave the folder as is if another process is using it.
             pass
 
-    def send_email(self, recipient, run_id):
-        """
-        Send an email to the client indicating the given run ID has been processed.
-        """
-        sender = "Microbiome Platform <microbiome.platform@gmail.com>"
-        aws_region = "us-west-2"
-        subject = "Process Completed"
-
-        # Email body for non-HTML email clients.
-        body_text = f'{run_id} has been processed successfully.'
-
-        # The HTML body of the email.
-        body_html = f"""<html>
-        <head></head>
-        <body>
-          <p>{run_id} has been processed successfully.</p>
-        </body>
-        </html>
-                    """
-
-        charset = "UTF-8"
-
-        client = boto3.client('ses', region_name=aws_region)
-
-        # Try to send the email.
-        try:
-            # Provide the contents of the email.
-            response = client.send_email(
-                Destination={
-                    'ToAddresses': [
-                        recipient,
-                    ],
-                },
-                Message={
-                    'Body': {
-                        'Html': {
-                            'Charset': charset,
-                            'Data': body_html,
-                        },
-                        'Text': {
-                            'Charset': charset,
-                            'Data': body_text,
-                        },
-                    },
-                    'Subject': {
-                        'Charset': charset,
-                        'Data': subject,
-                    },
-                },
-                Source=sender,
-            )
-        # Display an error if something goes wrong.
-        except ClientError as e:
-            self.logger.debug(f"{run_id} | {e.response['Error']['Message']}")
-            print(e.response['Error']['Message'])
-        else:
-            self.logger.debug(f'{run_id} | Email sent to {recipient} successfully.')
-
-
+    def notify(self, recipient, run_id):
+        """
+        Queue an email that informs the client that the given run ID has been processed. The email is sent in the
+        background.
+        """
+        if self.notifier is None:
+            self.notifier = self.create_dispatcher()
+        self.notifier.notify(recipient, run_id)
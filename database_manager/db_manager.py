@@ -1,7 +1,21 @@
-import psycopg2
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+import metrics
 from static import constants as const
 from .db_error import DBError
+from .iterator_file import IteratorFile
+
+# Number of chunks that may wait in the queue of a COPY stream.
+COPY_QUEUE_SIZE = 4
+
+# Number of seconds to wait for a connection when the pool is exhausted.
+POOL_TIMEOUT = 60
 
 
 class DBManager:
@@ -14,6 +28,11 @@ class DBManager:
         self.metadata_table = None  # Metadata table name
         self.results_table = None   # Results table name
         self.status_table = None    # Status table name
+        self.pool_size = 4          # Maximum number of connections of a process
+        self.pool = None            # Connection pool of the process that created it
+        self.pool_pid = None        # ID of the process that created the pool
+        self.pool_lock = threading.Lock()
+        self.inherited_pools = []   # Pools inherited from the parent process
 
     def setup(self, config):
         """
@@ -28,6 +47,7 @@ class DBManager:
         self.metadata_table = config.db_table_metadata
         self.results_table = config.db_table_results
         self.status_table = config.db_table_status
+        self.pool_size = max(config.db_pool_size, config.db_copy_streams + 1)
 
     def validate(self, config):
         """
@@ -50,139 +70,328 @@ class DBManager:
         if config.db_table_status is None:
             raise DBError('Missing status table name!')
 
+    def get_pool(self):
+        """
+        Return the connection pool of this process. A process that is forked from the process that created the pool
+        creates its own pool since connections cannot be shared across processes.
+        """
+        with self.pool_lock:
+            if self.pool is None or self.pool_pid != os.getpid():
+                if self.pool is not None:
+                    # Keep the inherited pool referenced. Closing its connections would close the parent's sessions.
+                    self.inherited_pools.append(self.pool)
+                try:
+                    self.pool = ThreadedConnectionPool(minconn=0,
+                                                       maxconn=self.pool_size,
+                                                       host=self.host,
+                                                       port=self.port,
+                                                       user=self.user,
+                                                       password=self.password,
+                                                       database=self.database)
+                except Exception as e:
+                    raise DBError(msg=str(e))
+                self.pool_pid = os.getpid()
+
+            return self.pool
+
     def get_connection(self):
         """
-        Return a connection object.
+        Return a connection from the pool. Wait for a connection to be released if the pool is exhausted. Return the
+        connection with release_connection.
         """
+        pool = self.get_pool()
+        deadline = time.monotonic() + POOL_TIMEOUT
+        while True:
+            try:
+                return pool.getconn()
+            except PoolError:
+                if time.monotonic() > deadline:
+                    raise DBError(msg='Timed out waiting for a database connection.')
+                time.sleep(0.05)
+            except Exception as e:
+                raise DBError(msg=str(e))
+
+    def release_connection(self, connection):
+        """
+        Return the connection to the pool. Broken connections are closed.
+        """
+        pool = self.get_pool()
+        pool.putconn(connection, close=bool(connection.closed))
+
+    @contextmanager
+    def connection(self):
+        """
+        Yield a connection from the pool. The transaction is rolled back on error.
+        """
+        connection = self.get_connection()
         try:
-            return psycopg2.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-        except Exception as e:
-            raise DBError(msg=str(e))
+            yield connection
+        except Exception:
+            try:
+                connection.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.release_connection(connection)
 
     def get_layout(self, run_id):
         """
         Return the layout for the given run ID.
         """
-        connection = self.get_connection()
-        return self.fetch_one(connection, const.LAYOUT_TITLE, self.metadata_table, run_id)
+        return self.fetch_one(const.LAYOUT_TITLE, self.metadata_table, run_id)
 
+    @metrics.timed_db_call
     def post_results(self, csv_path):
         """
         Post the results in the given csv file to the results table.
         """
-        connection = self.get_connection()
         sql_stmnt = f"""COPY {self.results_table} (acc, taxon, confidence, abundance) FROM stdin WITH CSV HEADER DELIMITER as ','"""
 
         try:
-            with connection.cursor() as cursor:
-                with open(csv_path, 'r') as f:
-                    cursor.copy_expert(sql=sql_stmnt, file=f)
-            connection.commit()
+            with self.connection() as connection:
+                with connection.cursor() as cursor:
+                    with open(csv_path, 'r') as f:
+                        cursor.copy_expert(sql=sql_stmnt, file=f)
+                connection.commit()
+        except DBError:
+            raise
+        except Exception as e:
+            raise DBError(msg=str(e))
+
+    def post_results_stream(self, study_id, chunks, n_streams=1):
+        """
+        Post the results of the given study to the results table while they are being produced. chunks is an iterable
+        of csv strings without a header. If n_streams is greater than 1, the chunks are distributed over n_streams COPY
+        statements that run concurrently on separate connections. The streams are committed one after another, so a
+        failed commit may leave the others committed. The rows that were posted for the study before are deleted in
+        the transaction of the first stream, so posting the results again replaces them.
+        """
+        sql_stmnt = f"""COPY {self.results_table} (acc, taxon, confidence, abundance) FROM stdin WITH CSV DELIMITER as ','"""
+        delete = (f"""DELETE FROM {self.results_table} WHERE acc=%s""", (study_id,))
+
+        if n_streams <= 1:
+            self.copy_streams(sql_stmnt, [IteratorFile(chunks)], delete=delete)
+            return
+
+        queues = [queue.Queue(maxsize=COPY_QUEUE_SIZE) for _ in range(n_streams)]
+        files = [IteratorFile(iter(q.get, None)) for q in queues]
+        failed = threading.Event()
+
+        def produce():
+            # Distribute the chunks round-robin. Stop early if a stream fails.
+            try:
+                for i, chunk in enumerate(chunks):
+                    if not put_until_failed(queues[i % n_streams], chunk, failed):
+                        break
+            finally:
+                for q in queues:
+                    close_queue(q, failed)
+
+        self.copy_streams(sql_stmnt, files, producer=produce, failed=failed, delete=delete)
+
+    @metrics.timed_db_call
+    def copy_streams(self, sql_stmnt, files, producer=None, failed=None, delete=None):
+        """
+        Run the COPY statement for each file on its own connection. If given, the producer function runs in the
+        calling thread while the statements run, and the (statement, parameters) delete pair runs on the first
+        connection before its COPY. Commit all connections if every statement succeeds. Otherwise, roll them back and
+        raise the producer's exception, or a DBError. If a commit fails after others succeeded, the delete statement
+        is executed again to remove the committed rows.
+        """
+        connections = []
+        errors = [None] * len(files)
+        failed = failed or threading.Event()
+        n_committed = 0
+
+        def copy(i):
+            try:
+                with connections[i].cursor() as cursor:
+                    cursor.copy_expert(sql=sql_stmnt, file=files[i])
+            except Exception as e:
+                errors[i] = files[i].error or e
+                failed.set()
+
+        try:
+            for _ in files:
+                connections.append(self.get_connection())
+
+            if delete is not None:
+                with connections[0].cursor() as cursor:
+                    cursor.execute(*delete)
+
+            if producer is None:
+                copy(0)
+            else:
+                threads = [threading.Thread(target=copy, args=(i,), daemon=True) for i in range(len(files))]
+                for thread in threads:
+                    thread.start()
+                try:
+                    producer()
+                finally:
+                    for thread in threads:
+                        thread.join()
+
+            error = next((error for error in errors if error is not None), None)
+            if error is not None:
+                raise error
+
+            for connection in connections:
+                connection.commit()
+                n_committed += 1
         except Exception as e:
+            for connection in connections[n_committed:]:
+                try:
+                    connection.rollback()
+                except Exception:
+                    pass
+            if n_committed and delete is not None:
+                # Don't leave a part of the results committed. Posting them again also replaces them.
+                try:
+                    self.execute_statement(*delete)
+                except DBError:
+                    pass
+            if isinstance(e, (DBError, ValueError)):
+                raise
             raise DBError(msg=str(e))
         finally:
-            if connection is not None:
-                connection.close()
+            for connection in connections:
+                self.release_connection(connection)
 
     def update_status(self, run_id, status, output_path=None):
         """
-        Update the status table for the given run ID. If the record doesn't exist, create the record first.
+        Update the status table for the given run ID. If the record doesn't exist, create the record first. Requires a
+        unique constraint on the acc column of the status table.
         """
-        connection = self.get_connection()
+        sql_stmnt = f"""INSERT INTO {self.status_table} (acc, public, status, output_path, created_at, updated_at,
+                                                          email_notification)
+                        VALUES (%s, TRUE, %s, %s, NOW(), NOW(), FALSE)
+                        ON CONFLICT (acc) DO UPDATE SET status=EXCLUDED.status,
+                                                        output_path=COALESCE(EXCLUDED.output_path,
+                                                                             {self.status_table}.output_path),
+                                                        updated_at=NOW()"""
 
-        # Create the record if it doesn't exist.
-        if not self.fetch_one(connection=connection, attribute='acc', table=self.status_table, run_id=run_id,
-                              close_connection=False):
-            sql_stmnt_insert = f"""INSERT INTO {self.status_table} (acc, public, status, created_at, updated_at, 
-            email_notification) 
-                                    VALUES ('{run_id}', TRUE, 0, NOW(), NOW(), FALSE)"""
-            self.execute_statement(connection=connection, sql_stmnt=sql_stmnt_insert, close_connection=False)
-
-        # Update the record.
-        if output_path:
-            sql_stmnt_update = f""" UPDATE {self.status_table} SET status={status}, output_path='{output_path}', 
-            updated_at=NOW() WHERE acc='{run_id}'"""
-        else:
-            sql_stmnt_update = f""" UPDATE {self.status_table} SET status={status}, updated_at=NOW() WHERE acc='{run_id}'"""
+        self.execute_statement(sql_stmnt, (run_id, int(status), output_path))
 
-        self.execute_statement(connection=connection, sql_stmnt=sql_stmnt_update)
+    @metrics.timed_db_call
+    def get_run_info(self, run_id):
+        """
+        Return a dictionary that includes every column of the status table for the given run ID. Return None if the
+        run doesn't exist.
+        """
+        try:
+            with self.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"""SELECT * FROM {self.status_table} WHERE acc=%s""", (run_id,))
+                    row = cursor.fetchone()
+                    if row is None:
+                        return None
+                    return {column.name: value for column, value in zip(cursor.description, row)}
+        except DBError:
+            raise
+        except Exception as e:
+            raise DBError(msg=str(e))
 
     def get_user_id(self, run_id):
         """
         Return the user id for the given run id.
         """
-        connection = self.get_connection()
-        return self.fetch_one(connection, 'user_id', self.status_table, run_id)
+        return self.fetch_one('user_id', self.status_table, run_id)
 
     def get_email(self, run_id):
         """
         Return the email for the given run id.
         """
-        connection = self.get_connection()
-        return self.fetch_one(connection, 'email', self.status_table, run_id)
+        return self.fetch_one('email', self.status_table, run_id)
 
     def get_email_notification_preference(self, run_id):
         """
         Return the email notification preference for the given run id.
         """
-        connection = self.get_connection()
-        return self.fetch_one(connection, 'email_notification', self.status_table, run_id)
+        return self.fetch_one('email_notification', self.status_table, run_id)
 
     def is_run_public(self, run_id):
         """
         Return true if the run with the given ID is public. Otherwise, return false.
         """
-        connection = self.get_connection()
-        return self.fetch_one(connection, 'public', self.status_table, run_id)
+        return self.fetch_one('public', self.status_table, run_id)
 
-    def fetch_one(self, connection, attribute, table, run_id, close_connection=True):
+    @metrics.timed_db_call
+    def fetch_one(self, attribute, table, run_id):
         """
-        Return the value of the attribute for the given run ID in the table. Close the connection if close_connection is
-        true.
+        Return the value of the attribute for the given run ID in the table.
         """
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(f"""SELECT {attribute} FROM {table} WHERE acc='{run_id}'""")
-                row = cursor.fetchone()
-                return row[0] if row else None
+            with self.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"""SELECT {attribute} FROM {table} WHERE acc=%s""", (run_id,))
+                    row = cursor.fetchone()
+                    return row[0] if row else None
+        except DBError:
+            raise
         except Exception as e:
             raise DBError(msg=str(e))
-        finally:
-            if close_connection and connection is not None:
-                connection.close()
 
-    def execute_statement(self, connection, sql_stmnt, close_connection=True):
+    @metrics.timed_db_call
+    def execute_statement(self, sql_stmnt, params=None):
         """
-        Execute the given sql statement and commit. Close the connection if close_connection is true.
+        Execute the given sql statement with the given parameters and commit.
         """
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_stmnt)
-            connection.commit()
+            with self.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql_stmnt, params)
+                connection.commit()
+        except DBError:
+            raise
         except Exception as e:
             raise DBError(msg=str(e))
-        finally:
-            if close_connection and connection is not None:
-                connection.close()
 
     def create_init_status(self, run_id, is_public, user_id, email):
-        connection = self.get_connection()
         status = 0
 
         if user_id is None:
             sql_stmnt = f"""INSERT INTO {self.status_table} (acc, public, status, created_at, updated_at) VALUES (
-            '{run_id}', {is_public}, {status},NOW(), NOW())"""
+            %s, %s, %s, NOW(), NOW())"""
+            params = (run_id, is_public, status)
         else:
             sql_stmnt = f"""INSERT INTO {self.status_table} (acc, user_id, email, public, status, created_at, 
-            updated_at) VALUES ('{run_id}', '{user_id}', '{email}', {is_public}, {status},NOW(), NOW())"""
+            updated_at) VALUES (%s, %s, %s, %s, %s, NOW(), NOW())"""
+            params = (run_id, user_id, email, is_public, status)
+
+        self.execute_statement(sql_stmnt, params)
 
-        self.execute_statement(connection=connection, sql_stmnt=sql_stmnt)
+
+def put_until_failed(q, item, failed):
+    """
+    Put the item in the queue unless the failed event is set while waiting for space. Return true if it was put.
+    """
+    while not failed.is_set():
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def close_queue(q, failed):
+    """
+    Put the end marker in the queue. If a stream failed, the queue may never be consumed again so its chunks are
+    discarded to make space.
+    """
+    while True:
+        try:
+            q.put(None, timeout=1)
+            return
+        except queue.Full:
+            if not failed.is_set():
+                continue
+            try:
+                while True:
+                    q.get_nowait()
+            except queue.Empty:
+                pass
 
 
 # Singleton
@@ -0,0 +1,64 @@
+import io
+
+
+class IteratorFile(io.TextIOBase):
+    """
+    Read-only text file whose contents are produced by an iterator of strings. Used to feed COPY while the rows are
+    still being produced. An exception raised by the iterator is kept in error since the database driver replaces it
+    with its own error.
+    """
+
+    def __init__(self, iterator):
+        self.iterator = iter(iterator)  # Produces the contents of the file.
+        self.chunk = ''                 # Last string produced by the iterator.
+        self.offset = 0                 # Position of the first character of the chunk that hasn't been read yet.
+        self.error = None               # Exception raised by the iterator.
+
+    def readable(self):
+        return True
+
+    def produce(self):
+        """
+        Replace the chunk with the next non-empty string of the iterator if the chunk has been read. Return false if
+        the chunk has been read and the iterator is exhausted.
+        """
+        while self.offset >= len(self.chunk):
+            try:
+                self.chunk, self.offset = next(self.iterator), 0
+            except StopIteration:
+                self.chunk, self.offset = '', 0
+                return False
+            except Exception as e:
+                self.error = e
+                raise
+
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+
+        # Only the characters that are read are copied, so reading a chunk in small pieces takes linear time.
+        parts = []
+        while size > 0 and self.produce():
+            end = min(len(self.chunk), self.offset + size)
+            parts.append(self.chunk[self.offset:end])
+            size -= end - self.offset
+            self.offset = end
+        return ''.join(parts)
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+
+        parts = []
+        while size > 0 and self.produce():
+            newline = self.chunk.find('\n', self.offset)
+            end = len(self.chunk) if newline < 0 else newline + 1
+            end = min(end, self.offset + size)
+            parts.append(self.chunk[self.offset:end])
+            size -= end - self.offset
+            self.offset = end
+            if parts[-1].endswith('\n'):
+                break
+        return ''.join(parts)
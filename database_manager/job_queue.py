@@ -0,0 +1,203 @@
+import os
+import socket
+import threading
+import uuid
+
+from psycopg2.extras import execute_values
+
+import metrics
+from static.job_state import JobState
+from .db_error import DBError
+
+
+class JobQueue:
+    """
+    Work queue of studies that lives in the jobs table. Nodes claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so
+    concurrent claims never block each other or return the same job. A claimed job is invisible to the other nodes until
+    its visibility timeout expires. The claims of a node are renewed by its heartbeat while the studies are processed,
+    so the jobs of a node that stops are re-queued.
+    """
+
+    def __init__(self, db_manager, table, visibility_timeout=600, max_attempts=3):
+        self.db_manager = db_manager                  # Provides the pooled connections.
+        self.table = table                            # Name of the jobs table.
+        self.visibility_timeout = visibility_timeout  # Number of seconds a claimed job is invisible to other nodes.
+        self.max_attempts = max_attempts              # Number of claims after which a job is marked as failed.
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'  # Identifies the claims of a node.
+        self.heartbeat = None                         # Thread that renews the claims of this node.
+        self.stop_event = threading.Event()           # Set when the heartbeat should stop.
+
+    def create_table(self):
+        """
+        Create the jobs table if it doesn't exist.
+        """
+        self.execute(f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                             acc TEXT PRIMARY KEY,
+                             directory TEXT NOT NULL,
+                             state TEXT NOT NULL DEFAULT '{JobState.QUEUED.value}',
+                             attempts INTEGER NOT NULL DEFAULT 0,
+                             owner TEXT,
+                             claimed_until TIMESTAMPTZ,
+                             error TEXT,
+                             created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                             updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW());
+                         CREATE INDEX IF NOT EXISTS {self.table}_state_idx ON {self.table} (state, created_at)""")
+
+    @metrics.timed_db_call
+    def enqueue(self, jobs):
+        """
+        Add the given (run ID, directory) pairs to the queue. Done jobs are queued again since their study was
+        downloaded again. Queued, claimed and failed jobs are left as is, so a job that failed after max_attempts claims
+        isn't retried when its study is reported again. Return the run IDs that were queued.
+        """
+        if not jobs:
+            return []
+
+        sql_stmnt = f"""INSERT INTO {self.table} (acc, directory) VALUES %s
+                        ON CONFLICT (acc) DO UPDATE
+                        SET directory = EXCLUDED.directory, state = '{JobState.QUEUED.value}', attempts = 0,
+                            owner = NULL, claimed_until = NULL, error = NULL, updated_at = NOW()
+                        WHERE {self.table}.state = '{JobState.DONE.value}'
+                        RETURNING acc"""
+
+        try:
+            with self.db_manager.connection() as connection:
+                with connection.cursor() as cursor:
+                    rows = execute_values(cursor, sql_stmnt, jobs, fetch=True)
+                connection.commit()
+        except DBError:
+            raise
+        except Exception as e:
+            raise DBError(msg=str(e))
+
+        return [row[0] for row in rows]
+
+    def claim(self, limit=1):
+        """
+        Claim up to limit queued jobs in the order they were added. Return a list of (run ID, directory) pairs.
+        """
+        sql_stmnt = f"""WITH candidates AS (
+                            SELECT acc FROM {self.table}
+                            WHERE state = %s
+                            ORDER BY created_at
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED)
+                        UPDATE {self.table} AS jobs
+                        SET state = %s, owner = %s, attempts = jobs.attempts + 1,
+                            claimed_until = NOW() + %s * INTERVAL '1 second', updated_at = NOW()
+                        FROM candidates
+                        WHERE jobs.acc = candidates.acc
+                        RETURNING jobs.acc, jobs.directory"""
+
+        return self.execute(sql_stmnt, (JobState.QUEUED.value, limit, JobState.CLAIMED.value, self.owner,
+                                        self.visibility_timeout), fetch=True)
+
+    def requeue_expired(self):
+        """
+        Re-queue the claimed jobs whose visibility timeout expired. Jobs that were claimed max_attempts times are marked
+        as failed. Return a list of (run ID, state) pairs of the updated jobs.
+        """
+        sql_stmnt = f"""UPDATE {self.table}
+                        SET state = CASE WHEN attempts < %s THEN %s ELSE %s END,
+                            error = CASE WHEN attempts < %s THEN error ELSE 'Visibility timeout expired.' END,
+                            owner = NULL, claimed_until = NULL, updated_at = NOW()
+                        WHERE state = %s AND claimed_until < NOW()
+                        RETURNING acc, state"""
+
+        return self.execute(sql_stmnt, (self.max_attempts, JobState.QUEUED.value, JobState.FAILED.value,
+                                        self.max_attempts, JobState.CLAIMED.value), fetch=True)
+
+    def renew(self):
+        """
+        Extend the visibility timeout of every job claimed by this node.
+        """
+        self.execute(f"""UPDATE {self.table} SET claimed_until = NOW() + %s * INTERVAL '1 second'
+                         WHERE owner = %s AND state = %s""",
+                     (self.visibility_timeout, self.owner, JobState.CLAIMED.value))
+
+    def complete(self, run_id):
+        """
+        Mark the job claimed by this node as done.
+        """
+        self.finish(run_id, JobState.DONE)
+
+    def fail(self, run_id, error=None):
+        """
+        Mark the job claimed by this node as failed.
+        """
+        self.finish(run_id, JobState.FAILED, error)
+
+    def release(self, run_id):
+        """
+        Put the job claimed by this node back in the queue, e.g. after its worker crashed. Jobs that were claimed
+        max_attempts times are marked as failed.
+        """
+        self.execute(f"""UPDATE {self.table}
+                         SET state = CASE WHEN attempts < %s THEN %s ELSE %s END,
+                             owner = NULL, claimed_until = NULL, updated_at = NOW()
+                         WHERE acc = %s AND owner = %s AND state = %s""",
+                     (self.max_attempts, JobState.QUEUED.value, JobState.FAILED.value, run_id, self.owner,
+                      JobState.CLAIMED.value))
+
+    def finish(self, run_id, state, error=None):
+        """
+        Move the job claimed by this node to the given final state. Jobs whose claim was lost are left as is.
+        """
+        self.execute(f"""UPDATE {self.table} SET state = %s, error = %s, claimed_until = NULL, updated_at = NOW()
+                         WHERE acc = %s AND owner = %s AND state = %s""",
+                     (state.value, error, run_id, self.owner, JobState.CLAIMED.value))
+
+    def get_depth(self):
+        """
+        Return a dictionary that maps job states to the number of jobs in that state.
+        """
+        rows = self.execute(f"""SELECT state, COUNT(*) FROM {self.table} GROUP BY state""", fetch=True)
+        depth = {state: 0 for state in JobState}
+        for state, count in rows:
+            depth[JobState(state)] = count
+        return depth
+
+    def start_heartbeat(self):
+        """
+        Renew the claims of this node in a background thread three times per visibility timeout.
+        """
+        if self.heartbeat is not None:
+            return
+
+        def beat():
+            while not self.stop_event.wait(self.visibility_timeout / 3):
+                try:
+                    self.renew()
+                except DBError:
+                    # Try again on the next beat. The claims expire only if every beat fails.
+                    pass
+
+        self.heartbeat = threading.Thread(target=beat, name='job-heartbeat', daemon=True)
+        self.heartbeat.start()
+
+    def close(self):
+        """
+        Stop the heartbeat.
+        """
+        self.stop_event.set()
+        if self.heartbeat is not None:
+            self.heartbeat.join()
+            self.heartbeat = None
+
+    @metrics.timed_db_call
+    def execute(self, sql_stmnt, params=None, fetch=False):
+        """
+        Execute the given sql statement and commit. Return the rows as a list of tuples if fetch is true.
+        """
+        try:
+            with self.db_manager.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql_stmnt, params)
+                    rows = [tuple(row) for row in cursor.fetchall()] if fetch else None
+                connection.commit()
+        except DBError:
+            raise
+        except Exception as e:
+            raise DBError(msg=str(e))
+
+        return rows
@@ -0,0 +1,293 @@
+"""
+Metrics of the Data Engineering service in the OpenMetrics text format. Worker processes send the metrics they record
+to the main process, which serves them over HTTP.
+"""
+import functools
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Content type of the OpenMetrics text format.
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Histogram buckets in seconds.
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STEP_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+STUDY_BUCKETS = (60, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800, 86400)
+
+# Queue to which the metrics of a worker process are sent. None in the main process.
+_forward_queue = None
+
+
+class Metric:
+    """
+    Abstract class for a metric with a value for each combination of its label values.
+    """
+
+    type = None
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name                # Name of the metric family.
+        self.description = description  # Help text.
+        self.label_names = label_names  # Names of the labels.
+        self.values = {}                # Maps tuples of label values to values.
+        self.lock = threading.Lock()
+
+    def record(self, operation, value, labels):
+        """
+        Apply the operation to the value with the given labels. Send it to the main process from a worker process.
+        """
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} requires the labels {", ".join(self.label_names)}.')
+
+        key = tuple(str(labels[name]) for name in self.label_names)
+        if _forward_queue is not None:
+            _forward_queue.put((self.name, operation, value, key))
+            return
+
+        with self.lock:
+            self.apply(operation, value, key)
+
+    def apply(self, operation, value, key):
+        """
+        Apply the operation to the value with the given label values. Called with the lock held.
+        """
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Return the lines of the metric family in the OpenMetrics text format.
+        """
+        lines = [f'# TYPE {self.name} {self.type}', f'# HELP {self.name} {escape(self.description)}']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self.render_samples(dict(zip(self.label_names, key)), value))
+        return lines
+
+    def render_samples(self, labels, value):
+        return [f'{self.name}{format_labels(labels)} {format_value(value)}']
+
+
+class Counter(Metric):
+    """
+    A count that only increases, e.g. the number of claimed studies.
+    """
+
+    type = 'counter'
+
+    def inc(self, value=1, **labels):
+        self.record('inc', value, labels)
+
+    def apply(self, operation, value, key):
+        self.values[key] = self.values.get(key, 0) + value
+
+    def render_samples(self, labels, value):
+        return [f'{self.name}_total{format_labels(labels)} {format_value(value)}']
+
+
+class Gauge(Metric):
+    """
+    A value that may go up and down, e.g. the number of studies in progress.
+    """
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        self.record('set', value, labels)
+
+    def apply(self, operation, value, key):
+        self.values[key] = value
+
+
+class Histogram(Metric):
+    """
+    Counts observations, e.g. durations, in cumulative buckets.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, description, label_names=(), buckets=DB_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)  # Upper bounds of the buckets.
+
+    def observe(self, value, **labels):
+        self.record('observe', value, labels)
+
+    def apply(self, operation, value, key):
+        # Each value is the list of bucket counts followed by the sum of the observations.
+        counts = self.values.setdefault(key, [0] * len(self.buckets) + [0.0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-1] += value
+
+    def render_samples(self, labels, value):
+        *counts, total = value
+        lines = [f'{self.name}_bucket{format_labels({**labels, "le": format_value(bound)})} {count}'
+                 for bound, count in zip(self.buckets, counts)]
+        lines.append(f'{self.name}_count{format_labels(labels)} {counts[-1]}')
+        lines.append(f'{self.name}_sum{format_labels(labels)} {format_value(total)}')
+        return lines
+
+
+class Registry:
+    """
+    The metrics of the service.
+    """
+
+    def __init__(self):
+        self.metrics = {}  # Maps names to metrics.
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def apply(self, event):
+        """
+        Apply an event that was sent by a worker process.
+        """
+        name, operation, value, key = event
+        metric = self.metrics[name]
+        with metric.lock:
+            metric.apply(operation, value, tuple(key))
+
+    def render(self):
+        """
+        Return all metrics in the OpenMetrics text format.
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STUDIES_CLAIMED = REGISTRY.add(Counter('data_engineering_studies_claimed', 'Studies claimed by this node.'))
+STUDIES_SUCCEEDED = REGISTRY.add(Counter('data_engineering_studies_succeeded', 'Studies processed successfully.'))
+STUDIES_ERRORED = REGISTRY.add(Counter('data_engineering_studies_errored', 'Studies that failed or crashed a worker.'))
+STUDIES_SKIPPED = REGISTRY.add(Counter('data_engineering_studies_skipped',
+                                       'Studies that were skipped because their claim was no longer held.'))
+STUDIES_READY = REGISTRY.add(Gauge('data_engineering_studies_ready',
+                                   'Studies that are ready to be processed and not claimed.'))
+STUDIES_IN_FLIGHT = REGISTRY.add(Gauge('data_engineering_studies_in_flight',
+                                       'Studies that are being processed by this node.'))
+STUDY_DURATION = REGISTRY.add(Histogram('data_engineering_study_duration_seconds',
+                                        'Time from claiming a study to finishing it.', buckets=STUDY_BUCKETS))
+STEP_DURATION = REGISTRY.add(Histogram('data_engineering_step_duration_seconds',
+                                       'Wall time of the pipeline steps.', label_names=('step', 'status'),
+                                       buckets=STEP_BUCKETS))
+DB_DURATION = REGISTRY.add(Histogram('data_engineering_db_duration_seconds',
+                                     'Round-trip time of the database calls.', label_names=('operation',),
+                                     buckets=DB_BUCKETS))
+DB_ERRORS = REGISTRY.add(Counter('data_engineering_db_errors', 'Database calls that raised an error.',
+                                 label_names=('operation',)))
+
+
+def timed_db_call(func):
+    """
+    Decorator that records the round-trip time and errors of a database call.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(operation=func.__qualname__)
+            raise
+        finally:
+            DB_DURATION.observe(time.perf_counter() - start_time, operation=func.__qualname__)
+
+    return wrapper
+
+
+def forward_to(q):
+    """
+    Send the metrics of this process to the given queue instead of recording them. Called in worker processes.
+    """
+    global _forward_queue
+    _forward_queue = q
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests for the metrics of the registry of the server.
+    """
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not logged.
+        pass
+
+
+class MetricsServer:
+    """
+    Serves the metrics over HTTP at /metrics and applies the metrics that worker processes send to the queue.
+    """
+
+    def __init__(self, host, port, q=None, registry=REGISTRY):
+        self.registry = registry
+        self.queue = q  # Queue to which the worker processes send their metrics.
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.threads = []
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.threads.append(threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True))
+        if self.queue is not None:
+            self.threads.append(threading.Thread(target=self.collect, name='metrics-collector', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def collect(self):
+        """
+        Apply the metrics sent by the worker processes until None is received.
+        """
+        for event in iter(self.queue.get, None):
+            self.registry.apply(event)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.queue is not None:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(str(value))}"' for name, value in labels.items()) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
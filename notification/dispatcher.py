@@ -0,0 +1,188 @@
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+
+from .message import Message
+from .notification_error import NotificationError
+
+# Number of seconds to wait for queued notifications while closing the dispatcher.
+CLOSE_TIMEOUT = 30
+
+
+class Notifier:
+    """
+    Hands notifications to a dispatcher over its queue. Used by the processes that don't run the dispatcher.
+    """
+
+    def __init__(self, q):
+        self.queue = q  # Queue of (recipient, run ID) pairs.
+
+    def notify(self, recipient, run_id):
+        """
+        Queue an email that informs the recipient that the given run was processed. Return immediately.
+        """
+        self.queue.put((recipient, run_id))
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Release the resources held by the notifier.
+        """
+
+
+class RateLimiter:
+    """
+    Token bucket that allows rate events per second on average and bursts of up to rate events.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate                  # Number of events per second.
+        self.tokens = rate                # Number of events that can happen without waiting.
+        self.updated_at = time.monotonic()
+
+    def wait(self):
+        """
+        Block until the next event is allowed.
+        """
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+class NotificationDispatcher(Notifier):
+    """
+    Sends notifications from a background thread so that callers never wait for the transport. Messages are sent at
+    most max_rate per second and retried with exponential backoff after transient errors. If digest_window is positive,
+    the notifications for a recipient that arrive within digest_window seconds of the first one are sent as one digest.
+    """
+
+    def __init__(self, transport, q=None, max_rate=14, max_attempts=5, retry_delay=2, digest_window=0,
+                 logger_name=''):
+        super().__init__(queue.Queue() if q is None else q)
+        self.transport = transport                    # Sends the messages.
+        self.rate_limiter = RateLimiter(max_rate)
+        self.max_attempts = max_attempts              # Number of times a message is sent before it is dropped.
+        self.retry_delay = retry_delay                # Number of seconds before the first retry. Doubles per retry.
+        self.digest_window = digest_window            # Number of seconds notifications are collected into a digest.
+        self.logger = logging.getLogger(logger_name)
+        self.digests = {}                             # Maps recipients to the deadlines and run IDs of their digests.
+        self.retries = []                             # Heap of (time, sequence number, message) to be retried.
+        self.sequence = itertools.count()             # Orders the retries that are due at the same time.
+        self.close_timeout = CLOSE_TIMEOUT
+        self.thread = None
+
+    def start(self):
+        """
+        Start sending the queued notifications in a background thread.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='notification-dispatcher', daemon=True)
+            self.thread.start()
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Send the pending digests and wait at most timeout seconds for the retries. Then stop the thread.
+        """
+        if self.thread is None:
+            return
+        self.close_timeout = timeout
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        """
+        Send the queued notifications until None is received and the pending messages are sent or timed out.
+        """
+        deadline = None  # Time at which the pending messages are dropped after None was received.
+
+        while True:
+            now = time.monotonic()
+            self.send_due(now, flush_digests=deadline is not None)
+            if deadline is not None and (not self.retries or now >= deadline):
+                break
+
+            try:
+                item = self.queue.get(timeout=self.get_timeout(now, deadline))
+            except queue.Empty:
+                continue
+
+            if item is None:
+                deadline = time.monotonic() + self.close_timeout
+            elif deadline is None:
+                self.add(*item)
+
+        for _, _, message in self.retries:
+            self.logger.error(f'{", ".join(message.run_ids)} | Dropped the email to {message.recipient}.')
+        self.retries = []
+
+    def get_timeout(self, now, deadline):
+        """
+        Return the number of seconds until the next digest or retry is due, or None if nothing is pending.
+        """
+        due = [digest_deadline for digest_deadline, _ in self.digests.values()]
+        if self.retries:
+            due.append(self.retries[0][0])
+        if deadline is not None:
+            due.append(deadline)
+        if not due:
+            return None
+        return max(0, min(due) - now)
+
+    def add(self, recipient, run_id):
+        """
+        Send the notification, or add it to the digest of its recipient.
+        """
+        if self.digest_window <= 0:
+            self.send(Message(recipient, [run_id]))
+            return
+
+        if recipient not in self.digests:
+            self.digests[recipient] = (time.monotonic() + self.digest_window, [])
+        self.digests[recipient][1].append(run_id)
+
+    def send_due(self, now, flush_digests=False):
+        """
+        Send the digests whose window closed and the retries that are due.
+        """
+        for recipient, (deadline, run_ids) in list(self.digests.items()):
+            if flush_digests or deadline <= now:
+                del self.digests[recipient]
+                self.send(Message(recipient, run_ids))
+
+        while self.retries and self.retries[0][0] <= now:
+            _, _, message = heapq.heappop(self.retries)
+            self.send(message)
+
+    def send(self, message):
+        """
+        Send the message. Schedule a retry after a transient error.
+        """
+        run_ids = ', '.join(message.run_ids)
+        self.rate_limiter.wait()
+
+        try:
+            self.transport.send(message)
+        except NotificationError as e:
+            if not e.retryable or message.attempt >= self.max_attempts:
+                self.logger.error(f'{run_ids} | Unable to send the email to {message.recipient}: {e}')
+                return
+            delay = self.retry_delay * 2 ** (message.attempt - 1)
+            message.attempt += 1
+            heapq.heappush(self.retries, (time.monotonic() + delay, next(self.sequence), message))
+            self.logger.warning(f'{run_ids} | Unable to send the email to {message.recipient}: {e} Retrying in '
+                                f'{delay}s.')
+            return
+        except Exception as e:
+            # Keep the dispatcher running.
+            self.logger.error(f'{run_ids} | Unable to send the email to {message.recipient}: {e!r}')
+            return
+
+        self.logger.debug(f'{run_ids} | Email sent to {message.recipient} successfully.')
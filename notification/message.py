@@ -0,0 +1,40 @@
+class Message:
+    """
+    Represents an email that informs a client that their runs have been processed.
+    """
+
+    def __init__(self, recipient, run_ids, attempt=1):
+        self.recipient = recipient    # Email address of the client.
+        self.run_ids = list(run_ids)  # Processed run IDs. More than one if notifications were batched into a digest.
+        self.attempt = attempt        # Number of the next attempt to send the message.
+
+    def get_subject(self):
+        if len(self.run_ids) == 1:
+            return 'Process Completed'
+        return f'{len(self.run_ids)} Processes Completed'
+
+    def get_text(self):
+        """
+        Return the body of the email for non-HTML email clients.
+        """
+        if len(self.run_ids) == 1:
+            return f'{self.run_ids[0]} has been processed successfully.'
+        return 'The following runs have been processed successfully:\n' + '\n'.join(self.run_ids)
+
+    def get_html(self):
+        """
+        Return the HTML body of the email.
+        """
+        if len(self.run_ids) == 1:
+            contents = f'<p>{self.run_ids[0]} has been processed successfully.</p>'
+        else:
+            items = ''.join(f'<li>{run_id}</li>' for run_id in self.run_ids)
+            contents = f'<p>The following runs have been processed successfully:</p><ul>{items}</ul>'
+
+        return f"""<html>
+        <head></head>
+        <body>
+          {contents}
+        </body>
+        </html>
+                    """
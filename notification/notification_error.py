@@ -0,0 +1,11 @@
+class NotificationError(Exception):
+    """
+    Exception to indicate that a notification could not be sent. Retryable errors are transient, e.g. throttling.
+    """
+
+    def __init__(self, msg, retryable=False):
+        self.msg = msg
+        self.retryable = retryable
+
+    def __str__(self):
+        return f'{self.msg}'
@@ -0,0 +1,65 @@
+import threading
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+from .notification_error import NotificationError
+
+SENDER = 'Microbiome Platform <microbiome.platform@gmail.com>'
+AWS_REGION = 'us-west-2'
+CHARSET = 'UTF-8'
+
+# SES error codes that are worth retrying.
+RETRYABLE_ERROR_CODES = {'Throttling', 'ThrottlingException', 'ServiceUnavailable', 'InternalFailure',
+                         'RequestTimeout'}
+
+
+class SesTransport:
+    """
+    Sends emails with Amazon SES. A single client is created on the first message and reused.
+    """
+
+    def __init__(self, region=AWS_REGION, sender=SENDER):
+        self.region = region
+        self.sender = sender
+        self.client = None
+
+    def send(self, message):
+        """
+        Send the given message. Raise a NotificationError on error.
+        """
+        if self.client is None:
+            self.client = boto3.client('ses', region_name=self.region)
+
+        try:
+            self.client.send_email(
+                Destination={'ToAddresses': [message.recipient]},
+                Message={'Body': {'Html': {'Charset': CHARSET, 'Data': message.get_html()},
+                                  'Text': {'Charset': CHARSET, 'Data': message.get_text()}},
+                         'Subject': {'Charset': CHARSET, 'Data': message.get_subject()}},
+                Source=self.sender)
+        except ClientError as e:
+            error = e.response.get('Error', {})
+            raise NotificationError(msg=error.get('Message', str(e)),
+                                    retryable=error.get('Code') in RETRYABLE_ERROR_CODES)
+        except BotoCoreError as e:
+            # Connection and timeout errors.
+            raise NotificationError(msg=str(e), retryable=True)
+
+
+class StubTransport:
+    """
+    Records the messages instead of sending them. Fails the first n_failures messages with a retryable error.
+    """
+
+    def __init__(self, n_failures=0):
+        self.n_failures = n_failures  # Number of messages that fail before messages are accepted.
+        self.sent = []                # Sent messages.
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            if self.n_failures > 0:
+                self.n_failures -= 1
+                raise NotificationError(msg='Throttled by the stub transport.', retryable=True)
+            self.sent.append(message)
@@ -6,12 +6,20 @@ class BiomConvertCmd(Command):
     Represents a command to convert from the biom format.
     """
 
+    action = 'biom_convert'
+
     def __init__(self, input_path, output_path, output_format, msg=''):
         super().__init__(msg)
         self.input_path = input_path        # Path for the input biom file.
         self.output_path = output_path      # Path for the output file.
         self.output_format = output_format  # Output file format (json, hdf5, or tsv).
 
+    def get_inputs(self):
+        return [self.input_path]
+
+    def get_outputs(self):
+        return [self.output_path]
+
     def __str__(self):
         return f"biom convert \
                -i {self.input_path} \
@@ -6,9 +6,30 @@ class Command(ABC):
     Abstract class representing a Qiime2 command.
     """
 
+    action = None                 # Name of the action that executes the command in a Qiime2 worker.
+    request_exclusions = {'msg'}  # Attributes that are not parameters of the action.
+
     def __init__(self, msg):
         self.msg = msg  # Message to be displayed before executing the command.
 
     def get_msg(self):
         return self.msg
 
+    def get_inputs(self):
+        """
+        Return the paths of the files that the command reads.
+        """
+        return []
+
+    def get_outputs(self):
+        """
+        Return the paths of the files that the command writes.
+        """
+        return []
+
+    def get_request(self):
+        """
+        Return the request that asks a Qiime2 worker to execute the command.
+        """
+        params = {key: value for key, value in vars(self).items() if key not in self.request_exclusions}
+        return {'action': self.action, 'params': params}
@@ -6,10 +6,21 @@ class ExportCmd(Command):
     Represents a command to export data from a Qiime2 artifact.
     """
 
-    def __init__(self, input_path, output_path, msg=''):
+    action = 'tools_export'
+    request_exclusions = {'msg', 'exported_paths'}
+
+    def __init__(self, input_path, output_path, exported_paths=None, msg=''):
         super().__init__(msg)
-        self.input_path = input_path    # Path to file that should be exported.
-        self.output_path = output_path  # Path to file or directory where data should be exported to.
+        self.input_path = input_path                           # Path to file that should be exported.
+        self.output_path = output_path                         # Path to file or directory where data should be
+                                                               # exported to.
+        self.exported_paths = exported_paths or [output_path]  # Paths of the files created by the export.
+
+    def get_inputs(self):
+        return [self.input_path]
+
+    def get_outputs(self):
+        return self.exported_paths
 
     def __str__(self):
         return f"qiime tools export \
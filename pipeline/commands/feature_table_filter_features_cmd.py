@@ -7,6 +7,8 @@ class FeatureTableFilterFeaturesCmd(Command):
     frequency of zero after feature filtering will also be removed.
     """
 
+    action = 'feature_table_filter_features'
+
     def __init__(self, qza_table_path, feature_metadata, output_path, msg=''):
         super().__init__(msg)
         self.qza_table_path = qza_table_path      # Path to the feature table from which features should be filtered.
@@ -15,6 +17,12 @@ class FeatureTableFilterFeaturesCmd(Command):
         self.output_path = output_path            # Path where output artifact should be written.
 
 
+    def get_inputs(self):
+        return [self.qza_table_path, self.feature_metadata]
+
+    def get_outputs(self):
+        return [self.output_path]
+
     def __str__(self):
         return f"qiime feature-table filter-features \
                --i-table {self.qza_table_path} \
@@ -0,0 +1,32 @@
+from .command import Command
+
+
+class FeatureTableFilterSamplesCmd(Command):
+    """
+    Represents a command to filter samples from a table based on metadata. Features with a frequency of zero after
+    sample filtering are also removed.
+    """
+
+    action = 'feature_table_filter_samples'
+
+    def __init__(self, input_path, sample_metadata, output_path, exclude_ids=False, msg=''):
+        super().__init__(msg)
+        self.input_path = input_path            # Path to the feature table from which samples should be filtered.
+        self.sample_metadata = sample_metadata  # Sample metadata. The samples in the metadata are retained, or removed
+                                                # if exclude_ids is true.
+        self.output_path = output_path          # Path where output artifact should be written.
+        self.exclude_ids = exclude_ids          # Remove the samples in the metadata instead of retaining them.
+
+    def get_inputs(self):
+        return [self.input_path, self.sample_metadata]
+
+    def get_outputs(self):
+        return [self.output_path]
+
+    def __str__(self):
+        exclude_ids = '--p-exclude-ids' if self.exclude_ids else '--p-no-exclude-ids'
+        return f"qiime feature-table filter-samples \
+               --i-table {self.input_path} \
+               --m-metadata-file {self.sample_metadata} \
+               {exclude_ids} \
+               --o-filtered-table {self.output_path}"
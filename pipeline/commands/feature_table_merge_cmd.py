@@ -6,6 +6,8 @@ class FeatureTableMergeCmd(Command):
     Represents a command to combine feature tables.
     """
 
+    action = 'feature_table_merge'
+
     def __init__(self, input_path, output_path, overlap_method='sum', msg=''):
         super().__init__(msg)
         self.input_path = input_path          # Path to feature tables to be merged separated by spaces.
@@ -13,7 +15,14 @@ class FeatureTableMergeCmd(Command):
         self.overlap_method = overlap_method  # Method for handling overlapping ids. overlap methods are 'average',
                                               # 'error_on_overlapping_feature', 'error_on_overlapping_sample', 'sum'
 
+    def get_inputs(self):
+        return self.input_path.split()
+
+    def get_outputs(self):
+        return [self.output_path]
+
     def __str__(self):
         return f"qiime feature-table merge \
                --i-tables {self.input_path} \
+               --p-overlap-method {self.overlap_method} \
                --o-merged-table {self.output_path}"
\ No newline at end of file
@@ -6,11 +6,19 @@ class FeatureTableMergeTaxaCmd(Command):
     Represents a command to combine feature taxonomies.
     """
 
+    action = 'feature_table_merge_taxa'
+
     def __init__(self, input_path, output_path, msg=''):
         super().__init__(msg)
         self.input_path = input_path      # Path to feature taxonomies to be merged separated by spaces.
         self.output_path = output_path    # Path where output artifact should be written.
 
+    def get_inputs(self):
+        return self.input_path.split()
+
+    def get_outputs(self):
+        return [self.output_path]
+
     def __str__(self):
         return f"qiime feature-table merge-taxa \
                --i-data {self.input_path} \
@@ -6,11 +6,19 @@ class FeatureTableSummarizeCmd(Command):
     Represents a command to generate visual and tabular summaries of a feature table.
     """
 
+    action = 'feature_table_summarize'
+
     def __init__(self, input_path, output_path, msg=''):
         super().__init__(msg)
         self.input_path = input_path      # Path to the feature table to be summarized.
         self.output_path = output_path    # Path where output artifact (visualization) should be written.
 
+    def get_inputs(self):
+        return [self.input_path]
+
+    def get_outputs(self):
+        return [self.output_path]
+
     def __str__(self):
         return f"qiime feature-table summarize \
                --i-table {self.input_path} \
@@ -1,3 +1,5 @@
+import csv
+
 from .command import Command
 
 
@@ -6,6 +8,8 @@ class ImportCmd(Command):
     Represents a command to import data to create a new Qiime2 artifact.
     """
 
+    action = 'tools_import'
+
     def __init__(self, input_type, input_path, output_path, input_format, msg=''):
         super().__init__(msg)
         self.input_type = input_type      # The semantic type of the artifact that will be created upon importing.
@@ -13,6 +17,28 @@ class ImportCmd(Command):
         self.output_path = output_path    # Path where output artifact should be written.
         self.input_format = input_format  # The format of the data to be imported.
 
+    def get_inputs(self):
+        """
+        Return the input path. If it is a manifest, also return the paths of the sequencing files that it lists.
+        """
+        inputs = [self.input_path]
+        if self.input_path is None:
+            return inputs
+        if not self.input_format.endswith('ManifestPhred33V2') and not self.input_format.endswith('ManifestPhred64V2'):
+            return inputs
+
+        try:
+            with open(self.input_path, 'r') as tsv_file:
+                for row in csv.DictReader(tsv_file, delimiter='\t'):
+                    inputs.extend(path for title, path in row.items() if title.endswith('filepath') and path)
+        except OSError:
+            pass
+
+        return inputs
+
+    def get_outputs(self):
+        return [self.output_path]
+
     def __str__(self):
         return f"qiime tools import \
                --type '{self.input_type}' \
@@ -7,11 +7,19 @@ class MetadataTabulateCmd(Command):
     to qzv.
     """
 
+    action = 'metadata_tabulate'
+
     def __init__(self, input_path, output_path, msg=''):
         super().__init__(msg)
         self.input_path = input_path      # Path to the metadata (taxonomy analysis results) to be tabulated.
         self.output_path = output_path    # Path where output artifact (visualization) should be written.
 
+    def get_inputs(self):
+        return [self.input_path]
+
+    def get_outputs(self):
+        return [self.output_path]
+
     def __str__(self):
         return f"qiime metadata tabulate \
                --m-input-file {self.input_path} \
@@ -6,6 +6,8 @@ class PairedDenoiseCmd(Command):
     Represents a command to denoise paired-end sequences.
     """
 
+    action = 'dada2_denoise_paired'
+
     def __init__(self, input_path, fwd_trunc_pos, rev_trunc_pos, output_path, rep_seqs_path, stats_path,
                  fwd_trim_pos=0, rev_trim_pos=0, n_threads=0, msg=''):
         super().__init__(msg)
@@ -19,6 +21,12 @@ class PairedDenoiseCmd(Command):
         self.rep_seqs_path = rep_seqs_path  # Path for the resulting feature sequences.
         self.stats_path = stats_path        # Path for denoising statistics artifact.
 
+    def get_inputs(self):
+        return [self.input_path]
+
+    def get_outputs(self):
+        return [self.output_path, self.rep_seqs_path, self.stats_path]
+
     def __str__(self):
         return f"qiime dada2 denoise-paired \
                --i-demultiplexed-seqs {self.input_path} \
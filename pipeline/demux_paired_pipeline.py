@@ -1,6 +1,7 @@
 from .commands.import_cmd import ImportCmd
 from .commands.paired_denoise_cmd import PairedDenoiseCmd
 from .pipeline import Pipeline
+from config import app_config
 from static.input_format import InputFormat
 from static.semantic_type import SemanticType
 
@@ -15,20 +16,41 @@ class DemuxPairedPipeline(Pipeline):
         self.setup_unique_commands()
         self.setup_common_commands()
 
-    def setup_unique_commands(self):
+    def create_import_cmd(self, manifest_path, demux_path, msg):
+        return ImportCmd(input_type=SemanticType.SD_PAIRED_QUALITY,
+                         input_path=manifest_path,
+                         output_path=demux_path,
+                         input_format=InputFormat.PAIRED_PHRED_33,
+                         msg=msg)
+
+    def create_denoise_cmd(self, demux_path, table_path, rep_seqs_path, stats_path, n_threads, msg):
+        return PairedDenoiseCmd(input_path=demux_path,
+                                fwd_trunc_pos=0,
+                                rev_trunc_pos=0,
+                                output_path=table_path,
+                                rep_seqs_path=rep_seqs_path,
+                                stats_path=stats_path,
+                                n_threads=n_threads,
+                                msg=msg)
+
+    def prepare(self):
         """
-        Generate unique commands for this pipeline and add them to the commands list.
+        Choose the trim and truncation positions of DADA2 from the quality profiles of the forward and reverse reads.
         """
-        self.commands.append(ImportCmd(input_type=SemanticType.SD_PAIRED_QUALITY,
-                                       input_path=self.manifest_path,
-                                       output_path=self.demux_path,
-                                       input_format=InputFormat.PAIRED_PHRED_33,
-                                       msg=f'{self.id} | Importing into Qiime2.'))
-
-        self.commands.append(PairedDenoiseCmd(input_path=self.demux_path,
-                                              fwd_trunc_pos=0,
-                                              rev_trunc_pos=0,
-                                              output_path=self.qza_table_path,
-                                              rep_seqs_path=self.rep_seqs_path,
-                                              stats_path=self.stats_path,
-                                              msg=f'{self.id} | Running DADA2.'))
\ No newline at end of file
+        if not app_config.auto_truncation:
+            return
+
+        try:
+            [(fwd_trim_pos, fwd_trunc_pos), (rev_trim_pos, rev_trunc_pos)] = self.choose_denoise_positions()
+        except (OSError, ValueError) as e:
+            self.logger.warning(f'{self.id} | Unable to profile the reads, they are not truncated: {e}')
+            return
+
+        for denoise_cmd in self.denoise_cmds:
+            denoise_cmd.fwd_trim_pos = fwd_trim_pos
+            denoise_cmd.fwd_trunc_pos = fwd_trunc_pos
+            denoise_cmd.rev_trim_pos = rev_trim_pos
+            denoise_cmd.rev_trunc_pos = rev_trunc_pos
+        self.logger.info(f'{self.id} | Trimming forward reads at {fwd_trim_pos} and truncating them at '
+                         f'{fwd_trunc_pos}. Trimming reverse reads at {rev_trim_pos} and truncating them at '
+                         f'{rev_trunc_pos}.')
\ No newline at end of file
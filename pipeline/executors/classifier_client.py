@@ -0,0 +1,41 @@
+import socket
+
+from .worker_protocol import read_message, write_message
+
+
+class ClassifierClient:
+    """
+    Client of the resident taxonomy classifier service.
+    """
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path  # Path for the Unix socket of the service.
+
+    def send(self, action, **params):
+        """
+        Send a request to the service and return its response. Raise a ConnectionError if the service is unreachable.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            try:
+                connection.connect(self.socket_path)
+            except OSError as e:
+                raise ConnectionError(f'Classifier service at {self.socket_path} is unreachable: {e}')
+
+            with connection.makefile('rw', encoding='utf-8') as stream:
+                write_message(stream, {'action': action, 'params': params})
+                response = read_message(stream)
+
+        if response is None:
+            raise ConnectionError(f'Classifier service at {self.socket_path} closed the connection.')
+
+        return response
+
+    def classify(self, input_path, classifier_path, output_path, n_jobs=1, confidence=0.7):
+        return self.send('classify', input_path=input_path, classifier_path=classifier_path, output_path=output_path,
+                         n_jobs=n_jobs, confidence=confidence)
+
+    def load(self, classifier_path):
+        return self.send('load', classifier_path=classifier_path)
+
+    def status(self):
+        return self.send('status')
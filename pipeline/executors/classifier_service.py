@@ -0,0 +1,207 @@
+"""
+Resident taxonomy classifier service that runs inside the Qiime2 environment. Each classifier is loaded once, dumped to
+a joblib cache and loaded back memory-mapped so that its arrays are shared read-only by every classification job.
+Classifiers can be swapped for a new version at any time without restarting the service.
+
+Usage: python -m pipeline.executors.classifier_service --socket <path> --cache-dir <dir> [--classifier <qza path> ...]
+"""
+import argparse
+import hashlib
+import os
+import signal
+import socketserver
+import threading
+import traceback
+from collections import namedtuple
+
+from .worker_protocol import read_message, write_message
+
+# A loaded classifier. version identifies the contents of the classifier file.
+LoadedClassifier = namedtuple('LoadedClassifier', ['name', 'path', 'version', 'model'])
+
+
+def get_classifier_name(classifier_path):
+    """
+    Return the name of the classifier stored in the given file.
+    """
+    return os.path.splitext(os.path.basename(classifier_path))[0]
+
+
+def get_classifier_version(classifier_path):
+    """
+    Return the version of the classifier stored in the given file, i.e. a prefix of the SHA-256 of its contents.
+    """
+    digest = hashlib.sha256()
+    with open(classifier_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return f'{get_classifier_name(classifier_path)}-{digest.hexdigest()[:12]}'
+
+
+def load_memory_mapped(classifier_path, version, cache_dir):
+    """
+    Load the scikit-learn pipeline of the given classifier artifact with its arrays memory-mapped from the cache.
+    """
+    import joblib
+    from qiime2 import Artifact
+    from sklearn.pipeline import Pipeline
+
+    cache_path = os.path.join(cache_dir, f'{version}.joblib')
+    if not os.path.isfile(cache_path):
+        model = Artifact.load(classifier_path).view(Pipeline)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    return joblib.load(cache_path, mmap_mode='r')
+
+
+def classify(model, input_path, output_path, n_jobs, confidence):
+    """
+    Classify the representative sequences in input_path with the given model and save the taxonomy artifact.
+    """
+    from q2_feature_classifier.classifier import classify_sklearn
+    from q2_types.feature_data import DNAFASTAFormat
+    from qiime2 import Artifact
+
+    reads = Artifact.load(input_path).view(DNAFASTAFormat)
+    taxonomy = classify_sklearn(reads=reads, classifier=model, n_jobs=n_jobs, confidence=confidence)
+    Artifact.import_data('FeatureData[Taxonomy]', taxonomy).save(output_path)
+
+
+class ClassifierService:
+    """
+    Serves classification requests over a Unix socket. Requests are handled concurrently and every request uses the
+    classifier version that was current when it started.
+    """
+
+    def __init__(self, socket_path, cache_dir, load_model=load_memory_mapped, classify_reads=classify):
+        self.socket_path = socket_path        # Path for the Unix socket.
+        self.cache_dir = cache_dir            # Directory for the memory-mappable copies of the classifiers.
+        self.load_model = load_model          # Loads the model of a classifier file.
+        self.classify_reads = classify_reads  # Classifies representative sequences with a model.
+        self.classifiers = {}                 # Maps classifier names to loaded classifiers.
+        self.lock = threading.Lock()          # Guards the classifiers dictionary.
+        self.load_lock = threading.Lock()     # Loads one classifier at a time.
+        self.server = None
+
+    def load(self, path):
+        """
+        Load the classifier in the given file and make it the current version for its name. Return the version.
+        """
+        with self.load_lock:
+            version = get_classifier_version(path)
+            name = get_classifier_name(path)
+
+            current = self.classifiers.get(name)
+            if current is not None and current.version == version:
+                return version
+
+            # Requests in progress keep using the previous version.
+            model = self.load_model(path, version, self.cache_dir)
+            with self.lock:
+                self.classifiers[name] = LoadedClassifier(name=name, path=path, version=version, model=model)
+
+            return version
+
+    def reload_all(self):
+        """
+        Reload every classifier from its file. Files that were replaced are swapped to their new version.
+        """
+        for classifier in list(self.classifiers.values()):
+            self.load(classifier.path)
+
+    def get_classifier(self, classifier_path):
+        """
+        Return the loaded classifier for the given file. Load it if it is not loaded yet.
+        """
+        name = get_classifier_name(classifier_path)
+        with self.lock:
+            classifier = self.classifiers.get(name)
+
+        if classifier is None:
+            self.load(classifier_path)
+            with self.lock:
+                classifier = self.classifiers[name]
+
+        return classifier
+
+    def handle(self, request):
+        """
+        Handle a single request and return the response.
+        """
+        action = request.get('action')
+        params = request.get('params', {})
+
+        if action == 'classify':
+            classifier = self.get_classifier(params['classifier_path'])
+            self.classify_reads(classifier.model, params['input_path'], params['output_path'],
+                                params.get('n_jobs', 1), params.get('confidence', 0.7))
+            return {'version': classifier.version}
+
+        if action == 'load':
+            return {'version': self.load(params['classifier_path'])}
+
+        if action == 'status':
+            with self.lock:
+                return {name: classifier.version for name, classifier in self.classifiers.items()}
+
+        raise ValueError(f'Unsupported action: {action}')
+
+    def serve_forever(self):
+        """
+        Serve requests until shutdown is called.
+        """
+        service = self
+
+        class RequestHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with self.request.makefile('rw', encoding='utf-8') as stream:
+                    while True:
+                        request = read_message(stream)
+                        if request is None:
+                            break
+                        response = {'id': request.get('id')}
+                        try:
+                            response.update(ok=True, result=service.handle(request))
+                        except Exception:
+                            response.update(ok=False, error=traceback.format_exc())
+                        write_message(stream, response)
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, RequestHandler)
+        self.server.daemon_threads = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident taxonomy classifier service.')
+    parser.add_argument('--socket', required=True, help='Path for the Unix socket.')
+    parser.add_argument('--cache-dir', required=True, help='Directory for the memory-mappable classifiers.')
+    parser.add_argument('--classifier', action='append', default=[], help='Classifier artifact to load on start.')
+    args = parser.parse_args()
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    service = ClassifierService(socket_path=args.socket, cache_dir=args.cache_dir)
+    for classifier_path in args.classifier:
+        service.load(classifier_path)
+
+    # SIGHUP swaps every classifier whose file was replaced.
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=service.reload_all).start())
+    service.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import logging
+
+from .classifier_client import ClassifierClient
+from .executor import Executor
+from ..commands.feature_classifier_cmd import FeatureClassifierCmd
+
+
+class ClassifierServiceExecutor(Executor):
+    """
+    Executor that sends taxonomy classification commands to the resident classifier service and every other command
+    to the wrapped executor.
+    """
+
+    def __init__(self, executor, socket_path, logger_name=''):
+        self.executor = executor                    # Executor for the commands other than classification.
+        self.client = ClassifierClient(socket_path)  # Client of the classifier service.
+        self.logger = logging.getLogger(logger_name)
+
+    def execute(self, command, usage=None):
+        if not isinstance(command, FeatureClassifierCmd):
+            return self.executor.execute(command, usage=usage)
+
+        try:
+            response = self.client.classify(input_path=command.input_path,
+                                            classifier_path=command.classifier_path,
+                                            output_path=command.output_path,
+                                            n_jobs=command.n_jobs,
+                                            confidence=command.confidence)
+        except ConnectionError as e:
+            self.logger.warning(f'{e} Running the classifier in the executor.')
+            return self.executor.execute(command, usage=usage)
+
+        if not response.get('ok'):
+            self.logger.error(f"Classifier service error: {response.get('error')}")
+            return 1
+
+        self.logger.debug(f"Classified with {response['result']['version']}.")
+        return 0
+
+    def close(self):
+        self.executor.close()
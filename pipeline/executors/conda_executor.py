@@ -0,0 +1,15 @@
+from .executor import Executor
+import utils
+
+
+class CondaExecutor(Executor):
+    """
+    Executor that runs each command in a new `conda run` shell.
+    """
+
+    def __init__(self, conda_path, env):
+        self.conda_path = conda_path  # Path for conda.
+        self.env = env                # Qiime2 environment name.
+
+    def execute(self, command, usage=None):
+        return utils.run_conda_command(cmd=str(command), conda_path=self.conda_path, env=self.env, usage=usage)
@@ -0,0 +1,19 @@
+from abc import ABC, abstractmethod
+
+
+class Executor(ABC):
+    """
+    Abstract class for an executor that runs Qiime2 commands.
+    """
+
+    @abstractmethod
+    def execute(self, command, usage=None):
+        """
+        Execute the given command and return its return code. 0 indicates success. If a usage dictionary is given, the
+        resource usage of the command is added to it when the executor can measure it.
+        """
+
+    def close(self):
+        """
+        Release the resources held by the executor.
+        """
@@ -0,0 +1,34 @@
+from .classifier_service_executor import ClassifierServiceExecutor
+from .conda_executor import CondaExecutor
+from .worker_executor import WorkerExecutor
+from static.executor_type import ExecutorType
+
+# Executor of this process. Workers are shared by all pipelines of the process.
+_executor = None
+
+
+class ExecutorFactory:
+    """
+    Factory class to generate executors.
+    """
+
+    @classmethod
+    def get_executor(cls, config, logger_name):
+        """
+        Return the executor of this process for the given configuration. The executor is created on the first call.
+        """
+        global _executor
+
+        if _executor is None:
+            if config.executor == ExecutorType.WORKER:
+                _executor = WorkerExecutor.for_conda_env(conda_path=config.conda_path, env=config.env,
+                                                         logger_name=logger_name,
+                                                         max_workers=config.max_parallel_steps)
+            else:
+                _executor = CondaExecutor(conda_path=config.conda_path, env=config.env)
+
+            if config.classifier_socket:
+                _executor = ClassifierServiceExecutor(executor=_executor, socket_path=config.classifier_socket,
+                                                      logger_name=logger_name)
+
+        return _executor
@@ -0,0 +1,43 @@
+"""
+Qiime2 worker for tests. It speaks the worker protocol without Qiime2 and creates empty output files.
+
+Usage: python -m pipeline.executors.fake_qiime_worker
+"""
+import os
+
+from .worker_protocol import serve
+
+# Parameters that hold the paths of output files.
+OUTPUT_PARAMS = {'output_path', 'rep_seqs_path', 'stats_path'}
+
+
+def create_outputs(**params):
+    for key, value in params.items():
+        if key in OUTPUT_PARAMS:
+            os.makedirs(os.path.dirname(os.path.abspath(value)), exist_ok=True)
+            open(value, 'a').close()
+
+
+def tools_export(input_path, output_path):
+    os.makedirs(output_path, exist_ok=True)
+
+
+def fail(**params):
+    raise RuntimeError('Requested failure.')
+
+
+def ping():
+    return os.getpid()
+
+
+HANDLERS = {action: create_outputs for action in ('tools_import', 'biom_convert', 'dada2_denoise_single',
+                                                  'dada2_denoise_paired', 'classify_sklearn', 'feature_table_merge',
+                                                  'feature_table_merge_seqs', 'feature_table_merge_taxa',
+                                                  'feature_table_filter_features', 'feature_table_filter_samples',
+                                                  'feature_table_summarize',
+                                                  'metadata_tabulate', 'taxa_barplot')}
+HANDLERS.update(tools_export=tools_export, fail=fail, ping=ping)
+
+
+if __name__ == '__main__':
+    serve(HANDLERS)
@@ -0,0 +1,172 @@
+"""
+Long-lived worker that runs inside the Qiime2 environment and executes commands through the Artifact API. Plugins are
+imported once per worker instead of once per command.
+
+Usage: python -m pipeline.executors.qiime_worker
+"""
+import os
+
+from .worker_protocol import serve
+
+
+def tools_import(input_type, input_path, output_path, input_format):
+    from qiime2 import Artifact
+
+    Artifact.import_data(input_type, input_path, view_type=input_format).save(output_path)
+
+
+def tools_export(input_path, output_path):
+    from qiime2 import Artifact
+
+    Artifact.load(input_path).export_data(output_path)
+
+
+def biom_convert(input_path, output_path, output_format):
+    import biom
+    from biom.util import biom_open
+
+    table = biom.load_table(input_path)
+    if output_format == 'tsv':
+        with open(output_path, 'w') as f:
+            f.write(table.to_tsv())
+    elif output_format == 'json':
+        with open(output_path, 'w') as f:
+            table.to_json('data_engineering', direct_io=f)
+    else:
+        with biom_open(output_path, 'w') as f:
+            table.to_hdf5(f, 'data_engineering')
+
+
+def dada2_denoise_single(input_path, trunc_pos, output_path, rep_seqs_path, stats_path, trim_pos, n_threads):
+    from qiime2 import Artifact
+    from qiime2.plugins import dada2
+
+    results = dada2.methods.denoise_single(demultiplexed_seqs=Artifact.load(input_path),
+                                           trunc_len=trunc_pos,
+                                           trim_left=trim_pos,
+                                           n_threads=n_threads)
+    results.table.save(output_path)
+    results.representative_sequences.save(rep_seqs_path)
+    results.denoising_stats.save(stats_path)
+
+
+def dada2_denoise_paired(input_path, fwd_trunc_pos, rev_trunc_pos, output_path, rep_seqs_path, stats_path,
+                         fwd_trim_pos, rev_trim_pos, n_threads):
+    from qiime2 import Artifact
+    from qiime2.plugins import dada2
+
+    results = dada2.methods.denoise_paired(demultiplexed_seqs=Artifact.load(input_path),
+                                           trunc_len_f=fwd_trunc_pos,
+                                           trunc_len_r=rev_trunc_pos,
+                                           trim_left_f=fwd_trim_pos,
+                                           trim_left_r=rev_trim_pos,
+                                           n_threads=n_threads)
+    results.table.save(output_path)
+    results.representative_sequences.save(rep_seqs_path)
+    results.denoising_stats.save(stats_path)
+
+
+def classify_sklearn(input_path, classifier_path, output_path, n_jobs, confidence):
+    from qiime2 import Artifact
+    from qiime2.plugins import feature_classifier
+
+    results = feature_classifier.methods.classify_sklearn(reads=Artifact.load(input_path),
+                                                          classifier=Artifact.load(classifier_path),
+                                                          n_jobs=n_jobs,
+                                                          confidence=confidence)
+    results.classification.save(output_path)
+
+
+def feature_table_merge(input_path, output_path, overlap_method):
+    from qiime2 import Artifact
+    from qiime2.plugins import feature_table
+
+    tables = [Artifact.load(path) for path in input_path.split()]
+    feature_table.methods.merge(tables=tables, overlap_method=overlap_method).merged_table.save(output_path)
+
+
+def feature_table_merge_seqs(input_path, output_path):
+    from qiime2 import Artifact
+    from qiime2.plugins import feature_table
+
+    data = [Artifact.load(path) for path in input_path.split()]
+    feature_table.methods.merge_seqs(data=data).merged_data.save(output_path)
+
+
+def feature_table_merge_taxa(input_path, output_path):
+    from qiime2 import Artifact
+    from qiime2.plugins import feature_table
+
+    data = [Artifact.load(path) for path in input_path.split()]
+    feature_table.methods.merge_taxa(data=data).merged_data.save(output_path)
+
+
+def feature_table_filter_features(qza_table_path, feature_metadata, output_path):
+    from qiime2 import Artifact, Metadata
+    from qiime2.plugins import feature_table
+
+    results = feature_table.methods.filter_features(table=Artifact.load(qza_table_path),
+                                                    metadata=Metadata.load(feature_metadata))
+    results.filtered_table.save(output_path)
+
+
+def feature_table_filter_samples(input_path, sample_metadata, output_path, exclude_ids):
+    from qiime2 import Artifact, Metadata
+    from qiime2.plugins import feature_table
+
+    results = feature_table.methods.filter_samples(table=Artifact.load(input_path),
+                                                   metadata=Metadata.load(sample_metadata),
+                                                   exclude_ids=exclude_ids)
+    results.filtered_table.save(output_path)
+
+
+def feature_table_summarize(input_path, output_path):
+    from qiime2 import Artifact
+    from qiime2.plugins import feature_table
+
+    feature_table.visualizers.summarize(table=Artifact.load(input_path)).visualization.save(output_path)
+
+
+def metadata_tabulate(input_path, output_path):
+    from qiime2 import Artifact, Metadata
+    from qiime2.plugins import metadata
+
+    input_metadata = Artifact.load(input_path).view(Metadata)
+    metadata.visualizers.tabulate(input=input_metadata).visualization.save(output_path)
+
+
+def taxa_barplot(qza_table_path, qza_taxonomy_path, output_path):
+    from qiime2 import Artifact
+    from qiime2.plugins import taxa
+
+    results = taxa.visualizers.barplot(table=Artifact.load(qza_table_path),
+                                       taxonomy=Artifact.load(qza_taxonomy_path))
+    results.visualization.save(output_path)
+
+
+def ping():
+    return os.getpid()
+
+
+HANDLERS = {'tools_import': tools_import,
+            'tools_export': tools_export,
+            'biom_convert': biom_convert,
+            'dada2_denoise_single': dada2_denoise_single,
+            'dada2_denoise_paired': dada2_denoise_paired,
+            'classify_sklearn': classify_sklearn,
+            'feature_table_merge': feature_table_merge,
+            'feature_table_merge_seqs': feature_table_merge_seqs,
+            'feature_table_merge_taxa': feature_table_merge_taxa,
+            'feature_table_filter_features': feature_table_filter_features,
+            'feature_table_filter_samples': feature_table_filter_samples,
+            'feature_table_summarize': feature_table_summarize,
+            'metadata_tabulate': metadata_tabulate,
+            'taxa_barplot': taxa_barplot,
+            'ping': ping}
+
+
+if __name__ == '__main__':
+    # Import the Qiime2 framework up front so that the first command doesn't pay for it.
+    import qiime2.plugins  # noqa: F401
+
+    serve(HANDLERS)
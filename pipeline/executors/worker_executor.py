@@ -0,0 +1,150 @@
+import itertools
+import logging
+import os
+import subprocess
+import threading
+
+from .executor import Executor
+from .. import step_metrics
+from .worker_protocol import read_message, write_message
+
+# Directory from which the worker modules can be imported.
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class WorkerProcess:
+    """
+    A long-lived Qiime2 worker process. The process is started on the first request and restarted if it dies.
+    """
+
+    def __init__(self, worker_cmd, logger, max_attempts=2):
+        self.worker_cmd = worker_cmd            # Command line that starts the worker.
+        self.logger = logger
+        self.max_attempts = max_attempts        # Number of processes to try for a request before giving up.
+        self.process = None                     # Worker process.
+        self.request_ids = itertools.count(1)   # Generates request ids.
+
+    def send(self, request):
+        """
+        Send the request to the worker and return its response. Restart the worker and retry if it dies. Return None if
+        no worker could complete the request.
+        """
+        for attempt in range(self.max_attempts):
+            if not self.is_alive():
+                self.start()
+
+            request = dict(request, id=next(self.request_ids))
+            try:
+                write_message(self.process.stdin, request)
+                response = read_message(self.process.stdout)
+            except (BrokenPipeError, ValueError):
+                response = None
+
+            if response is not None:
+                return response
+
+            self.logger.warning(f'Qiime2 worker {self.process.pid} died while running {request["action"]}.')
+            self.stop()
+
+        return None
+
+    def start(self):
+        """
+        Start a new worker process.
+        """
+        self.process = subprocess.Popen(self.worker_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                                        cwd=PROJECT_DIR)
+        self.logger.debug(f'Started Qiime2 worker {self.process.pid}.')
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        """
+        Stop the worker process. The worker exits once its stdin is closed.
+        """
+        if self.process is None:
+            return
+
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+        self.process.stdout.close()
+        self.process = None
+
+
+class WorkerExecutor(Executor):
+    """
+    Executor that sends commands to long-lived Qiime2 worker processes over pipes. Each worker executes one command at
+    a time and up to max_workers workers are started for commands that run concurrently.
+    """
+
+    def __init__(self, worker_cmd, logger_name='', max_workers=1):
+        self.worker_cmd = worker_cmd                 # Command line that starts a worker.
+        self.logger = logging.getLogger(logger_name)
+        self.max_workers = max_workers               # Maximum number of worker processes.
+        self.workers = []                            # All worker processes.
+        self.idle_workers = []                       # Worker processes that are not executing a command.
+        self.condition = threading.Condition()       # Guards the worker lists.
+
+    @classmethod
+    def for_conda_env(cls, conda_path, env, logger_name='', max_workers=1):
+        """
+        Return an executor whose workers run in the given conda environment.
+        """
+        worker_cmd = [conda_path, 'run', '--no-capture-output', '-n', env,
+                      'python', '-u', '-m', 'pipeline.executors.qiime_worker']
+        return cls(worker_cmd=worker_cmd, logger_name=logger_name, max_workers=max_workers)
+
+    def execute(self, command, usage=None):
+        response = self.send(command.get_request())
+        if response is None:
+            return 1
+        step_metrics.add_usage(usage, response.get('usage'))
+        if not response.get('ok'):
+            self.logger.error(f"Qiime2 worker error: {response.get('error')}")
+            return 1
+        return 0
+
+    def send(self, request):
+        """
+        Send the request to an idle worker and return its response. Return None if no worker could complete it.
+        """
+        worker = self.acquire()
+        try:
+            return worker.send(request)
+        finally:
+            self.release(worker)
+
+    def acquire(self):
+        """
+        Return an idle worker. Create a new one if all workers are busy and the limit is not reached.
+        """
+        with self.condition:
+            while not self.idle_workers and len(self.workers) >= self.max_workers:
+                self.condition.wait()
+
+            if self.idle_workers:
+                return self.idle_workers.pop()
+
+            worker = WorkerProcess(self.worker_cmd, self.logger)
+            self.workers.append(worker)
+            return worker
+
+    def release(self, worker):
+        with self.condition:
+            self.idle_workers.append(worker)
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            for worker in self.workers:
+                worker.stop()
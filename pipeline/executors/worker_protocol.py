@@ -0,0 +1,79 @@
+"""
+JSON-over-pipe protocol between a worker executor and a Qiime2 worker. Each request and response is a single line of
+JSON. Requests include an id, an action and its parameters. Responses include the id of the request, an ok flag, an
+error message if the action failed, and the resource usage of the worker while it executed the action.
+
+This module is imported by the worker inside the Qiime2 environment and must only depend on the standard library.
+"""
+import json
+import os
+import resource
+import sys
+import traceback
+
+
+def write_message(stream, message):
+    """
+    Write the given message to the stream as a single line of JSON.
+    """
+    stream.write(json.dumps(message) + '\n')
+    stream.flush()
+
+
+def read_message(stream):
+    """
+    Read a single message from the stream. Return None if the stream is closed.
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def serve(handlers):
+    """
+    Serve requests from stdin until it is closed. handlers maps action names to functions that accept the parameters
+    of the request as keyword arguments.
+    """
+    # Keep a private copy of stdout for the protocol and send everything else that is printed to stderr.
+    protocol_stream = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    while True:
+        request = read_message(sys.stdin)
+        if request is None:
+            break
+
+        response = {'id': request.get('id')}
+        start = get_rusage()
+        try:
+            handler = handlers[request['action']]
+        except KeyError:
+            response.update(ok=False, error=f"Unsupported action: {request.get('action')}")
+        else:
+            try:
+                result = handler(**request.get('params', {}))
+                response.update(ok=True, result=result)
+            except Exception:
+                response.update(ok=False, error=traceback.format_exc())
+
+        response['usage'] = get_usage_since(start)
+        write_message(protocol_stream, response)
+
+
+def get_rusage():
+    """
+    Return the resource usage of this process and its terminated children.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+def get_usage_since(start):
+    """
+    Return the CPU times used since the given resource usage. The peak memory is that of the worker's lifetime, because
+    the kernel doesn't reset it between actions. ru_maxrss is in KiB on Linux.
+    """
+    end = get_rusage()
+    return {'user_cpu_s': round(sum(e.ru_utime - s.ru_utime for s, e in zip(start, end)), 3),
+            'sys_cpu_s': round(sum(e.ru_stime - s.ru_stime for s, e in zip(start, end)), 3),
+            'max_rss_mib': round(max(e.ru_maxrss for e in end) / 1024, 1)}
@@ -1,16 +1,31 @@
+import csv
+import json
 import logging
 import os
-from abc import ABC
+import time
+from abc import ABC, abstractmethod
 
 from .commands.biom_convert_cmd import BiomConvertCmd
 from .commands.export_cmd import ExportCmd
 from .commands.feature_classifier_cmd import FeatureClassifierCmd
+from .commands.feature_table_merge_cmd import FeatureTableMergeCmd
+from .commands.feature_table_merge_seqs_cmd import FeatureTableMergeSeqsCmd
 from .commands.feature_table_summarize_cmd import FeatureTableSummarizeCmd
+from .commands.import_cmd import ImportCmd
 from .commands.metadata_tabulate_cmd import MetadataTabulateCmd
+from .executors.executor_factory import ExecutorFactory
 from .pipeline_error import PipelineError
-import utils
+from .scheduler import DagScheduler
+from .step_cache import StepCache
+from .step_metrics import StepMetrics, get_total_size
+from .taxonomy_cache import TaxonomyCache, get_classifier_version
+from artifacts import biom_io, qza_reader
+from artifacts.artifact_error import ArtifactError
 from config import app_config
 from static.file_format import FileFormat
+from static.input_format import InputFormat
+from static.semantic_type import SemanticType
+from study import fastq_profiler
 
 
 class Pipeline(ABC):
@@ -20,7 +35,8 @@ class Pipeline(ABC):
 
     def __init__(self, study, logger_name):
         self.logger = logging.getLogger(logger_name)
-        
+        self.logger_name = logger_name
+
         # ID for the pipeline (same as study ID)
         self.id = study.id
 
@@ -54,9 +70,46 @@ class Pipeline(ABC):
         # Path for qza taxonomy results.
         self.qza_taxonomy_path = os.path.join(self.output_dir, f'{study.id}_taxonomy.qza')
 
+        # Path for tsv taxonomy results.
+        self.tsv_taxonomy_path = os.path.join(self.output_dir, 'taxonomy.tsv')
+
         # Path for qzv taxonomy results.
         self.qzv_taxonomy_path = os.path.join(self.output_dir, f'{study.id}_taxonomy.qzv')
 
+        # Path for the sequences that are missing in the taxonomy cache.
+        self.unclassified_seqs_path = os.path.join(self.output_dir, f'{study.id}_unclassified_seqs.fasta')
+
+        # Path for the taxonomy results of the sequences that are missing in the taxonomy cache.
+        self.unclassified_taxonomy_path = os.path.join(self.output_dir, f'{study.id}_unclassified_taxonomy.qza')
+
+        # Path for the taxonomy results assembled from the taxonomy cache.
+        self.cached_taxonomy_path = os.path.join(self.output_dir, f'{study.id}_cached_taxonomy.tsv')
+
+        # Path for the quality profile of the fastq files.
+        self.profile_path = os.path.join(self.output_dir, f'{study.id}_fastq_profile.json')
+
+        # Path for the wall time, resource usage and artifact sizes of each step.
+        self.metrics_path = os.path.join(self.output_dir, f'{study.id}_step_metrics.jsonl')
+
+        # Cache of taxonomy results shared by all studies.
+        self.taxonomy_cache = None
+        if app_config.taxonomy_cache_path:
+            self.taxonomy_cache = TaxonomyCache(path=app_config.taxonomy_cache_path,
+                                                max_entries=app_config.taxonomy_cache_max_entries)
+
+        # Read the results from the feature table and taxonomy artifacts instead of exporting them.
+        self.read_qza_directly = app_config.read_qza_directly and biom_io.is_available()
+
+        # Titles and groups of rows of the manifest file. Each group of samples is imported and denoised separately.
+        # There are no groups if the study is not sharded.
+        self.manifest_titles, self.shards = self.split_manifest()
+
+        # Commands to denoise the reads, one per shard.
+        self.denoise_cmds = []
+
+        # Commands that import and denoise the shards. They are retried on their own if they fail.
+        self.shard_cmds = set()
+
         # List of commands to be executed.
         self.commands = []
 
@@ -83,28 +136,129 @@ class Pipeline(ABC):
         return os.path.join(app_config.public_results_path, study.id)
 
     def get_feature_table_path(self):
+        if self.read_qza_directly:
+            return self.qza_table_path
         return self.tsv_table_path
 
     def get_taxonomy_results_path(self):
-        return os.path.join(self.output_dir, 'taxonomy.tsv')
+        if self.read_qza_directly:
+            return self.qza_taxonomy_path
+        return self.tsv_taxonomy_path
 
     def get_output_dir(self):
         return self.output_dir
 
+    def split_manifest(self):
+        """
+        Return the titles of the manifest file and its rows split into groups of denoise_shard_size samples. Return no
+        groups if sharding is disabled or the study has at most denoise_shard_size samples.
+        """
+        shard_size = app_config.denoise_shard_size
+        if not shard_size or self.manifest_path is None:
+            return None, []
+
+        try:
+            with open(self.manifest_path, 'r') as tsv_file:
+                titles, *rows = list(csv.reader(tsv_file, delimiter='\t'))
+        except (OSError, ValueError):
+            return None, []
+
+        if len(rows) <= shard_size:
+            return titles, []
+
+        return titles, [rows[i:i + shard_size] for i in range(0, len(rows), shard_size)]
+
+    def get_shard_path(self, shard, file_name):
+        """
+        Return the path of the given file of a shard.
+        """
+        return os.path.join(self.output_dir, f'{self.id}_shard{shard}_{file_name}')
+
+    def write_shard_manifests(self):
+        """
+        Write the manifest file of each shard.
+        """
+        for shard, rows in enumerate(self.shards):
+            with open(self.get_shard_path(shard, 'manifest.tsv'), 'w') as tsv_file:
+                tsv_writer = csv.writer(tsv_file, delimiter='\t')
+                tsv_writer.writerow(self.manifest_titles)
+                tsv_writer.writerows(rows)
+
+    @abstractmethod
+    def create_import_cmd(self, manifest_path, demux_path, msg):
+        """
+        Return a command that imports the reads in the given manifest file.
+        """
+        pass
+
+    @abstractmethod
+    def create_denoise_cmd(self, demux_path, table_path, rep_seqs_path, stats_path, n_threads, msg):
+        """
+        Return a command that denoises the given demultiplexed reads.
+        """
+        pass
+
+    def setup_unique_commands(self):
+        """
+        Generate the commands that import and denoise the reads and add them to the commands list. If the study is
+        sharded, each shard is imported and denoised separately and the results are merged.
+        """
+        if not self.shards:
+            self.commands.append(self.create_import_cmd(manifest_path=self.manifest_path,
+                                                        demux_path=self.demux_path,
+                                                        msg=f'{self.id} | Importing into Qiime2.'))
+            self.denoise_cmds.append(self.create_denoise_cmd(demux_path=self.demux_path,
+                                                             table_path=self.qza_table_path,
+                                                             rep_seqs_path=self.rep_seqs_path,
+                                                             stats_path=self.stats_path,
+                                                             n_threads=0,
+                                                             msg=f'{self.id} | Running DADA2.'))
+            self.commands.append(self.denoise_cmds[-1])
+            return
+
+        # Share the cores among the shards that are denoised at the same time.
+        n_shards = len(self.shards)
+        n_threads = max(1, (os.cpu_count() or 1) // min(n_shards, app_config.max_parallel_steps))
+
+        for shard in range(n_shards):
+            import_cmd = self.create_import_cmd(manifest_path=self.get_shard_path(shard, 'manifest.tsv'),
+                                                demux_path=self.get_shard_path(shard, 'demux.qza'),
+                                                msg=f'{self.id} | Importing shard {shard + 1}/{n_shards} into Qiime2.')
+            denoise_cmd = self.create_denoise_cmd(demux_path=self.get_shard_path(shard, 'demux.qza'),
+                                                  table_path=self.get_shard_path(shard, 'feature-table.qza'),
+                                                  rep_seqs_path=self.get_shard_path(shard, 'rep_seqs.qza'),
+                                                  stats_path=self.get_shard_path(shard, 'stats.qza'),
+                                                  n_threads=n_threads,
+                                                  msg=f'{self.id} | Running DADA2 on shard {shard + 1}/{n_shards}.')
+            self.commands.extend([import_cmd, denoise_cmd])
+            self.denoise_cmds.append(denoise_cmd)
+            self.shard_cmds.update([import_cmd, denoise_cmd])
+
+        self.commands.append(FeatureTableMergeCmd(input_path=' '.join(cmd.output_path for cmd in self.denoise_cmds),
+                                                  output_path=self.qza_table_path,
+                                                  msg=f'{self.id} | Merging the Feature Tables of the shards.'))
+        self.commands.append(FeatureTableMergeSeqsCmd(input_path=' '.join(cmd.rep_seqs_path
+                                                                          for cmd in self.denoise_cmds),
+                                                      output_path=self.rep_seqs_path,
+                                                      msg=f'{self.id} | Merging the Representative Sequences of '
+                                                          f'the shards.'))
+
     def setup_common_commands(self):
         """
         Populate the commands list with common commands.
         """
-        # Command to export a qza feature table in biom format.
-        self.commands.append(ExportCmd(input_path=self.qza_table_path,
-                                       output_path=self.output_dir,
-                                       msg=f'{self.id} | Exporting the Feature Table.'))
-
-        # Command to convert a biom feature table to tsv.
-        self.commands.append(BiomConvertCmd(input_path=self.biom_table_path,
-                                            output_path=self.tsv_table_path,
-                                            output_format=FileFormat.TSV,
-                                            msg=f'{self.id} | Converting the Feature Table to tsv.'))
+        # Commands to export a qza feature table in biom format and convert it to tsv. Not needed if the results are
+        # read from the artifacts.
+        if not self.read_qza_directly:
+            self.commands.append(ExportCmd(input_path=self.qza_table_path,
+                                           output_path=self.output_dir,
+                                           exported_paths=[self.biom_table_path],
+                                           msg=f'{self.id} | Exporting the Feature Table.'))
+
+            self.commands.append(BiomConvertCmd(input_path=self.biom_table_path,
+                                                output_path=self.tsv_table_path,
+                                                output_format=FileFormat.TSV,
+                                                msg=f'{self.id} | Converting the Feature Table to tsv.'))
 
         # Command to generate a qzv feature table.
         # self.commands.append(FeatureTableSummarizeCmd(input_path=self.qza_table_path,
@@ -123,9 +277,11 @@ class Pipeline(ABC):
                                                   msg=f'{self.id} | Running Taxonomy Analysis.'))
 
         # Command to export taxonomy analysis results.
-        self.commands.append(ExportCmd(input_path=self.qza_taxonomy_path,
-                                       output_path=self.output_dir,
-                                       msg=f'{self.id} | Exporting Taxonomy Analysis Results.'))
+        if not self.read_qza_directly:
+            self.commands.append(ExportCmd(input_path=self.qza_taxonomy_path,
+                                           output_path=self.output_dir,
+                                           exported_paths=[self.tsv_taxonomy_path],
+                                           msg=f'{self.id} | Exporting Taxonomy Analysis Results.'))
 
         # Command to generate a qzv for taxonomy results.
         # self.commands.append(MetadataTabulateCmd(input_path=self.qza_taxonomy_path,
@@ -134,13 +290,167 @@ class Pipeline(ABC):
 
     def execute(self):
         """
-        Run the Qiime2 pipeline.
+        Run the Qiime2 pipeline. Commands that don't depend on each other run concurrently. Steps that completed in a
+        previous run with the same inputs are skipped. Failed shards are retried on their own. The wall time, resource
+        usage and artifact sizes of each step are logged and appended to the metrics file.
         """
-        utils.create_dir(self.output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.write_shard_manifests()
+        self.prepare()
+        executor = ExecutorFactory.get_executor(app_config, self.logger_name)
+        step_cache = StepCache(self.output_dir)
+        step_metrics = StepMetrics(self.metrics_path, self.id, self.logger)
+
+        def run_step(command):
+            if step_cache.is_valid(command):
+                self.logger.debug(f'{command.get_msg()} Skipped, completed in a previous run.')
+                step_metrics.record(command, status='cached', wall_s=0)
+                return
 
-        for command in self.commands:
             self.logger.debug(command.get_msg())
-            return_code = utils.run_conda_command(cmd=str(command), conda_path=app_config.conda_path, env=app_config.env)
-            if return_code != 0:
-                raise PipelineError(msg='Pipeline error.', study_id=self.id)
+            step_cache.invalidate(command)
+            retries = app_config.shard_retries if command in self.shard_cmds else 0
+            input_bytes = get_total_size(command.get_inputs())
+            usage = {}
+            start_time = time.perf_counter()
+            for attempt in range(retries + 1):
+                try:
+                    self.run_command(executor, command, usage)
+                    break
+                except PipelineError:
+                    if attempt == retries:
+                        step_metrics.record(command, status='failed', wall_s=time.perf_counter() - start_time,
+                                            usage=usage, attempts=attempt + 1, input_bytes=input_bytes)
+                        raise
+                    self.logger.warning(f'{command.get_msg()} Failed, retrying.')
+            step_metrics.record(command, status='completed', wall_s=time.perf_counter() - start_time, usage=usage,
+                                attempts=attempt + 1, input_bytes=input_bytes)
+            step_cache.record(command)
+
+        DagScheduler(self.commands, run=run_step, max_parallel=app_config.max_parallel_steps).execute()
+
+    def prepare(self):
+        """
+        Adjust the commands before they are executed. Does nothing by default.
+        """
+        pass
+
+    def choose_denoise_positions(self):
+        """
+        Profile the fastq files in the manifest and return a (trim position, truncation position) pair for each read
+        direction. Paired reads are truncated so that they still span the amplicon. Save the profiles in the output
+        directory.
+        """
+        if self.manifest_path is None:
+            raise ValueError('Missing manifest file.')
+
+        with open(self.manifest_path, 'r') as tsv_file:
+            rows = list(csv.reader(tsv_file, delimiter='\t'))[1:]
+        directions = [list(paths) for paths in zip(*rows)][1:]
+
+        profiles = [fastq_profiler.profile_files(paths) for paths in directions]
+        if len(profiles) == 2:
+            positions = fastq_profiler.choose_paired_positions(*profiles, min_quality=app_config.truncation_quality,
+                                                               amplicon_length=app_config.amplicon_length)
+        else:
+            positions = [profile.choose_positions(min_quality=app_config.truncation_quality) for profile in profiles]
+
+        summaries = [{'trim_pos': trim_pos, 'trunc_pos': trunc_pos, **profile.to_dict()}
+                     for (trim_pos, trunc_pos), profile in zip(positions, profiles)]
+        with open(self.profile_path, 'w') as f:
+            json.dump({'truncation_quality': app_config.truncation_quality,
+                       'amplicon_length': app_config.amplicon_length,
+                       'directions': summaries}, f)
+
+        return positions
+
+    def run_command(self, executor, command, usage=None):
+        """
+        Execute a single command. Raise a PipelineError on error. If a usage dictionary is given, the resource usage of
+        the command is added to it.
+        """
+        if isinstance(command, FeatureClassifierCmd) and self.taxonomy_cache is not None:
+            self.classify_with_cache(executor, command, usage)
+            return
+
+        return_code = executor.execute(command, usage=usage)
+        if return_code != 0:
+            raise PipelineError(msg='Pipeline error.', study_id=self.id)
+
+    def classify_with_cache(self, executor, command, usage=None):
+        """
+        Run the taxonomy analysis only for the representative sequences that are missing in the taxonomy cache. Then
+        create the taxonomy artifact from the cached and the new results.
+        """
+        try:
+            features_to_seqs = qza_reader.read_sequences(command.input_path)
+        except (ArtifactError, OSError) as e:
+            raise PipelineError(msg=f'Pipeline error: {e}', study_id=self.id)
+
+        classifier_version = get_classifier_version(command.classifier_path)
+        params = f'confidence={command.confidence}'
+        seqs_to_taxa = self.taxonomy_cache.get_many(set(features_to_seqs.values()), classifier_version, params)
+
+        missing = {feature: seq for feature, seq in features_to_seqs.items() if seq not in seqs_to_taxa}
+        n_features = len(features_to_seqs)
+        self.logger.info(f'{self.id} | Taxonomy cache hits: {n_features - len(missing)}/{n_features} features.')
+
+        if missing:
+            self.classify_missing_seqs(executor, command, missing, seqs_to_taxa, classifier_version, params, usage)
+
+        # Assemble the taxonomy results and import them as the output of the command.
+        with open(self.cached_taxonomy_path, 'w') as tsv_file:
+            tsv_writer = csv.writer(tsv_file, delimiter='\t', lineterminator='\n')
+            tsv_writer.writerow(['Feature ID', 'Taxon', 'Confidence'])
+            for feature, seq in features_to_seqs.items():
+                tsv_writer.writerow([feature, *seqs_to_taxa[seq]])
+
+        self.run_command(executor, ImportCmd(input_type=SemanticType.FEATURE_TAXONOMY,
+                                             input_path=self.cached_taxonomy_path,
+                                             output_path=command.output_path,
+                                             input_format=InputFormat.TSV_TAXONOMY),
+                         usage)
+
+        stats = self.taxonomy_cache.get_stats()
+        self.logger.debug(f"{self.id} | Taxonomy cache hit rate: {stats['hit_rate']:.1%} over "
+                          f"{stats['hits'] + stats['misses']} lookups, {stats['entries']} entries.")
+
+    def classify_missing_seqs(self, executor, command, missing, seqs_to_taxa, classifier_version, params, usage=None):
+        """
+        Classify the given features that are missing in the taxonomy cache. Add the results to seqs_to_taxa and to the
+        cache.
+        """
+        with open(self.unclassified_seqs_path, 'w') as fasta_file:
+            for feature, seq in missing.items():
+                fasta_file.write(f'>{feature}\n{seq}\n')
+
+        seqs_path = os.path.splitext(self.unclassified_seqs_path)[0] + '.qza'
+        self.run_command(executor, ImportCmd(input_type=SemanticType.FEATURE_SEQUENCE,
+                                             input_path=self.unclassified_seqs_path,
+                                             output_path=seqs_path,
+                                             input_format=InputFormat.DNA_FASTA),
+                         usage)
+
+        return_code = executor.execute(FeatureClassifierCmd(input_path=seqs_path,
+                                                            classifier_path=command.classifier_path,
+                                                            output_path=self.unclassified_taxonomy_path,
+                                                            n_jobs=command.n_jobs,
+                                                            confidence=command.confidence),
+                                       usage=usage)
+        if return_code != 0:
+            raise PipelineError(msg='Pipeline error.', study_id=self.id)
+
+        try:
+            features_to_taxa = qza_reader.read_taxonomy(self.unclassified_taxonomy_path)
+        except (ArtifactError, OSError) as e:
+            raise PipelineError(msg=f'Pipeline error: {e}', study_id=self.id)
+
+        new_results = {}
+        for feature, seq in missing.items():
+            if feature not in features_to_taxa:
+                raise PipelineError(msg=f'Pipeline error: {feature} was not classified.', study_id=self.id)
+            new_results[seq] = features_to_taxa[feature]
+
+        self.taxonomy_cache.put_many(new_results, classifier_version, params)
+        seqs_to_taxa.update(new_results)
 
@@ -0,0 +1,64 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class DagScheduler:
+    """
+    Runs commands as a directed acyclic graph. A command depends on every earlier command that writes a file it reads,
+    reads a file it writes, or writes the same file. Independent commands run concurrently.
+    """
+
+    def __init__(self, commands, run, max_parallel=1):
+        self.commands = commands          # Commands in the order in which they were added to the pipeline.
+        self.run = run                    # Function that executes a single command. Raises an exception on error.
+        self.max_parallel = max_parallel  # Maximum number of commands that run at the same time.
+        self.dependencies = self.find_dependencies()
+
+    def find_dependencies(self):
+        """
+        Return a list that includes the set of indices of the commands that each command depends on.
+        """
+        dependencies = []
+        for i, command in enumerate(self.commands):
+            inputs = set(command.get_inputs())
+            outputs = set(command.get_outputs())
+            depends_on = set()
+            for j in range(i):
+                earlier_inputs = set(self.commands[j].get_inputs())
+                earlier_outputs = set(self.commands[j].get_outputs())
+                if earlier_outputs & inputs or earlier_outputs & outputs or earlier_inputs & outputs:
+                    depends_on.add(j)
+            dependencies.append(depends_on)
+
+        return dependencies
+
+    def execute(self):
+        """
+        Execute all commands. If a command fails, no new commands are started, the running commands are completed, and
+        the exception of the failed command is raised.
+        """
+        remaining = {i: set(depends_on) for i, depends_on in enumerate(self.dependencies)}
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            while remaining or running:
+                if error is None:
+                    ready = [i for i, depends_on in remaining.items() if not depends_on]
+                    for i in ready[:self.max_parallel - len(running)]:
+                        del remaining[i]
+                        running[pool.submit(self.run, self.commands[i])] = i
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    for depends_on in remaining.values():
+                        depends_on.discard(i)
+
+        if error is not None:
+            raise error
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+
+# Name of the file that records the completed steps in the output directory.
+STEP_CACHE_FILE_NAME = '.step_cache.json'
+
+
+class StepCache:
+    """
+    Records the completed steps of a pipeline in its output directory. A step is identified by its command line and
+    fingerprinted by the hashes of its input files. A completed step is valid while its fingerprint is unchanged and
+    its output files are unmodified, so a pipeline that is run again resumes from the first invalid or missing step.
+    """
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, STEP_CACHE_FILE_NAME)
+        self.lock = threading.Lock()  # Steps may complete concurrently.
+        self.steps = {}               # Maps step keys to their fingerprints and output files.
+        self.hashes = {}              # Maps file paths to their stats and content hashes.
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                contents = json.load(f)
+            self.steps = contents.get('steps', {})
+            self.hashes = contents.get('hashes', {})
+        except (OSError, ValueError):
+            self.steps = {}
+            self.hashes = {}
+
+    def save(self):
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'steps': self.steps, 'hashes': self.hashes}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_valid(self, command):
+        """
+        Return true if the given command completed before with the same inputs and its outputs are unmodified.
+        """
+        with self.lock:
+            step = self.steps.get(get_step_key(command))
+
+        if step is None or step['fingerprint'] != self.get_fingerprint(command):
+            return False
+
+        return all(get_stat(path) == stat for path, stat in step['outputs'].items())
+
+    def invalidate(self, command):
+        """
+        Forget the given command. Called before the command is executed.
+        """
+        with self.lock:
+            if self.steps.pop(get_step_key(command), None) is not None:
+                self.save()
+
+    def record(self, command):
+        """
+        Record the given command as completed.
+        """
+        fingerprint = self.get_fingerprint(command)
+        outputs = {path: get_stat(path) for path in command.get_outputs()}
+        with self.lock:
+            self.steps[get_step_key(command)] = {'fingerprint': fingerprint, 'outputs': outputs}
+            self.save()
+
+    def get_fingerprint(self, command):
+        """
+        Return the hash of the command line and the contents of its input files. Missing inputs are hashed as such.
+        """
+        digest = hashlib.sha256(get_step_key(command).encode())
+        for path in command.get_inputs():
+            digest.update(f'\0{path}\0{self.hash_file(path)}'.encode())
+        return digest.hexdigest()
+
+    def hash_file(self, path):
+        """
+        Return the SHA-256 of the file's contents. The hash is computed again only if the file's stat changes.
+        """
+        stat = get_stat(path)
+        if stat is None:
+            return 'missing'
+
+        with self.lock:
+            cached = self.hashes.get(path)
+        if cached is not None and cached['stat'] == stat:
+            return cached['hash']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        with self.lock:
+            self.hashes[path] = {'stat': stat, 'hash': digest.hexdigest()}
+
+        return digest.hexdigest()
+
+
+def get_step_key(command):
+    """
+    Return the key of the step that executes the given command, i.e. its normalized command line.
+    """
+    return ' '.join(str(command).split())
+
+
+def get_stat(path):
+    """
+    Return the size and modification time of the given file, or None if it doesn't exist or isn't a file.
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+
+    if not os.path.isfile(path):
+        return None
+
+    return [stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+
+import metrics
+
+# Fields of the resource usage of a step.
+USAGE_FIELDS = ('user_cpu_s', 'sys_cpu_s', 'max_rss_mib')
+
+
+class StepMetrics:
+    """
+    Records the wall time, resource usage and artifact sizes of the steps of a pipeline. Each step is logged with its
+    metrics as structured fields and appended to a JSON lines file in the output directory. Its wall time is also added
+    to the step duration histogram.
+    """
+
+    def __init__(self, path, study_id, logger):
+        self.path = path              # Path of the JSON lines file.
+        self.study_id = study_id
+        self.logger = logger
+        self.lock = threading.Lock()  # Steps may complete concurrently.
+
+    def record(self, command, status, wall_s, usage=None, attempts=1, input_bytes=None):
+        """
+        Log the metrics of the given command and append them to the metrics file. Return the record.
+        """
+        record = {'study_id': self.study_id,
+                  'step': get_step_name(command),
+                  'status': status,
+                  'attempts': attempts,
+                  'wall_s': round(wall_s, 3),
+                  **{field: None for field in USAGE_FIELDS},
+                  **(usage or {}),
+                  'input_bytes': get_total_size(command.get_inputs()) if input_bytes is None else input_bytes,
+                  'output_bytes': get_total_size(command.get_outputs())}
+
+        self.logger.info(f"{self.study_id} | Step {record['step']} {status} in {record['wall_s']}s.", extra=record)
+        if status != 'cached':
+            metrics.STEP_DURATION.observe(wall_s, step=record['step'], status=status)
+
+        with self.lock:
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+            except OSError as e:
+                self.logger.warning(f'{self.study_id} | Unable to write the step metrics: {e}')
+
+        return record
+
+
+def get_step_name(command):
+    """
+    Return the name of the step that executes the given command.
+    """
+    return command.action or type(command).__name__
+
+
+def get_total_size(paths):
+    """
+    Return the total size in bytes of the given files. Missing files are skipped.
+    """
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except (OSError, TypeError):
+            pass
+    return total
+
+
+def get_usage(rusage):
+    """
+    Return the resource usage of the given struct_rusage. ru_maxrss is in KiB on Linux.
+    """
+    return {'user_cpu_s': round(rusage.ru_utime, 3),
+            'sys_cpu_s': round(rusage.ru_stime, 3),
+            'max_rss_mib': round(rusage.ru_maxrss / 1024, 1)}
+
+
+def add_usage(usage, other):
+    """
+    Add the resource usage of another process to the given usage in place. CPU times are summed and the peak memory is
+    the larger of the two.
+    """
+    if usage is None or not other:
+        return
+    for field in ('user_cpu_s', 'sys_cpu_s'):
+        usage[field] = round((usage.get(field) or 0) + other.get(field, 0), 3)
+    usage['max_rss_mib'] = max(usage.get('max_rss_mib') or 0, other.get('max_rss_mib', 0))
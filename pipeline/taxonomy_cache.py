@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+from .executors.classifier_service import get_classifier_version as compute_classifier_version
+
+# Number of sequences looked up or inserted per statement.
+BATCH_SIZE = 500
+
+
+def hash_sequence(sequence):
+    """
+    Return the key of the given sequence in the cache.
+    """
+    return hashlib.sha1(sequence.upper().encode()).hexdigest()
+
+
+class TaxonomyCache:
+    """
+    Persistent cache that maps (sequence, classifier version, classification parameters) to taxonomy results, shared
+    by all studies. The least recently used entries are evicted once the cache holds more than max_entries entries.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path                # Path for the SQLite database.
+        self.max_entries = max_entries  # Maximum number of cached sequences.
+        self.create_tables()
+
+    def get_connection(self):
+        """
+        Return a connection to the cache. The cache may be shared by several processes.
+        """
+        connection = sqlite3.connect(self.path, timeout=60)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def create_tables(self):
+        with self.get_connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS taxonomy (
+                                      sequence_hash TEXT NOT NULL,
+                                      classifier_version TEXT NOT NULL,
+                                      params TEXT NOT NULL,
+                                      taxon TEXT NOT NULL,
+                                      confidence TEXT NOT NULL,
+                                      last_used REAL NOT NULL,
+                                      PRIMARY KEY (sequence_hash, classifier_version, params))""")
+            connection.execute('CREATE INDEX IF NOT EXISTS taxonomy_last_used ON taxonomy (last_used)')
+            connection.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        connection.close()
+
+    def get_many(self, sequences, classifier_version, params):
+        """
+        Return a dictionary that maps each cached sequence among the given sequences to a (taxon, confidence) tuple.
+        The hits and misses are added to the statistics of the cache.
+        """
+        hashes_to_sequences = {hash_sequence(sequence): sequence for sequence in sequences}
+        hashes = list(hashes_to_sequences)
+        results = {}
+
+        connection = self.get_connection()
+        try:
+            with connection:
+                for start in range(0, len(hashes), BATCH_SIZE):
+                    batch = hashes[start:start + BATCH_SIZE]
+                    placeholders = ','.join('?' * len(batch))
+                    rows = connection.execute(f"""SELECT sequence_hash, taxon, confidence FROM taxonomy
+                                                  WHERE classifier_version=? AND params=?
+                                                  AND sequence_hash IN ({placeholders})""",
+                                              [classifier_version, params, *batch])
+                    for sequence_hash, taxon, confidence in rows:
+                        results[hashes_to_sequences[sequence_hash]] = (taxon, confidence)
+
+                connection.executemany("""UPDATE taxonomy SET last_used=? WHERE sequence_hash=?
+                                          AND classifier_version=? AND params=?""",
+                                       [(time.time(), hash_sequence(sequence), classifier_version, params)
+                                        for sequence in results])
+                self.add_to_stats(connection, hits=len(results), misses=len(hashes) - len(results))
+        finally:
+            connection.close()
+
+        return results
+
+    def put_many(self, results, classifier_version, params):
+        """
+        Cache the given dictionary that maps sequences to (taxon, confidence) tuples and evict the least recently used
+        entries if the cache is full.
+        """
+        now = time.time()
+        rows = [(hash_sequence(sequence), classifier_version, params, taxon, str(confidence), now)
+                for sequence, (taxon, confidence) in results.items()]
+
+        connection = self.get_connection()
+        try:
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO taxonomy VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+                n_entries = connection.execute('SELECT COUNT(*) FROM taxonomy').fetchone()[0]
+                n_evicted = max(0, n_entries - self.max_entries)
+                if n_evicted:
+                    connection.execute("""DELETE FROM taxonomy WHERE rowid IN (
+                                              SELECT rowid FROM taxonomy ORDER BY last_used LIMIT ?)""", (n_evicted,))
+                    self.add_to_stats(connection, evictions=n_evicted)
+        finally:
+            connection.close()
+
+    def add_to_stats(self, connection, **counts):
+        connection.executemany("""INSERT INTO stats (name, value) VALUES (?, ?)
+                                  ON CONFLICT (name) DO UPDATE SET value = value + excluded.value""",
+                               list(counts.items()))
+
+    def get_stats(self):
+        """
+        Return the number of entries, hits, misses and evictions, and the hit rate of the cache.
+        """
+        connection = self.get_connection()
+        try:
+            stats = dict(connection.execute('SELECT name, value FROM stats').fetchall())
+            stats['entries'] = connection.execute('SELECT COUNT(*) FROM taxonomy').fetchone()[0]
+        finally:
+            connection.close()
+
+        for name in ('hits', 'misses', 'evictions'):
+            stats.setdefault(name, 0)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+
+        return stats
+
+
+# Maps (path, size, modification time) of classifier files to their versions.
+_classifier_versions = {}
+
+
+def get_classifier_version(classifier_path):
+    """
+    Return the version of the given classifier file. The version is computed once per file contents.
+    """
+    stat = os.stat(classifier_path)
+    key = (classifier_path, stat.st_size, stat.st_mtime_ns)
+    if key not in _classifier_versions:
+        _classifier_versions[key] = compute_classifier_version(classifier_path)
+
+    return _classifier_versions[key]
@@ -1,49 +1,456 @@
+import csv
+import functools
+import hashlib
+import json
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 
-from . import utils
-from .pipeline.commands.feature_table_merge_cmd import FeatureTableMergeCmd
-from .pipeline.commands.feature_table_merge_taxa_cmd import FeatureTableMergeTaxaCmd
-from .pipeline.commands.feature_table_summarize_cmd import FeatureTableSummarizeCmd
-from .pipeline.commands.taxa_bar_plot_cmd import TaxaBarPlotCmd
+import utils
+from artifacts import biom_io, feature_table_merge, qza_reader
+from artifacts.artifact_error import ArtifactError
+from config import app_config
+from pipeline.commands.feature_table_filter_samples_cmd import FeatureTableFilterSamplesCmd
+from pipeline.commands.feature_table_merge_cmd import FeatureTableMergeCmd
+from pipeline.commands.feature_table_merge_taxa_cmd import FeatureTableMergeTaxaCmd
+from pipeline.commands.feature_table_summarize_cmd import FeatureTableSummarizeCmd
+from pipeline.commands.import_cmd import ImportCmd
+from pipeline.commands.taxa_bar_plot_cmd import TaxaBarPlotCmd
+from pipeline.step_cache import get_stat
+from static.input_format import InputFormat
+from static.merge_engine import MergeEngine
+from static.semantic_type import SemanticType
 
+# Name of the file that records the studies included in the merged results.
+MANIFEST_FILE_NAME = 'merged_manifest.json'
 
-def run(studies, output_dir, env):
+# Name of the directory in which the partial results of a tree merge are cached.
+PARTIALS_DIR_NAME = 'merge_partials'
+
+
+class StudyResults:
     """
-    Extract file paths from the given studies and merge the results in the output directory.
+    Represents the feature table and taxonomy results of a processed study.
     """
-    # Path for the merged feature table qza file.
-    qza_table_path = os.path.join(output_dir, 'merged_feature_tables.qza')
 
-    # Path for the merged feature table qzv file.
-    qzv_table_path = os.path.join(output_dir, 'merged_feature_tables.qzv')
+    def __init__(self, study_id, feature_table_path, taxonomy_results_path):
+        self.id = study_id
+        self.feature_table_path = feature_table_path          # Path for the qza feature table.
+        self.taxonomy_results_path = taxonomy_results_path    # Path for the qza taxonomy results.
 
-    # Path for the merged taxonomy results qza file.
-    qza_taxonomy_path = os.path.join(output_dir, 'merged_taxonomy_results.qza')
 
-    # Path for the merged taxonomy bar plot.
-    taxonomy_bar_plot_path = os.path.join(output_dir, 'taxonomy_bar_plot.qzv')
+class QiimeMergeEngine:
+    """
+    Merges feature tables and taxonomy results with Qiime2 commands.
+    """
+
+    def __init__(self, execute):
+        self.execute = execute  # Function that executes a Qiime2 command. Raises a ValueError on error.
+
+    def merge_tables(self, input_paths, output_path, overlap_method='sum'):
+        """
+        Merge the given qza feature tables into a single qza feature table.
+        """
+        self.execute(FeatureTableMergeCmd(input_path=' '.join(input_paths), output_path=output_path,
+                                          overlap_method=overlap_method))
 
-    feature_table_paths = ''
-    taxonomy_results_paths = ''
+    def merge_taxonomies(self, input_paths, output_path):
+        """
+        Merge the given qza taxonomy results into a single qza.
+        """
+        self.execute(FeatureTableMergeTaxaCmd(input_path=' '.join(input_paths), output_path=output_path))
 
-    # Build paths for feature tables and taxonomy results.
-    for study in studies:
-        feature_table_paths += study.feature_table_path + ' '
-        taxonomy_results_paths += study.taxonomy_results_path + ' '
+    def remove_samples(self, input_path, sample_ids, output_path):
+        """
+        Write the given qza feature table without the given samples, and without the features that only occur in them,
+        to the output path.
+        """
+        sample_ids_path = f'{output_path}.samples.tsv'
+        with open(sample_ids_path, 'w') as tsv_file:
+            tsv_writer = csv.writer(tsv_file, delimiter='\t', lineterminator='\n')
+            tsv_writer.writerow(['sample-id'])
+            tsv_writer.writerows([sample_id] for sample_id in sample_ids)
 
-    # Generate the merged results.
-    merge_feature_tables(feature_table_paths, qza_table_path, env)
-    convert_feature_table(qza_table_path, qzv_table_path, env)
-    merge_taxonomy_results(taxonomy_results_paths, qza_taxonomy_path, env)
-    generate_taxonomy_bar_chart(qza_table_path, qza_taxonomy_path, taxonomy_bar_plot_path, env)
+        try:
+            self.execute(FeatureTableFilterSamplesCmd(input_path=input_path, sample_metadata=sample_ids_path,
+                                                      output_path=output_path, exclude_ids=True))
+        finally:
+            os.remove(sample_ids_path)
 
 
-def merge_feature_tables(feature_table_paths, qza_table_path, conda_path, env):
+class NativeMergeEngine(QiimeMergeEngine):
     """
-    Merge qza feature tables into a single qza feature table.
+    Merges feature tables and taxonomy results in this process. Tables are read from the artifacts as sparse matrices
+    and written as BIOM 2.1 HDF5 files, which are imported into new artifacts.
     """
-    command = FeatureTableMergeCmd(input_path=feature_table_paths, output_path=qza_table_path)
-    execute_conda_cmd(command, conda_path, env)
+
+    def merge_tables(self, input_paths, output_path, overlap_method='sum'):
+        tables = [read_feature_table(path) for path in input_paths]
+        self.import_table(feature_table_merge.merge_tables(tables, overlap_method), output_path)
+
+    def merge_taxonomies(self, input_paths, output_path):
+        taxonomies = [read_taxonomy(path) for path in input_paths]
+        import_taxonomy(feature_table_merge.merge_taxonomies(taxonomies), output_path, self.execute)
+
+    def remove_samples(self, input_path, sample_ids, output_path):
+        table = feature_table_merge.remove_samples(read_feature_table(input_path), set(sample_ids))
+        self.import_table(table, output_path)
+
+    def import_table(self, table, output_path):
+        """
+        Import the given SparseTable into a qza feature table at the output path.
+        """
+        biom_path = f'{os.path.splitext(output_path)[0]}.biom'
+        try:
+            biom_io.write_biom(table, biom_path)
+        except ArtifactError as e:
+            raise ValueError(str(e))
+
+        try:
+            self.execute(ImportCmd(input_type=SemanticType.FEATURE_TABLE_FREQUENCY, input_path=biom_path,
+                                   output_path=output_path, input_format=InputFormat.BIOM_V210))
+        finally:
+            os.remove(biom_path)
+
+
+class TreeMerger:
+    """
+    Merges the results of many studies by tree reduction. The results are split into batches of at most fan_in studies
+    that are merged in max_workers worker processes at a time. The partial results are merged the same way, level by
+    level. Each partial is cached under a key derived from its inputs, so a failed batch is retried on its own and a
+    later merge of the same inputs reuses the partials of the batches that succeeded.
+    """
+
+    def __init__(self, partials_dir, engine, fan_in=50, max_workers=1, retries=1):
+        self.partials_dir = partials_dir  # Directory of the cached partial results.
+        self.engine = engine              # Merges the feature tables and taxonomy results of a batch.
+        self.fan_in = fan_in              # Maximum number of results merged by one batch.
+        self.max_workers = max_workers    # Maximum number of batches merged at the same time.
+        self.retries = retries            # Number of times a failed batch is retried.
+
+    def reduce(self, inputs, max_inputs=None):
+        """
+        Merge the given (feature table path, taxonomy results path) pairs level by level until at most max_inputs
+        (fan_in by default) are left. Return the remaining pairs, in the order of their inputs. Raise a ValueError if a
+        batch cannot be merged.
+        """
+        max_inputs = max(1, max_inputs or self.fan_in)
+        if len(inputs) <= max_inputs:
+            return inputs
+
+        os.makedirs(self.partials_dir, exist_ok=True)
+        executor = ProcessPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+        try:
+            while len(inputs) > max_inputs:
+                batches = [inputs[i:i + self.fan_in] for i in range(0, len(inputs), self.fan_in)]
+                inputs = self.merge_level(batches, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return inputs
+
+    def merge_level(self, batches, executor):
+        """
+        Merge the given batches of results and return the partial result of each batch. Batches whose partial result
+        is cached are skipped.
+        """
+        outputs = [self.get_partial_paths(batch) for batch in batches]
+        pending = [(batch, output) for batch, output in zip(batches, outputs)
+                   if not all(os.path.isfile(path) for path in output)]
+
+        for _ in range(self.retries + 1):
+            if not pending:
+                break
+            errors = self.merge_batches(pending, executor)
+            failed = [(item, error) for item, error in zip(pending, errors) if error is not None]
+            pending = [item for item, _ in failed]
+
+        if pending:
+            raise ValueError(f'Unable to merge {len(pending)} of {len(batches)} batches: {failed[0][1]}')
+        return outputs
+
+    def merge_batches(self, batches, executor):
+        """
+        Merge the given (inputs, outputs) batches. Return the error of each batch, or None if it was merged.
+        """
+        if executor is None:
+            errors = []
+            for inputs, outputs in batches:
+                try:
+                    merge_batch(self.engine, inputs, outputs)
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(e)
+            return errors
+
+        futures = [executor.submit(merge_batch, self.engine, inputs, outputs) for inputs, outputs in batches]
+        return [future.exception() for future in futures]
+
+    def get_partial_paths(self, batch):
+        """
+        Return the paths of the partial feature table and taxonomy results of the given batch. They are named after
+        the paths, sizes and modification times of its inputs.
+        """
+        fingerprint = [[path, get_stat(path)] for pair in batch for path in pair]
+        key = hashlib.sha1(json.dumps(fingerprint).encode()).hexdigest()
+        return (os.path.join(self.partials_dir, f'{key}_feature_table.qza'),
+                os.path.join(self.partials_dir, f'{key}_taxonomy.qza'))
+
+    def clear(self):
+        """
+        Remove the cached partial results.
+        """
+        shutil.rmtree(self.partials_dir, ignore_errors=True)
+
+
+class MergedResults:
+    """
+    Represents the feature tables and taxonomy results of many studies merged into a single artifact each. A manifest
+    records the studies they include, so adding a study merges only its results into the existing artifacts and
+    removing a study filters its samples out of them. Adding many studies merges them by tree reduction first.
+    """
+
+    def __init__(self, output_dir, execute, engine=MergeEngine.QIIME, fan_in=50, max_workers=1, retries=1):
+        self.output_dir = output_dir
+        self.execute = execute  # Function that executes a Qiime2 command. Raises a ValueError on error.
+
+        # Merges the feature tables and taxonomy results.
+        if engine == MergeEngine.NATIVE:
+            self.engine = NativeMergeEngine(execute)
+        else:
+            self.engine = QiimeMergeEngine(execute)
+
+        # Merges the results of the added studies in batches.
+        self.tree_merger = TreeMerger(os.path.join(output_dir, PARTIALS_DIR_NAME), self.engine, fan_in=fan_in,
+                                      max_workers=max_workers, retries=retries)
+
+        # Path for the merged feature table qza file.
+        self.qza_table_path = os.path.join(output_dir, 'merged_feature_tables.qza')
+
+        # Path for the merged taxonomy results qza file.
+        self.qza_taxonomy_path = os.path.join(output_dir, 'merged_taxonomy_results.qza')
+
+        # Path for the manifest of the merged results.
+        self.manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+
+        # Maps the IDs of the merged studies to their result paths, fingerprints, and sample IDs.
+        self.studies = {}
+
+        self.load_manifest()
+
+    def load_manifest(self):
+        """
+        Load the manifest. The merged results are discarded if the manifest is missing or doesn't match them, e.g.
+        after an interrupted update.
+        """
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+            studies = manifest['studies']
+            is_valid = manifest['outputs'] == self.get_output_stats()
+        except (OSError, ValueError, KeyError, TypeError):
+            studies = {}
+            is_valid = False
+
+        if is_valid:
+            self.studies = studies
+            return
+
+        self.studies = {}
+        for path in (self.qza_table_path, self.qza_taxonomy_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save_manifest(self):
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'studies': self.studies, 'outputs': self.get_output_stats()}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def get_output_stats(self):
+        return {path: get_stat(path) for path in (self.qza_table_path, self.qza_taxonomy_path)}
+
+    def update(self, studies):
+        """
+        Update the merged results so that they include exactly the given studies. Studies whose results changed since
+        they were merged are removed and merged again. Return true if the merged results changed.
+        """
+        studies = {study.id: study for study in studies}
+        fingerprints = {study_id: get_fingerprint(study) for study_id, study in studies.items()}
+
+        removed = [study_id for study_id, entry in self.studies.items()
+                   if fingerprints.get(study_id) != entry['fingerprint']]
+        added = [study for study_id, study in studies.items()
+                 if study_id not in self.studies or study_id in removed]
+
+        if removed:
+            self.remove(removed)
+        if added:
+            self.add(added)
+
+        return bool(removed or added)
+
+    def add(self, studies):
+        """
+        Merge the results of the given studies into the merged results. Raise a ValueError if a sample of a study is
+        already included.
+        """
+        merged_samples = {sample_id for entry in self.studies.values() for sample_id in entry['samples']}
+        entries = {}
+        for study in studies:
+            sample_ids = list(read_feature_table(study.feature_table_path).sample_ids)
+            overlap = merged_samples.intersection(sample_ids)
+            if overlap:
+                raise ValueError(f'{study.id} | Samples are already merged: {", ".join(sorted(overlap))}')
+            merged_samples.update(sample_ids)
+            entries[study.id] = {'feature_table_path': study.feature_table_path,
+                                 'taxonomy_results_path': study.taxonomy_results_path,
+                                 'fingerprint': get_fingerprint(study),
+                                 'samples': sample_ids}
+
+        # The existing merged results are only merged with the reduced results of the added studies.
+        inputs = [(study.feature_table_path, study.taxonomy_results_path) for study in studies]
+        if self.studies:
+            inputs = self.tree_merger.reduce(inputs, max_inputs=self.tree_merger.fan_in - 1)
+            inputs.insert(0, (self.qza_table_path, self.qza_taxonomy_path))
+        else:
+            inputs = self.tree_merger.reduce(inputs)
+
+        merge_batch(self.engine, inputs, (self.qza_table_path, self.qza_taxonomy_path))
+        self.tree_merger.clear()
+
+        self.studies.update(entries)
+        self.save_manifest()
+
+    def remove(self, study_ids):
+        """
+        Filter the samples of the given studies out of the merged feature table and drop the taxonomy results of the
+        features that no longer occur in it.
+        """
+        remaining = {study_id: entry for study_id, entry in self.studies.items() if study_id not in study_ids}
+        if not remaining:
+            for path in (self.qza_table_path, self.qza_taxonomy_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.studies = {}
+            self.save_manifest()
+            return
+
+        sample_ids = [sample_id for study_id in study_ids for sample_id in self.studies[study_id]['samples']]
+        tmp_table_path = get_tmp_path(self.qza_table_path)
+        self.engine.remove_samples(self.qza_table_path, sample_ids, tmp_table_path)
+        tmp_taxonomy_path = get_tmp_path(self.qza_taxonomy_path)
+        self.filter_taxonomy(tmp_table_path, tmp_taxonomy_path)
+        os.replace(tmp_table_path, self.qza_table_path)
+        os.replace(tmp_taxonomy_path, self.qza_taxonomy_path)
+
+        self.studies = remaining
+        self.save_manifest()
+
+    def filter_taxonomy(self, qza_table_path, output_path):
+        """
+        Write the merged taxonomy results of the features in the given feature table to a new artifact.
+        """
+        feature_ids = set(read_feature_table(qza_table_path).feature_ids)
+        features_to_taxa = read_taxonomy(self.qza_taxonomy_path)
+        features_to_taxa = {feature_id: taxon for feature_id, taxon in features_to_taxa.items()
+                            if feature_id in feature_ids}
+        import_taxonomy(features_to_taxa, output_path, self.execute)
+
+
+def merge_batch(engine, inputs, outputs):
+    """
+    Merge the given (feature table path, taxonomy results path) pairs into the given pair of output paths with the
+    engine. The outputs are replaced only if both were merged. Raise a ValueError if a sample occurs in more than one
+    feature table.
+    """
+    table_path, taxonomy_path = outputs
+    tmp_table_path, tmp_taxonomy_path = get_tmp_path(table_path), get_tmp_path(taxonomy_path)
+    engine.merge_tables([pair[0] for pair in inputs], tmp_table_path, overlap_method='error_on_overlapping_sample')
+    engine.merge_taxonomies([pair[1] for pair in inputs], tmp_taxonomy_path)
+    os.replace(tmp_table_path, table_path)
+    os.replace(tmp_taxonomy_path, taxonomy_path)
+
+
+def get_tmp_path(path):
+    root, ext = os.path.splitext(path)
+    return f'{root}.tmp{ext}'
+
+
+def read_feature_table(qza_path):
+    """
+    Return the SparseTable in the given qza feature table. Raise a ValueError on error.
+    """
+    try:
+        return qza_reader.read_feature_table(qza_path)
+    except (ArtifactError, OSError) as e:
+        raise ValueError(f'Unable to read {qza_path}: {e}')
+
+
+def read_taxonomy(qza_path):
+    """
+    Return a dictionary that maps feature IDs to (taxon, confidence) tuples in the given qza taxonomy results. Raise a
+    ValueError on error.
+    """
+    try:
+        return qza_reader.read_taxonomy(qza_path)
+    except (ArtifactError, OSError) as e:
+        raise ValueError(f'Unable to read {qza_path}: {e}')
+
+
+def import_taxonomy(features_to_taxa, output_path, execute):
+    """
+    Import the given dictionary that maps feature IDs to (taxon, confidence) tuples into a qza at the output path.
+    """
+    tsv_taxonomy_path = f'{os.path.splitext(output_path)[0]}.tsv'
+    with open(tsv_taxonomy_path, 'w') as tsv_file:
+        tsv_writer = csv.writer(tsv_file, delimiter='\t', lineterminator='\n')
+        tsv_writer.writerow(['Feature ID', 'Taxon', 'Confidence'])
+        for feature_id, (taxon, confidence) in features_to_taxa.items():
+            tsv_writer.writerow([feature_id, taxon, confidence])
+
+    try:
+        execute(ImportCmd(input_type=SemanticType.FEATURE_TAXONOMY, input_path=tsv_taxonomy_path,
+                          output_path=output_path, input_format=InputFormat.TSV_TAXONOMY))
+    finally:
+        os.remove(tsv_taxonomy_path)
+
+
+def get_fingerprint(study):
+    """
+    Return the paths, sizes and modification times of the results of the given study.
+    """
+    return [[path, get_stat(path)] for path in (study.feature_table_path, study.taxonomy_results_path)]
+
+
+def run(studies, output_dir, conda_path, env, engine=None):
+    """
+    Update the merged results of the given studies in the output directory. Only the studies that were added, removed
+    or changed since the previous run are merged into or filtered out of the merged results. The results are merged in
+    this process by default if BIOM HDF5 files can be read and written, otherwise with Qiime2. The batch size and
+    concurrency of the tree merge are configured with merge_fan_in and merge_concurrency.
+    """
+    if engine is None:
+        engine = MergeEngine.NATIVE if biom_io.is_available() else MergeEngine.QIIME
+
+    # Path for the merged feature table qzv file.
+    qzv_table_path = os.path.join(output_dir, 'merged_feature_tables.qzv')
+
+    # Path for the merged taxonomy bar plot.
+    taxonomy_bar_plot_path = os.path.join(output_dir, 'taxonomy_bar_plot.qzv')
+
+    # The engine is sent to the worker processes of the tree merge, so it can't hold a lambda.
+    merged_results = MergedResults(output_dir, execute=functools.partial(execute_conda_cmd, conda_path=conda_path,
+                                                                         env=env),
+                                   engine=engine, fan_in=app_config.merge_fan_in,
+                                   max_workers=app_config.merge_concurrency, retries=app_config.merge_retries)
+    if not merged_results.update(studies) or not merged_results.studies:
+        return
+
+    # Generate the visualizations of the merged results.
+    convert_feature_table(merged_results.qza_table_path, qzv_table_path, conda_path, env)
+    generate_taxonomy_bar_chart(merged_results.qza_table_path, merged_results.qza_taxonomy_path,
+                                taxonomy_bar_plot_path, conda_path, env)
 
 
 def convert_feature_table(qza_table_path, qzv_table_path, conda_path, env):
@@ -62,14 +469,6 @@ def convert_feature_table(qza_table_path, qzv_table_path, conda_path, env):
     execute_shell_cmd(permission_cmd)
 
 
-def merge_taxonomy_results(taxonomy_results_paths, qza_taxonomy_path, conda_path, env):
-    """
-    Merge qza taxonomy results into a single qza.
-    """
-    command = FeatureTableMergeTaxaCmd(input_path=taxonomy_results_paths, output_path=qza_taxonomy_path)
-    execute_conda_cmd(command, conda_path, env)
-
-
 def generate_taxonomy_bar_chart(qza_table_path, qza_taxonomy_path, taxonomy_bar_plot_path, conda_path, env):
     """
     Create a taxonomy bar chart from the given feature table and taxonomy results qza files.
@@ -103,4 +502,4 @@ def execute_shell_cmd(cmd):
     """
     return_code = utils.run_command(cmd=cmd)
     if return_code != 0:
-        raise ValueError(f'Shell exited with return code {return_code}.')
\ No newline at end of file
+        raise ValueError(f'Shell exited with return code {return_code}.')
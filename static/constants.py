@@ -11,4 +11,10 @@ CLAIMED_MARKER = 'claimed.txt'
 COMPLETE_MARKER = 'complete.txt'
 
 # Sequencing file extensions
-SEQUENCING_EXT = 'fastq'
\ No newline at end of file
+SEQUENCING_EXT = ('fastq', 'fastq.gz')
+
+# Extension of uncompressed sequencing files
+UNCOMPRESSED_SEQUENCING_EXT = 'fastq'
+
+# File name for the processing options of a study.
+STUDY_OPTIONS_FILE = 'options.yaml'
\ No newline at end of file
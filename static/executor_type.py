@@ -0,0 +1,10 @@
+from enum import Enum
+
+
+class ExecutorType(str, Enum):
+    """
+    Represents the method used to execute Qiime2 commands.
+    """
+
+    CONDA = 'conda'
+    WORKER = 'worker'
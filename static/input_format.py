@@ -9,4 +9,7 @@ class InputFormat(str, Enum):
     SINGLE_PHRED_33 = 'SingleEndFastqManifestPhred33V2'
     PAIRED_PHRED_33 = 'PairedEndFastqManifestPhred33V2'
     SINGLE_PHRED_64 = 'SingleEndFastqManifestPhred64V2'
-    PAIRED_PHRED_64 = 'PairedEndFastqManifestPhred64V2'
\ No newline at end of file
+    PAIRED_PHRED_64 = 'PairedEndFastqManifestPhred64V2'
+    DNA_FASTA = 'DNAFASTAFormat'
+    TSV_TAXONOMY = 'TSVTaxonomyFormat'
+    BIOM_V210 = 'BIOMV210Format'
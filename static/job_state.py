@@ -0,0 +1,12 @@
+from enum import Enum
+
+
+class JobState(str, Enum):
+    """
+    Represents the state of a job in the jobs table.
+    """
+
+    QUEUED = 'queued'
+    CLAIMED = 'claimed'
+    DONE = 'done'
+    FAILED = 'failed'
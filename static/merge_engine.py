@@ -0,0 +1,10 @@
+from enum import Enum
+
+
+class MergeEngine(str, Enum):
+    """
+    Represents the method used to merge the results of studies.
+    """
+
+    QIIME = 'qiime'
+    NATIVE = 'native'
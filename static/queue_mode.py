@@ -0,0 +1,10 @@
+from enum import Enum
+
+
+class QueueMode(str, Enum):
+    """
+    Represents the method used to claim studies.
+    """
+
+    FILESYSTEM = 'filesystem'
+    DATABASE = 'database'
@@ -7,4 +7,7 @@ class SemanticType(str, Enum):
     """
 
     SD_PAIRED_QUALITY = 'SampleData[PairedEndSequencesWithQuality]'
-    SD_SINGLE_QUALITY = 'SampleData[SequencesWithQuality]'
\ No newline at end of file
+    SD_SINGLE_QUALITY = 'SampleData[SequencesWithQuality]'
+    FEATURE_SEQUENCE = 'FeatureData[Sequence]'
+    FEATURE_TAXONOMY = 'FeatureData[Taxonomy]'
+    FEATURE_TABLE_FREQUENCY = 'FeatureTable[Frequency]'
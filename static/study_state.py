@@ -0,0 +1,12 @@
+from enum import Enum
+
+
+class StudyState(str, Enum):
+    """
+    Represents the state of a study directory in the input path.
+    """
+
+    DOWNLOADING = 'downloading'
+    READY = 'ready'
+    CLAIMED = 'claimed'
+    ERROR = 'error'
@@ -0,0 +1,11 @@
+from enum import Enum
+
+
+class WatcherType(str, Enum):
+    """
+    Represents the method used to find studies in the input directory.
+    """
+
+    AUTO = 'auto'
+    INOTIFY = 'inotify'
+    POLL = 'poll'
@@ -0,0 +1,196 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from static import constants as const
+
+# Number of seconds a claim is valid unless it is renewed.
+DEFAULT_LEASE = 600
+
+
+class Claim:
+    """
+    Represents a lease on a study directory. The lease is recorded in the claimed marker together with the host, process
+    and a random token of its holder. The marker is created with O_CREAT | O_EXCL so only one process can claim a study.
+    The holder renews the lease with a heartbeat while the study is processed. A lease that was not renewed before it
+    expired can be reclaimed by any process. The marker counts the attempts to process the study across reclaims.
+    """
+
+    def __init__(self, directory, lease=DEFAULT_LEASE):
+        self.directory = directory                                  # Study directory.
+        self.path = os.path.join(directory, const.CLAIMED_MARKER)   # Path of the claimed marker.
+        self.lease = lease                                          # Number of seconds the claim is valid.
+        self.token = uuid.uuid4().hex                               # Identifies this claim.
+        self.expires_at = None                                      # Time at which the lease expires.
+        self.reclaimed = False                                      # True if an expired claim was taken over.
+        self.attempts = 1                                           # Number of times the study was claimed.
+        self.lost = False                                           # True if another process took over the claim.
+        self.heartbeat = None                                       # Thread that renews the lease.
+        self.stop_event = None                                      # Set when the heartbeat should stop.
+
+    def __getstate__(self):
+        # The heartbeat stays in the process that started it.
+        state = self.__dict__.copy()
+        state['heartbeat'] = None
+        state['stop_event'] = None
+        return state
+
+    def get_record(self):
+        """
+        Return the contents of the claimed marker.
+        """
+        return {'host': socket.gethostname(), 'pid': os.getpid(), 'token': self.token, 'expires_at': self.expires_at,
+                'attempts': self.attempts}
+
+    def acquire(self):
+        """
+        Create the claimed marker. Take over the claim of another process if its lease expired, counting one more
+        attempt. Return true if the study was claimed.
+        """
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            expired = self.remove_expired()
+            if expired is None:
+                return False
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                return False
+            self.reclaimed = True
+            # Markers written by older versions don't count the attempts.
+            attempts = expired.get('attempts', 1) if expired else 0
+            self.attempts = (attempts if isinstance(attempts, int) else 1) + 1
+
+        self.expires_at = time.time() + self.lease
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.get_record(), f)
+
+        return True
+
+    def remove_expired(self):
+        """
+        Remove the claimed marker if its lease expired. Return the record of the removed marker, an empty record if
+        the marker no longer exists, or None if it is still valid.
+        """
+        record = read_claim(self.path)
+        if record is None:
+            return {}
+        if record['expires_at'] > time.time():
+            return None
+
+        # Move the marker aside so that only one process removes it.
+        stale_path = f'{self.path}.{self.token}'
+        try:
+            os.rename(self.path, stale_path)
+        except FileNotFoundError:
+            return {}
+
+        try:
+            # Another process replaced the expired marker in the meantime. Put its marker back.
+            if read_claim(stale_path)['token'] != record['token']:
+                try:
+                    os.link(stale_path, self.path)
+                except FileExistsError:
+                    pass
+                return None
+        finally:
+            os.remove(stale_path)
+
+        return record
+
+    def is_held(self):
+        """
+        Return true if the claimed marker belongs to this claim.
+        """
+        record = read_claim(self.path)
+        return record is not None and record['token'] == self.token
+
+    def renew(self):
+        """
+        Extend the lease. Return false if the claim was taken over by another process.
+        """
+        if not self.is_held():
+            self.lost = True
+            return False
+
+        self.expires_at = time.time() + self.lease
+        temp_path = f'{self.path}.{self.token}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.get_record(), f)
+        os.replace(temp_path, self.path)
+
+        return True
+
+    def release(self):
+        """
+        Remove the claimed marker if it belongs to this claim.
+        """
+        self.stop_heartbeat()
+        try:
+            if self.is_held():
+                os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def start_heartbeat(self, on_lost=None):
+        """
+        Renew the lease in a background thread three times per lease. Call on_lost if the claim is taken over.
+        """
+        if self.heartbeat is not None:
+            return
+
+        self.stop_event = threading.Event()
+
+        def beat():
+            while not self.stop_event.wait(self.lease / 3):
+                try:
+                    renewed = self.renew()
+                except FileNotFoundError:
+                    # The study directory was removed.
+                    return
+                except OSError:
+                    # Try again on the next beat. The lease expires only if every beat fails.
+                    continue
+                if not renewed:
+                    if on_lost is not None:
+                        on_lost(self)
+                    return
+
+        self.heartbeat = threading.Thread(target=beat, name='claim-heartbeat', daemon=True)
+        self.heartbeat.start()
+
+    def stop_heartbeat(self):
+        """
+        Stop renewing the lease.
+        """
+        if self.heartbeat is None:
+            return
+        self.stop_event.set()
+        self.heartbeat.join()
+        self.heartbeat = None
+
+
+def read_claim(path):
+    """
+    Return the contents of the claimed marker at the given path, or None if it doesn't exist. A marker that is being
+    written or that was created by an older version expires the default lease after its modification time.
+    """
+    try:
+        with open(path, 'r') as f:
+            contents = f.read()
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+    try:
+        record = json.loads(contents)
+        if isinstance(record, dict) and isinstance(record.get('expires_at'), (int, float)):
+            return record
+    except ValueError:
+        pass
+
+    return {'host': None, 'pid': None, 'token': None, 'expires_at': mtime + DEFAULT_LEASE, 'attempts': 1}
@@ -0,0 +1,75 @@
+import gzip
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+# Gzip compression level. Qiime2 decompresses the reads anyway, so the fastest level is used.
+COMPRESSION_LEVEL = 1
+
+# Number of bytes copied at once while compressing a file.
+BLOCK_SIZE = 1024 * 1024
+
+
+def compress_files(paths, level=COMPRESSION_LEVEL, max_workers=None):
+    """
+    Compress the given fastq files with gzip using all cores and remove the originals. Return the paths of the
+    compressed files. pigz compresses one file at a time with all cores if it is installed. Otherwise, the files are
+    compressed in parallel by a process pool.
+    """
+    if not paths:
+        return []
+
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if shutil.which('pigz'):
+        return [compress_file_with_pigz(path, level, max_workers) for path in paths]
+
+    max_workers = min(len(paths), max_workers)
+    if max_workers == 1:
+        return [compress_file(path, level) for path in paths]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(compress_file, paths, [level] * len(paths)))
+
+
+def compress_file(path, level=COMPRESSION_LEVEL):
+    """
+    Compress the given file with gzip and remove the original. Return the path of the compressed file.
+    """
+    gz_path = f'{path}.gz'
+    tmp_path = f'{gz_path}.tmp'
+
+    # The name and modification time are left out of the header so that the output only depends on the contents.
+    with open(path, 'rb') as src, open(tmp_path, 'wb') as raw_dst:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=raw_dst, compresslevel=level, mtime=0) as dst:
+            shutil.copyfileobj(src, dst, BLOCK_SIZE)
+
+    return replace_original(path, tmp_path, gz_path)
+
+
+def compress_file_with_pigz(path, level, n_threads):
+    """
+    Compress the given file with pigz using n_threads threads and remove the original. Return the path of the
+    compressed file.
+    """
+    gz_path = f'{path}.gz'
+    tmp_path = f'{gz_path}.tmp'
+
+    with open(tmp_path, 'wb') as dst:
+        process = subprocess.run(['pigz', '--no-name', f'-{level}', '--processes', str(n_threads), '--stdout', path],
+                                 stdout=dst)
+    if process.returncode != 0:
+        os.remove(tmp_path)
+        raise OSError(f'Unable to compress {path}.')
+
+    return replace_original(path, tmp_path, gz_path)
+
+
+def replace_original(path, tmp_path, gz_path):
+    """
+    Move the compressed file to its final path and remove the original file.
+    """
+    os.replace(tmp_path, gz_path)
+    os.remove(path)
+    return gz_path
@@ -0,0 +1,266 @@
+import gzip
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Offset of the Phred+33 quality encoding.
+PHRED_OFFSET = 33
+
+# Number of distinct quality scores that are counted. Higher scores are counted as the highest one.
+N_SCORES = 64
+
+# Number of reads whose quality strings are decoded at once.
+CHUNK_READS = 2000
+
+# Number of bytes that are searched for line breaks at once.
+SCAN_BYTES = 8 * 1024 * 1024
+
+# Number of decompressed bytes of a gzip-compressed fastq file that are profiled at once.
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Quantiles of the quality scores that are reported for each position.
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Fraction of the reads that must be at least as long as the truncation position. DADA2 discards shorter reads.
+MIN_READ_FRACTION = 0.9
+
+# Reads are never truncated to less than this fraction of their length so that paired reads can still be merged.
+MIN_TRUNC_FRACTION = 0.5
+
+# Minimum number of bases by which DADA2 requires the forward and reverse reads to overlap to merge them.
+MIN_MERGE_OVERLAP = 12
+
+
+class FastqProfile:
+    """
+    Represents the read length and per-position quality score distributions of one or more fastq files.
+    """
+
+    def __init__(self, n_reads=0, length_counts=None, quality_counts=None):
+        self.n_reads = n_reads  # Number of reads.
+        # Number of reads of each length.
+        self.length_counts = np.zeros(0, dtype=np.int64) if length_counts is None else length_counts
+        # Number of bases of each quality score at each position, one row per position.
+        self.quality_counts = np.zeros((0, N_SCORES), dtype=np.int64) if quality_counts is None else quality_counts
+
+    def merge(self, other):
+        """
+        Return the profile of the reads in both profiles.
+        """
+        length_counts = np.zeros(max(len(self.length_counts), len(other.length_counts)), dtype=np.int64)
+        length_counts[:len(self.length_counts)] += self.length_counts
+        length_counts[:len(other.length_counts)] += other.length_counts
+
+        quality_counts = np.zeros((max(len(self.quality_counts), len(other.quality_counts)), N_SCORES), dtype=np.int64)
+        quality_counts[:len(self.quality_counts)] += self.quality_counts
+        quality_counts[:len(other.quality_counts)] += other.quality_counts
+
+        return FastqProfile(self.n_reads + other.n_reads, length_counts, quality_counts)
+
+    def get_quality_quantile(self, q):
+        """
+        Return an array with the given quantile of the quality scores at each position.
+        """
+        totals = self.quality_counts.sum(axis=1)
+        cumulative = np.cumsum(self.quality_counts, axis=1)
+        # Index of the first score whose cumulative count reaches the quantile.
+        quantiles = (cumulative < (q * totals)[:, None]).sum(axis=1)
+        return np.minimum(quantiles, N_SCORES - 1)
+
+    def get_length_quantile(self, q):
+        """
+        Return the read length below which the given fraction of the reads fall.
+        """
+        if self.n_reads == 0:
+            return 0
+        cumulative = np.cumsum(self.length_counts)
+        return int(np.searchsorted(cumulative, q * self.n_reads))
+
+    def choose_positions(self, min_quality):
+        """
+        Return the trim and truncation positions for DADA2. Leading positions whose median quality is below min_quality
+        are trimmed. Reads are truncated at the first position after them whose median quality is below min_quality, or
+        not truncated (0) if there is no such position. The truncation position is lowered so that most reads are kept.
+        """
+        if self.n_reads == 0:
+            return 0, 0
+
+        medians = self.get_quality_quantile(0.5)
+        is_good = medians >= min_quality
+        if not is_good.any():
+            return 0, 0
+
+        trim_pos = int(np.argmax(is_good))
+        bad_positions = np.flatnonzero(~is_good[trim_pos:])
+        if not len(bad_positions):
+            return trim_pos, 0
+
+        min_length = self.get_length_quantile(1 - MIN_READ_FRACTION)
+        trunc_pos = min(trim_pos + int(bad_positions[0]), min_length)
+        trunc_pos = max(trunc_pos, int(MIN_TRUNC_FRACTION * min_length))
+        if trunc_pos <= trim_pos:
+            return 0, 0
+
+        return trim_pos, trunc_pos
+
+    def to_dict(self):
+        """
+        Return a summary of the profile that can be serialized to JSON.
+        """
+        positions = {f'q{int(q * 100)}': self.get_quality_quantile(q).tolist() for q in QUANTILES}
+        lengths = np.flatnonzero(self.length_counts)
+        return {'n_reads': self.n_reads,
+                'min_length': int(lengths[0]) if len(lengths) else 0,
+                'max_length': int(lengths[-1]) if len(lengths) else 0,
+                'mean_length': float(np.dot(np.arange(len(self.length_counts)), self.length_counts) /
+                                     self.n_reads) if self.n_reads else 0.0,
+                'length_quantiles': {f'q{int(q * 100)}': self.get_length_quantile(q) for q in QUANTILES},
+                'quality_quantiles': positions}
+
+
+def choose_paired_positions(fwd_profile, rev_profile, min_quality, amplicon_length=None):
+    """
+    Return the (trim position, truncation position) pairs of the forward and reverse reads. Each direction is chosen
+    with choose_positions. If the amplicon length is given, the truncation positions are raised so that the truncated
+    reads still span the amplicon with an overlap of MIN_MERGE_OVERLAP bases. The reads are not truncated if that isn't
+    possible.
+    """
+    positions = [fwd_profile.choose_positions(min_quality), rev_profile.choose_positions(min_quality)]
+    if amplicon_length is None:
+        return positions
+
+    # Truncated reads are trunc_pos bases long. Most reads are at least max_length bases long.
+    max_lengths = [profile.get_length_quantile(1 - MIN_READ_FRACTION) for profile in (fwd_profile, rev_profile)]
+    lengths = [trunc_pos or max_length for (_, trunc_pos), max_length in zip(positions, max_lengths)]
+    deficit = amplicon_length + MIN_MERGE_OVERLAP - sum(lengths)
+    if deficit <= 0:
+        return positions
+
+    headroom = [max(0, max_length - length) if trunc_pos else 0
+                for (_, trunc_pos), max_length, length in zip(positions, max_lengths, lengths)]
+    if sum(headroom) < deficit:
+        return [(trim_pos, 0) for trim_pos, _ in positions]
+
+    # Split the deficit evenly unless one direction can't take its half.
+    fwd_raise = min(headroom[0], max(deficit - headroom[1], (deficit + 1) // 2))
+    raises = [fwd_raise, deficit - fwd_raise]
+    return [(trim_pos, trunc_pos + raise_by if trunc_pos else 0)
+            for (trim_pos, trunc_pos), raise_by in zip(positions, raises)]
+
+
+def profile_fastq(path, chunk_reads=CHUNK_READS):
+    """
+    Return the profile of the given fastq file. The file is memory-mapped and its quality strings are decoded in chunks
+    of reads. Gzip-compressed files are decompressed in blocks instead.
+    """
+    if path.endswith('.gz'):
+        return profile_gzip(path, chunk_reads)
+
+    if os.path.getsize(path) == 0:
+        return FastqProfile()
+
+    return profile_buffer(np.memmap(path, dtype=np.uint8, mode='r'), chunk_reads)
+
+
+def profile_gzip(path, chunk_reads=CHUNK_READS, block_size=BLOCK_SIZE):
+    """
+    Return the profile of the given gzip-compressed fastq file. Only complete records of each decompressed block are
+    profiled, the rest is carried over to the next block.
+    """
+    profile = FastqProfile()
+    leftover = b''
+
+    with gzip.open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            data = np.frombuffer(leftover + block, dtype=np.uint8)
+            line_ends = np.flatnonzero(data == ord('\n'))
+            n_records = len(line_ends) // 4
+            if n_records == 0:
+                leftover = data.tobytes()
+                continue
+            end = line_ends[4 * n_records - 1] + 1
+            profile = profile.merge(profile_buffer(data[:end], chunk_reads))
+            leftover = data[end:].tobytes()
+
+    if leftover:
+        profile = profile.merge(profile_buffer(np.frombuffer(leftover, dtype=np.uint8), chunk_reads))
+
+    return profile
+
+
+def profile_buffer(data, chunk_reads=CHUNK_READS):
+    """
+    Return the profile of the fastq records in the given byte array.
+    """
+    line_ends = find_line_ends(data)
+    if len(data) and data[-1] != ord('\n'):
+        line_ends = np.append(line_ends, len(data))
+
+    n_reads = len(line_ends) // 4
+    profile = FastqProfile()
+
+    for first in range(0, n_reads, chunk_reads):
+        last = min(first + chunk_reads, n_reads)
+        # The quality string is the fourth line of each record.
+        starts = line_ends[4 * first + 2:4 * last + 2:4] + 1
+        ends = line_ends[4 * first + 3:4 * last + 3:4]
+        ends = ends - (data[ends - 1] == ord('\r'))
+        profile = profile.merge(count_qualities(data, starts, ends))
+
+    return profile
+
+
+def find_line_ends(data):
+    """
+    Return the indices of the line breaks in the given byte array. The array is searched in blocks so that the
+    temporary arrays stay small.
+    """
+    blocks = [np.flatnonzero(data[start:start + SCAN_BYTES] == ord('\n')) + start
+              for start in range(0, len(data), SCAN_BYTES)]
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.int64)
+
+
+def count_qualities(data, starts, ends):
+    """
+    Return the profile of the quality strings that span data[starts[i]:ends[i]].
+    """
+    lengths = ends - starts
+    max_length = int(lengths.max()) if len(lengths) else 0
+
+    # Position of each quality byte within its read.
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.arange(offsets.size) - offsets
+    scores = data[np.repeat(starts, lengths) + positions].astype(np.int64) - PHRED_OFFSET
+    scores = np.clip(scores, 0, N_SCORES - 1)
+
+    quality_counts = np.bincount(positions * N_SCORES + scores, minlength=max_length * N_SCORES)
+    length_counts = np.bincount(lengths, minlength=max_length + 1)
+
+    return FastqProfile(n_reads=len(lengths),
+                        length_counts=length_counts.astype(np.int64),
+                        quality_counts=quality_counts.reshape(max_length, N_SCORES).astype(np.int64))
+
+
+def profile_files(paths, max_workers=None):
+    """
+    Return the merged profile of the given fastq files. The files are profiled in parallel.
+    """
+    profile = FastqProfile()
+    if not paths:
+        return profile
+
+    max_workers = min(len(paths), max_workers or os.cpu_count() or 1)
+    if max_workers == 1:
+        for file_profile in map(profile_fastq, paths):
+            profile = profile.merge(file_profile)
+        return profile
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for file_profile in executor.map(profile_fastq, paths):
+            profile = profile.merge(file_profile)
+
+    return profile
@@ -0,0 +1,164 @@
+import gzip
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Number of bytes read at once while counting and writing records.
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Gzip compression level of the subsampled files.
+COMPRESSION_LEVEL = 1
+
+
+def subsample_samples(samples_to_files, max_reads, seed, output_dir, max_workers=None):
+    """
+    Cap the number of reads of each sample at max_reads. Return a dictionary that maps each sample to its subsampled
+    fastq files in the output directory, or to its original files if it has at most max_reads reads. Samples are
+    subsampled in parallel.
+    """
+    if not samples_to_files:
+        return {}
+
+    os.makedirs(output_dir, exist_ok=True)
+    samples = list(samples_to_files)
+    args = [(samples_to_files[sample], max_reads, get_sample_seed(seed, sample), output_dir) for sample in samples]
+
+    max_workers = min(len(samples), max_workers or os.cpu_count() or 1)
+    if max_workers == 1:
+        results = [subsample_sample(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(subsample_sample, *zip(*args)))
+
+    return dict(zip(samples, results))
+
+
+def subsample_sample(paths, max_reads, seed, output_dir):
+    """
+    Select max_reads reads of a sample uniformly at random and write them to the output directory. The same reads are
+    selected from the forward and reverse files of paired-end samples. Return the paths of the written files, or the
+    given paths if the sample has at most max_reads reads. Raise a ValueError if the paired files include different
+    numbers of reads.
+    """
+    counts = {count_records(path) for path in paths}
+    if len(counts) != 1:
+        raise ValueError(f'Paired files include different numbers of reads: {", ".join(paths)}')
+
+    n_reads = counts.pop()
+    if n_reads <= max_reads:
+        return list(paths)
+
+    indices = select_indices(n_reads, max_reads, np.random.default_rng(seed))
+
+    output_paths = []
+    for path in paths:
+        file_name = os.path.basename(path)
+        if not file_name.endswith('.gz'):
+            file_name += '.gz'
+        output_path = os.path.join(output_dir, file_name)
+        write_records(path, output_path, indices)
+        output_paths.append(output_path)
+
+    return output_paths
+
+
+def get_sample_seed(seed, sample):
+    """
+    Return the seed of the given sample so that the selection of each sample is reproducible and independent.
+    """
+    return zlib.crc32(f'{seed}:{sample}'.encode())
+
+
+def open_fastq(path):
+    """
+    Open the given fastq file for reading in binary mode. Gzip-compressed files are decompressed.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def count_records(path):
+    """
+    Return the number of records in the given fastq file.
+    """
+    n_lines = 0
+    last = b'\n'
+    with open_fastq(path) as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            n_lines += block.count(b'\n')
+            last = block[-1:]
+
+    # The last line may not end with a newline.
+    if last != b'\n':
+        n_lines += 1
+
+    return n_lines // 4
+
+
+def select_indices(n, k, rng):
+    """
+    Return a sorted array of k distinct record indices sampled uniformly from range(n) with reservoir sampling
+    (Algorithm L). Only O(k * (1 + log(n / k))) random numbers are drawn.
+    """
+    reservoir = np.arange(k, dtype=np.int64)
+    if n <= k:
+        return reservoir[:n]
+
+    w = np.exp(np.log(rng.random()) / k)
+    i = k - 1
+    while True:
+        i += int(np.floor(np.log(rng.random()) / np.log(1 - w))) + 1
+        if i >= n:
+            break
+        reservoir[rng.integers(k)] = i
+        w *= np.exp(np.log(rng.random()) / k)
+
+    reservoir.sort()
+    return reservoir
+
+
+def write_records(path, output_path, indices):
+    """
+    Write the records of the given fastq file whose indices are in the sorted indices array to a gzip-compressed file.
+    """
+    tmp_path = f'{output_path}.tmp'
+    first_record = 0
+    leftover = b''
+
+    with open_fastq(path) as src, open(tmp_path, 'wb') as raw_dst:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=raw_dst, compresslevel=COMPRESSION_LEVEL, mtime=0) as dst:
+            while True:
+                block = src.read(BLOCK_SIZE)
+                if not block and not leftover:
+                    break
+
+                data = leftover + block
+                if not block and not data.endswith(b'\n'):
+                    data += b'\n'
+
+                line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+                n_records = len(line_ends) // 4
+                if n_records == 0 and block:
+                    leftover = data
+                    continue
+
+                # Byte ranges of the complete records in this block.
+                record_ends = line_ends[3::4][:n_records] + 1
+                record_starts = np.concatenate(([0], record_ends[:-1]))
+
+                lo, hi = np.searchsorted(indices, [first_record, first_record + n_records])
+                for i in indices[lo:hi] - first_record:
+                    dst.write(data[record_starts[i]:record_ends[i]])
+
+                first_record += n_records
+                leftover = data[record_ends[-1]:] if n_records else b''
+                if not block:
+                    break
+
+    os.replace(tmp_path, output_path)
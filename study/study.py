@@ -1,13 +1,24 @@
 import csv
 import os
 
+import yaml
+
 import utils
+from config import app_config
 from database_manager.db_error import DBError
 from database_manager.db_manager import db_manager
 from static import constants as const
 from static.layout import Layout
+from static.study_state import StudyState
+from . import fastq_compressor, fastq_subsampler
 from .invalid_study_error import InvalidStudyError
 
+# Name of the directory in the study directory for the subsampled fastq files.
+SUBSAMPLED_DIR = 'subsampled'
+
+# Key of the per-study option that caps the number of reads per sample.
+MAX_READS_PER_SAMPLE = 'max_reads_per_sample'
+
 # Define titles for the manifest file.
 MANIFEST_TITLES = {Layout.SINGLE: ['sample-id', 'absolute-filepath'],
                    Layout.PAIRED: ['sample-id', 'forward-absolute-filepath', 'reverse-absolute-filepath']}
@@ -44,9 +55,27 @@ class Study:
         except DBError:
             raise InvalidStudyError(msg='Unable to identify the sequencing layout type!', study_id=self.id)
 
+        # Map samples to fastq file paths.
+        samples_to_files = self.map_samples_to_files()
+
+        # Cap the number of reads per sample.
+        try:
+            max_reads_per_sample = self.get_max_reads_per_sample()
+            if max_reads_per_sample:
+                samples_to_files = self.subsample(samples_to_files, max_reads_per_sample)
+        except (OSError, ValueError) as e:
+            raise InvalidStudyError(msg=f'Unable to subsample the reads! {e}', study_id=self.id)
+
+        # Compress the fastq files that arrived uncompressed.
+        if app_config.compress_fastq:
+            try:
+                samples_to_files = self.compress_sequencing_files(samples_to_files)
+            except OSError:
+                raise InvalidStudyError(msg='Unable to compress the fastq files!', study_id=self.id)
+
         # Generate the manifest file.
         try:
-            self.manifest_path = self.generate_manifest_file()
+            self.manifest_path = self.generate_manifest_file(samples_to_files)
         except FileNotFoundError:
             raise InvalidStudyError(msg='Unable to generate manifest file!', study_id=self.id)
 
@@ -108,12 +137,18 @@ class Study:
         samples_to_files = {}
 
         # Get fastq file paths in the parent directory
-        file_paths = utils.get_file_paths(self.parent_dir, ext='fastq')
+        file_paths = utils.get_file_paths(self.parent_dir, ext=const.SEQUENCING_EXT)
+
+        # Skip the subsampled files of a previous run.
+        subsampled_dir = os.path.join(self.parent_dir, SUBSAMPLED_DIR)
 
         # Iterate over each file and populate the samples_to_files dictionary.
         for file_path in file_paths:
             file_name = os.path.basename(file_path)
 
+            if os.path.dirname(file_path) == subsampled_dir:
+                continue
+
             # Skip the file if the file name has no underscores and the layout is paired.
             if '_' not in file_name and self.layout == Layout.PAIRED:
                 continue
@@ -128,13 +163,56 @@ class Study:
 
         return samples_to_files
 
-    def generate_manifest_file(self):
+    def get_max_reads_per_sample(self):
+        """
+        Return the maximum number of reads per sample from the options file of the study, or from the configuration if
+        the study has no such option. Return None if the reads are not capped. Raise a ValueError if the option is
+        invalid.
+        """
+        options = {}
+        options_path = os.path.join(self.parent_dir, const.STUDY_OPTIONS_FILE)
+        if os.path.isfile(options_path):
+            with open(options_path, 'r') as yaml_file:
+                options = yaml.safe_load(yaml_file) or {}
+
+        max_reads_per_sample = options.get(MAX_READS_PER_SAMPLE, app_config.max_reads_per_sample)
+        if max_reads_per_sample is not None and (not isinstance(max_reads_per_sample, int) or max_reads_per_sample < 1):
+            raise ValueError(f'Invalid maximum number of reads per sample: {max_reads_per_sample}')
+
+        return max_reads_per_sample
+
+    def subsample(self, samples_to_files, max_reads_per_sample):
+        """
+        Subsample the samples that include more than max_reads_per_sample reads. Return a dictionary that maps each
+        sample to its subsampled or original fastq file paths.
+        """
+        n_reads = 1 if self.layout == Layout.SINGLE else 2
+        complete = {sample: files for sample, files in samples_to_files.items() if len(files) == n_reads}
+        return fastq_subsampler.subsample_samples(samples_to_files=complete,
+                                                  max_reads=max_reads_per_sample,
+                                                  seed=app_config.subsample_seed,
+                                                  output_dir=os.path.join(self.parent_dir, SUBSAMPLED_DIR))
+
+    def compress_sequencing_files(self, samples_to_files):
+        """
+        Compress the uncompressed fastq files of the samples with gzip using all cores. Return a dictionary that maps
+        each sample to its compressed fastq file paths. Raise an OSError if a file cannot be compressed.
+        """
+        file_paths = [path for paths in samples_to_files.values() for path in paths
+                      if path.endswith(const.UNCOMPRESSED_SEQUENCING_EXT)]
+        compressed_paths = dict(zip(file_paths, fastq_compressor.compress_files(file_paths)))
+
+        return {sample: [compressed_paths.get(path, path) for path in paths]
+                for sample, paths in samples_to_files.items()}
+
+    def generate_manifest_file(self, samples_to_files=None):
         """
         Generate a manifest file that maps samples to fastq file paths. Raise a FileNotFoundError if samples cannot
         be mapped to fastq files.
         """
         # Map samples to fastq file paths.
-        samples_to_files = self.map_samples_to_files()
+        if samples_to_files is None:
+            samples_to_files = self.map_samples_to_files()
 
         if not samples_to_files:
             raise FileNotFoundError
@@ -158,23 +236,38 @@ class Study:
         return manifest_path
 
     @staticmethod
-    def is_ready_for_processing(file_names):
+    def get_state(file_names):
         """
-        Check if the given list of file names include a sequencing file, a complete marker file and doesn't include
-        claimed marker or error marker files. If so then return true. Otherwise, return false.
+        Return the state of a study directory that includes the given list of file names. A study is ready when it
+        includes a sequencing file and a complete marker file but no claimed marker or error marker files. An error marker
+        takes precedence over a claimed marker.
         """
         is_download_complete = False
         has_sequencing_data = False
+        is_claimed = False
 
         for file_name in file_names:
             if file_name.endswith(const.SEQUENCING_EXT):
                 has_sequencing_data = True
             elif file_name == const.COMPLETE_MARKER:
                 is_download_complete = True
-            elif file_name == const.CLAIMED_MARKER or file_name == const.ERROR_MARKER:
-                return False
+            elif file_name == const.CLAIMED_MARKER:
+                is_claimed = True
+            elif file_name == const.ERROR_MARKER:
+                return StudyState.ERROR
+
+        if is_claimed:
+            return StudyState.CLAIMED
 
         if is_download_complete and has_sequencing_data:
-            return True
+            return StudyState.READY
+
+        return StudyState.DOWNLOADING
 
-        return False
\ No newline at end of file
+    @staticmethod
+    def is_ready_for_processing(file_names):
+        """
+        Check if the given list of file names include a sequencing file, a complete marker file and doesn't include
+        claimed marker or error marker files. If so then return true. Otherwise, return false.
+        """
+        return Study.get_state(file_names) == StudyState.READY
@@ -0,0 +1,88 @@
+import io
+
+import numpy as np
+import pytest
+
+from artifacts import biom_io
+from artifacts.biom_io import SparseTable, densify_rows
+from artifacts.feature_table_merge import merge_tables, merge_taxonomies, remove_samples
+
+
+def create_table(feature_ids, sample_ids, dense):
+    """
+    Return a SparseTable with the given dense features x samples counts.
+    """
+    dense = np.asarray(dense, dtype=np.float64)
+    rows, columns = np.nonzero(dense)
+    return SparseTable(feature_ids=np.array(feature_ids, dtype=object), sample_ids=np.array(sample_ids, dtype=object),
+                       data=dense[rows, columns], indices=columns.astype(np.int64),
+                       indptr=np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(feature_ids))))))
+
+
+def to_dict(table):
+    dense = densify_rows(table, 0, len(table.feature_ids))
+    return {(table.feature_ids[i], table.sample_ids[j]): dense[i, j] for i, j in zip(*np.nonzero(dense))}
+
+
+@pytest.fixture
+def tables():
+    return [create_table(['f1', 'f2'], ['S1', 'S2'], [[1, 0], [2, 3]]),
+            create_table(['f2', 'f3'], ['S2', 'S3'], [[5, 0], [0, 7]])]
+
+
+def test_merge_tables_sums_overlapping_counts(tables):
+    merged = merge_tables(tables)
+    assert list(merged.feature_ids) == ['f1', 'f2', 'f3']
+    assert list(merged.sample_ids) == ['S1', 'S2', 'S3']
+    assert to_dict(merged) == {('f1', 'S1'): 1, ('f2', 'S1'): 2, ('f2', 'S2'): 8, ('f3', 'S3'): 7}
+
+
+def test_merge_tables_averages_overlapping_samples(tables):
+    merged = merge_tables(tables, overlap_method='average')
+    assert to_dict(merged) == {('f1', 'S1'): 1, ('f2', 'S1'): 2, ('f2', 'S2'): 4, ('f3', 'S3'): 7}
+
+
+@pytest.mark.parametrize('overlap_method', ['error_on_overlapping_feature', 'error_on_overlapping_sample'])
+def test_merge_tables_rejects_overlaps(tables, overlap_method):
+    with pytest.raises(ValueError):
+        merge_tables(tables, overlap_method=overlap_method)
+
+    disjoint = [tables[0], create_table(['f3'], ['S3'], [[4]])]
+    assert to_dict(merge_tables(disjoint, overlap_method=overlap_method))[('f3', 'S3')] == 4
+
+
+def test_merge_tables_matches_dense_sum():
+    rng = np.random.default_rng(0)
+    tables, expected = [], {}
+    for i in range(5):
+        feature_ids = [f'f{j}' for j in rng.choice(30, size=10, replace=False)]
+        sample_ids = [f'S{i}_{j}' for j in range(4)]
+        dense = rng.integers(0, 3, size=(10, 4))
+        tables.append(create_table(feature_ids, sample_ids, dense))
+        for key, value in to_dict(tables[-1]).items():
+            expected[key] = expected.get(key, 0) + value
+    assert to_dict(merge_tables(tables)) == expected
+
+
+def test_remove_samples_drops_features_without_counts(tables):
+    table = remove_samples(merge_tables(tables), {'S1', 'S3'})
+    assert list(table.feature_ids) == ['f2']
+    assert list(table.sample_ids) == ['S2']
+    assert to_dict(table) == {('f2', 'S2'): 8}
+
+
+def test_merge_taxonomies_keeps_the_first_taxonomy():
+    merged = merge_taxonomies([{'f1': ('k__A', '0.9')}, {'f1': ('k__B', '0.8'), 'f2': ('k__C', '0.7')}])
+    assert merged == {'f1': ('k__A', '0.9'), 'f2': ('k__C', '0.7')}
+
+
+def test_write_biom_round_trip(tables):
+    pytest.importorskip('h5py')
+    merged = merge_tables(tables)
+    buffer = io.BytesIO()
+    biom_io.write_biom(merged, buffer)
+    buffer.seek(0)
+    table = biom_io.read_biom(buffer)
+    assert list(table.feature_ids) == list(merged.feature_ids)
+    assert list(table.sample_ids) == list(merged.sample_ids)
+    assert to_dict(table) == to_dict(merged)
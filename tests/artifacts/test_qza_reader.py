@@ -0,0 +1,59 @@
+import io
+import os
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+
+import utils
+from artifacts import qza_reader
+
+h5py = pytest.importorskip('h5py')
+
+
+def write_biom_qza(path, feature_ids, sample_ids, dense):
+    """
+    Write a minimal feature table artifact for the given features x samples counts.
+    """
+    rows, cols = np.nonzero(dense)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(feature_ids)))])
+    buffer = io.BytesIO()
+    with h5py.File(buffer, 'w') as f:
+        f['observation/ids'] = np.array(feature_ids, dtype='S')
+        f['sample/ids'] = np.array(sample_ids, dtype='S')
+        f['observation/matrix/data'] = dense[rows, cols].astype(float)
+        f['observation/matrix/indices'] = cols.astype(np.int32)
+        f['observation/matrix/indptr'] = indptr.astype(np.int32)
+    with ZipFile(path, 'w') as z:
+        z.writestr('uuid/data/feature-table.biom', buffer.getvalue())
+
+
+def test_read_feature_table(tmp_path):
+    path = os.path.join(tmp_path, 'table.qza')
+    write_biom_qza(path, ['f1', 'f2'], ['S1', 'S2'], np.array([[10, 0], [3, 7]]))
+    table = qza_reader.read_feature_table(path)
+    assert list(table.feature_ids) == ['f1', 'f2']
+    assert list(table.sample_ids) == ['S1', 'S2']
+    assert list(table.indptr) == [0, 1, 3]
+
+
+def test_results_from_artifacts_match_results_from_tsv_files(tmp_path):
+    table_qza = os.path.join(tmp_path, 'table.qza')
+    taxonomy_qza = os.path.join(tmp_path, 'taxonomy.qza')
+    write_biom_qza(table_qza, ['f1', 'f2'], ['S1', 'S2'], np.array([[10, 0], [3, 7]]))
+    taxonomy = 'Feature ID\tTaxon\tConfidence\nf1\tk__Bacteria; p__Firmicutes\t0.99\nf2\tk__Bacteria\t0.75\n'
+    with ZipFile(taxonomy_qza, 'w') as z:
+        z.writestr('uuid/data/taxonomy.tsv', taxonomy)
+
+    table_tsv = os.path.join(tmp_path, 'table.tsv')
+    taxonomy_tsv = os.path.join(tmp_path, 'taxonomy.tsv')
+    with open(table_tsv, 'w') as f:
+        f.write('# Constructed from biom file\n#OTU ID\tS1\tS2\nf1\t10.0\t0.0\nf2\t3.0\t7.0\n')
+    with open(taxonomy_tsv, 'w') as f:
+        f.write(taxonomy)
+
+    from_artifacts = list(utils.iter_results_chunks('ERR1', table_qza, taxonomy_qza, chunk_cells=2))
+    from_tsv_files = list(utils.iter_results_chunks('ERR1', table_tsv, taxonomy_tsv, chunk_cells=2))
+    assert len(from_artifacts) == 2
+    for artifact_chunk, tsv_chunk in zip(from_artifacts, from_tsv_files):
+        assert artifact_chunk.to_csv() == tsv_chunk.to_csv()
@@ -0,0 +1,20 @@
+from benchmarks import run_benchmarks
+
+
+def test_benchmarks_run_at_a_small_scale(tmp_path):
+    baselines_path = str(tmp_path / 'baselines.json')
+    assert run_benchmarks.main(['--scale', '0.01', '--repeat', '1', '--baselines', baselines_path,
+                                '--save-baseline']) == 0
+
+    baselines = run_benchmarks.load_baselines(baselines_path)
+    assert set(baselines) == set(run_benchmarks.BENCHMARKS)
+    assert all(result['min_s'] > 0 and result['peak_mib'] >= 0 for result in baselines.values())
+
+
+def test_compare():
+    baselines = {'fast': {'min_s': 1.0, 'peak_mib': 10.0, 'scale': 1.0},
+                 'other_scale': {'min_s': 1.0, 'peak_mib': 10.0, 'scale': 0.5}}
+    results = {'fast': {'min_s': 1.5, 'peak_mib': 10.5, 'scale': 1.0},
+               'other_scale': {'min_s': 5.0, 'peak_mib': 50.0, 'scale': 1.0},
+               'new': {'min_s': 5.0, 'peak_mib': 50.0, 'scale': 1.0}}
+    assert run_benchmarks.compare(results, baselines, tolerance=0.2) == [('fast', 'min_s', 1.0, 1.5)]
@@ -0,0 +1,59 @@
+import json
+import os
+import time
+from unittest.mock import Mock
+
+from crawler.scan_index import ScanIndex
+from static.study_state import StudyState
+
+
+def create_study(parent_dir, study_id, mtime):
+    study_dir = os.path.join(parent_dir, study_id)
+    os.makedirs(study_dir)
+    for file_name in (f'{study_id}_1.fastq', 'complete.txt'):
+        open(os.path.join(study_dir, file_name), 'w').close()
+    os.utime(study_dir, (mtime, mtime))
+    return study_dir
+
+
+def test_only_changed_directories_are_inspected(tmp_path):
+    study_dirs = [create_study(tmp_path, f'study{i}', mtime=1000) for i in range(3)]
+    index = ScanIndex(str(tmp_path))
+    assert index.sweep() == study_dirs
+
+    index.inspect = Mock(wraps=index.inspect)
+    assert index.sweep() == study_dirs
+    index.inspect.assert_not_called()
+
+    # Claiming a study changes the modification time of its directory.
+    open(os.path.join(study_dirs[1], 'claimed.txt'), 'w').close()
+    os.utime(study_dirs[1], (2000, 2000))
+    assert index.sweep() == [study_dirs[0], study_dirs[2]]
+    assert index.inspect.call_count == 1
+    assert index.count(StudyState.CLAIMED) == 1
+
+
+def test_removed_directories_are_forgotten(tmp_path):
+    study_dir = create_study(tmp_path, 'study', mtime=1000)
+    index = ScanIndex(str(tmp_path))
+    index.sweep()
+    os.remove(os.path.join(study_dir, 'complete.txt'))
+    os.remove(os.path.join(study_dir, 'study_1.fastq'))
+    os.rmdir(study_dir)
+    assert index.sweep() == []
+    assert index.entries == {}
+
+
+def test_expired_claims_are_ready(tmp_path):
+    study_dir = create_study(tmp_path, 'study', mtime=1000)
+    with open(os.path.join(study_dir, 'claimed.txt'), 'w') as f:
+        json.dump({'token': 'a', 'expires_at': time.time() + 0.2}, f)
+    os.utime(study_dir, (1000, 1000))
+
+    index = ScanIndex(str(tmp_path))
+    assert index.sweep() == []
+    assert index.count(StudyState.CLAIMED) == 1
+
+    time.sleep(0.2)
+    assert index.refresh_expired() == [study_dir]
+    assert index.sweep() == [study_dir]
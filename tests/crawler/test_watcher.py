@@ -0,0 +1,59 @@
+import os
+import threading
+
+import pytest
+
+from crawler.inotify_watcher import InotifyWatcher
+from crawler.poll_watcher import PollWatcher
+from crawler.watcher_error import WatcherError
+from crawler.watcher_factory import WatcherFactory, get_filesystem_type
+from static.watcher_type import WatcherType
+
+
+def create_study(parent_dir, study_id, complete=True):
+    study_dir = os.path.join(parent_dir, study_id)
+    os.makedirs(study_dir)
+    open(os.path.join(study_dir, f'{study_id}_1.fastq'), 'w').close()
+    if complete:
+        open(os.path.join(study_dir, 'complete.txt'), 'w').close()
+    return study_dir
+
+
+def test_poll_watcher_finds_ready_studies(tmp_path):
+    ready_dir = create_study(tmp_path, 'ready')
+    create_study(tmp_path, 'downloading', complete=False)
+    watcher = PollWatcher(str(tmp_path))
+    assert list(watcher.find_studies()) == [ready_dir]
+
+
+def test_poll_factory():
+    watcher = WatcherFactory.generate_watcher(os.getcwd(), WatcherType.POLL, logger_name='')
+    assert isinstance(watcher, PollWatcher)
+
+
+def test_filesystem_type(tmp_path):
+    mounts_path = os.path.join(tmp_path, 'mounts')
+    with open(mounts_path, 'w') as mounts:
+        mounts.write('/dev/vda / ext4 rw 0 0\n')
+        mounts.write('server:/export /mnt/studies nfs4 rw 0 0\n')
+    assert get_filesystem_type('/mnt/studies/ERR1', mounts_path=mounts_path) == 'nfs4'
+    assert get_filesystem_type('/home', mounts_path=mounts_path) == 'ext4'
+
+
+def test_inotify_watcher_reports_completed_study(tmp_path):
+    try:
+        watcher = InotifyWatcher(str(tmp_path))
+    except WatcherError:
+        pytest.skip('inotify is not available.')
+
+    # The initial scan reports nothing since there are no studies yet.
+    assert list(watcher.find_studies()) == []
+
+    study_dir = create_study(tmp_path, 'study', complete=False)
+    watcher.wait(threading.Event())
+    assert list(watcher.find_studies()) == [study_dir]
+
+    open(os.path.join(study_dir, 'complete.txt'), 'w').close()
+    watcher.wait(threading.Event())
+    assert list(watcher.find_studies()) == [study_dir]
+    watcher.close()
@@ -1,7 +1,15 @@
+import json
+import os
+import time
+from unittest.mock import MagicMock
+
 import pytest
 
+import metrics
 from config import *
 from data_engineering import DataEngineering
+from static import constants as const
+from study.claim import Claim
 
 
 def test_missing_config_file():
@@ -14,4 +22,114 @@ def test_invalid_input_directory():
     data_engineering = DataEngineering()
     app_config.attributes['input_path'] = None
     with pytest.raises(ValueError):
-        data_engineering.run()
\ No newline at end of file
+        data_engineering.run()
+
+
+def test_run_stops_when_shutdown_is_requested(tmp_path):
+    data_engineering = DataEngineering()
+    app_config.attributes['input_path'] = str(tmp_path)
+    data_engineering.stop_event.set()
+    data_engineering.run()
+    assert data_engineering.executor is None
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self.enqueued = []
+        self.queued = []
+        self.finished = {}
+
+    def enqueue(self, jobs):
+        self.enqueued.extend(jobs)
+        self.queued.extend(jobs)
+        return [run_id for run_id, _ in jobs]
+
+    def requeue_expired(self):
+        return []
+
+    def claim(self, limit=1):
+        jobs, self.queued = self.queued[:limit], self.queued[limit:]
+        return jobs
+
+    def complete(self, run_id):
+        self.finished[run_id] = 'done'
+
+    def fail(self, run_id, error=None):
+        self.finished[run_id] = 'failed'
+
+
+class FakeWatcher:
+    def __init__(self, studies):
+        self.studies = studies
+
+    def find_studies(self):
+        return iter(self.studies)
+
+
+def create_ready_study(tmp_path, study_id):
+    directory = tmp_path / study_id
+    directory.mkdir()
+    (directory / f'{study_id}.fastq').write_text('')
+    (directory / const.COMPLETE_MARKER).write_text('')
+    return str(directory)
+
+
+def test_claim_from_queue(tmp_path):
+    ready = [create_ready_study(tmp_path, 'SRR1'), create_ready_study(tmp_path, 'SRR2')]
+
+    # A study that is still being downloaded, a subdirectory of a study and a directory that was removed.
+    downloading = tmp_path / 'SRR3'
+    downloading.mkdir()
+    (downloading / 'SRR3.fastq').write_text('')
+    subdirectory = tmp_path / 'SRR1' / 'subsampled'
+    subdirectory.mkdir()
+    not_ready = [str(downloading), str(subdirectory), str(tmp_path / 'SRR4')]
+
+    data_engineering = DataEngineering()
+    data_engineering.logger = MagicMock()
+    data_engineering.job_queue = FakeJobQueue()
+    data_engineering.watcher = FakeWatcher(ready + not_ready)
+    data_engineering.process_study = lambda directory, claim=None: directory.endswith('SRR1')
+
+    data_engineering.claim_from_queue()
+    data_engineering.claim_from_queue()
+
+    assert data_engineering.job_queue.enqueued == [('SRR1', ready[0]), ('SRR2', ready[1])]
+    assert data_engineering.job_queue.finished == {'SRR1': 'done', 'SRR2': 'failed'}
+    assert data_engineering.enqueued == set(ready)
+
+
+def test_study_is_abandoned_after_too_many_reclaims(tmp_path, monkeypatch):
+    directory = create_ready_study(tmp_path, 'SRR1')
+    with open(os.path.join(directory, const.CLAIMED_MARKER), 'w') as f:
+        json.dump({'token': 'crashed', 'expires_at': time.time() - 1, 'attempts': 3}, f)
+
+    monkeypatch.setitem(app_config.attributes, JOB_MAX_ATTEMPTS, 3)
+    data_engineering = DataEngineering()
+    data_engineering.logger = MagicMock()
+    data_engineering.watcher = FakeWatcher([directory])
+    data_engineering.error_out = MagicMock(side_effect=lambda study_id, error_msg, directory: open(
+        os.path.join(directory, const.ERROR_MARKER), 'w').close())
+    data_engineering.process_study = MagicMock()
+
+    data_engineering.claim_from_directory()
+
+    data_engineering.process_study.assert_not_called()
+    assert data_engineering.error_out.call_args.kwargs['study_id'] == 'SRR1'
+    assert not os.path.exists(os.path.join(directory, const.CLAIMED_MARKER))
+
+
+def test_study_whose_claim_is_lost_is_skipped(tmp_path, monkeypatch):
+    directory = create_ready_study(tmp_path, 'SRR1')
+    claim = Claim(directory)
+    assert claim.acquire()
+    os.remove(claim.path)
+
+    monkeypatch.setitem(app_config.attributes, QUEUE_MODE, 'filesystem')
+    data_engineering = DataEngineering()
+    skipped = metrics.STUDIES_SKIPPED.values.get((), 0)
+    errored = metrics.STUDIES_ERRORED.values.get((), 0)
+    data_engineering.dispatch(directory, claim)
+
+    assert metrics.STUDIES_SKIPPED.values.get((), 0) == skipped + 1
+    assert metrics.STUDIES_ERRORED.values.get((), 0) == errored
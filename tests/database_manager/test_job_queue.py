@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+from database_manager import job_queue as job_queue_module
+from database_manager.db_manager import DBManager
+from database_manager.job_queue import JobQueue
+from static.job_state import JobState
+
+# Connection string of a local Postgres database, e.g. "host=localhost port=5432 user=postgres password=postgres
+# dbname=test". The tests that need it are skipped if it is missing.
+DSN = os.environ.get('TEST_POSTGRES_DSN')
+
+
+class SqliteCursor:
+    """
+    Runs the Postgres statements of the job queue on SQLite. Only the statements without Postgres-only syntax work.
+    """
+
+    def __init__(self, db):
+        self.cursor = db.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cursor.close()
+
+    def execute(self, sql_stmnt, params=None):
+        self.cursor.execute(sql_stmnt.replace('%s', '?'), params or ())
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+
+class SqliteManager:
+    def __init__(self):
+        self.db = sqlite3.connect(':memory:')
+        self.db.create_function('NOW', 0, time.time)
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        return SqliteCursor(self.db)
+
+    def commit(self):
+        self.db.commit()
+
+
+def sqlite_execute_values(cursor, sql_stmnt, values, fetch=False):
+    placeholders = ', '.join('(' + ', '.join('%s' for _ in row) + ')' for row in values)
+    cursor.execute(sql_stmnt.replace('VALUES %s', f'VALUES {placeholders}'), [value for row in values for value in row])
+    return cursor.fetchall() if fetch else None
+
+
+@pytest.fixture
+def sqlite_queue(monkeypatch):
+    monkeypatch.setattr(job_queue_module, 'execute_values', sqlite_execute_values)
+    manager = SqliteManager()
+    manager.db.execute(f"""CREATE TABLE jobs (acc TEXT PRIMARY KEY, directory TEXT NOT NULL,
+                                              state TEXT NOT NULL DEFAULT '{JobState.QUEUED.value}',
+                                              attempts INTEGER NOT NULL DEFAULT 0, owner TEXT, claimed_until REAL,
+                                              error TEXT, created_at REAL, updated_at REAL)""")
+    return JobQueue(manager, 'jobs', max_attempts=3)
+
+
+def get_job(job_queue, run_id):
+    return job_queue.db_manager.db.execute('SELECT state, attempts FROM jobs WHERE acc = ?', (run_id,)).fetchone()
+
+
+def expire_claim(job_queue, run_id, attempts):
+    job_queue.db_manager.db.execute('UPDATE jobs SET state = ?, attempts = ?, claimed_until = ? WHERE acc = ?',
+                                    (JobState.CLAIMED.value, attempts, time.time() - 1, run_id))
+
+
+def test_job_that_failed_after_max_attempts_is_not_queued_again(sqlite_queue):
+    assert sqlite_queue.enqueue([('SRR1', '/in/SRR1')]) == ['SRR1']
+    expire_claim(sqlite_queue, 'SRR1', attempts=3)
+    assert sqlite_queue.requeue_expired() == [('SRR1', JobState.FAILED.value)]
+
+    # The watcher reports the study again since it has no error marker.
+    assert sqlite_queue.enqueue([('SRR1', '/in/SRR1')]) == []
+    assert get_job(sqlite_queue, 'SRR1') == (JobState.FAILED.value, 3)
+
+
+def test_done_job_is_queued_again(sqlite_queue):
+    sqlite_queue.enqueue([('SRR1', '/in/SRR1')])
+    expire_claim(sqlite_queue, 'SRR1', attempts=1)
+    sqlite_queue.db_manager.db.execute('UPDATE jobs SET state = ?', (JobState.DONE.value,))
+
+    assert sqlite_queue.enqueue([('SRR1', '/in/SRR1'), ('SRR2', '/in/SRR2')]) == ['SRR1', 'SRR2']
+    assert get_job(sqlite_queue, 'SRR1') == (JobState.QUEUED.value, 0)
+
+
+@pytest.fixture
+def manager():
+    if DSN is None:
+        pytest.skip('TEST_POSTGRES_DSN is not set')
+    params = psycopg2.extensions.parse_dsn(DSN)
+    manager = DBManager()
+    manager.host = params.get('host')
+    manager.port = params.get('port')
+    manager.user = params.get('user')
+    manager.password = params.get('password')
+    manager.database = params.get('dbname')
+    return manager
+
+
+@pytest.fixture
+def table(manager):
+    table = f'jobs_{uuid.uuid4().hex[:8]}'
+    yield table
+    manager.execute_statement(f'DROP TABLE IF EXISTS {table}')
+
+
+def create_job_queue(manager, table, visibility_timeout=600, max_attempts=3):
+    job_queue = JobQueue(manager, table, visibility_timeout=visibility_timeout, max_attempts=max_attempts)
+    job_queue.create_table()
+    return job_queue
+
+
+def test_nodes_never_claim_the_same_job(manager, table):
+    node_1 = create_job_queue(manager, table)
+    node_2 = create_job_queue(manager, table)
+    assert node_1.enqueue([('SRR1', '/in/SRR1'), ('SRR2', '/in/SRR2')]) == ['SRR1', 'SRR2']
+    assert node_2.enqueue([('SRR1', '/in/SRR1')]) == []
+
+    assert node_1.claim() == [('SRR1', '/in/SRR1')]
+    assert node_2.claim() == [('SRR2', '/in/SRR2')]
+    assert node_1.claim() == []
+
+    node_1.complete('SRR1')
+    node_1.complete('SRR2')
+    depth = node_1.get_depth()
+    assert depth[JobState.DONE] == 1
+    assert depth[JobState.CLAIMED] == 1
+
+
+def test_expired_claims_are_requeued(manager, table):
+    node_1 = create_job_queue(manager, table, visibility_timeout=1, max_attempts=2)
+    node_2 = create_job_queue(manager, table, visibility_timeout=1, max_attempts=2)
+    node_1.enqueue([('SRR1', '/in/SRR1')])
+    node_1.claim()
+    manager.execute_statement(f"UPDATE {table} SET claimed_until = NOW() - INTERVAL '1 second'")
+
+    assert node_2.requeue_expired() == [('SRR1', JobState.QUEUED.value)]
+    assert node_2.claim() == [('SRR1', '/in/SRR1')]
+
+    # The stale node can't finish the job it lost.
+    node_1.complete('SRR1')
+    assert node_2.get_depth()[JobState.CLAIMED] == 1
+
+    manager.execute_statement(f"UPDATE {table} SET claimed_until = NOW() - INTERVAL '1 second'")
+    assert node_1.requeue_expired() == [('SRR1', JobState.FAILED.value)]
+
+
+def test_done_jobs_are_queued_again(manager, table):
+    job_queue = create_job_queue(manager, table)
+    job_queue.enqueue([('SRR1', '/in/SRR1'), ('SRR2', '/in/SRR2')])
+    job_queue.claim(limit=2)
+    job_queue.complete('SRR1')
+    job_queue.fail('SRR2', error='failed')
+
+    assert job_queue.enqueue([('SRR1', '/in/SRR1'), ('SRR2', '/in/SRR2')]) == ['SRR1']
+    assert job_queue.claim() == [('SRR1', '/in/SRR1')]
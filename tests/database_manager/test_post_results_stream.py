@@ -0,0 +1,123 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from database_manager.db_error import DBError
+from database_manager.db_manager import DBManager
+from database_manager.iterator_file import IteratorFile
+
+
+class FakeConnection:
+    """
+    Connection whose COPY statements read the whole file and record it.
+    """
+
+    def __init__(self, fail=False, fail_commit=False):
+        self.copied = None
+        self.executed = []
+        self.committed = False
+        self.rolled_back = False
+        self.fail = fail
+        self.fail_commit = fail_commit
+
+    def cursor(self):
+        cursor = MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.copy_expert.side_effect = self.copy_expert
+        cursor.execute.side_effect = lambda sql, params=None: self.executed.append((sql, params))
+        return cursor
+
+    def copy_expert(self, sql, file):
+        self.copied = file.read()
+        if self.fail:
+            raise RuntimeError('COPY failed')
+
+    def commit(self):
+        if self.fail_commit:
+            raise RuntimeError('Commit failed')
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+def create_db_manager(connections):
+    manager = DBManager()
+    manager.results_table = 'results'
+    manager.get_connection = MagicMock(side_effect=connections)
+    manager.release_connection = MagicMock()
+    return manager
+
+
+def test_iterator_file():
+    f = IteratorFile(iter(['a,1\nb,', '2\n', 'c,3\n']))
+    assert f.readline() == 'a,1\n'
+    assert f.read(3) == 'b,2'
+    assert f.read() == '\nc,3\n'
+    assert f.read() == ''
+
+
+def test_iterator_file_readline():
+    f = IteratorFile(iter(['', 'ab', 'c\nd', '', 'e\n', 'f']))
+    assert f.readline(2) == 'ab'
+    assert f.readline() == 'c\n'
+    assert f.readline() == 'de\n'
+    assert f.readline() == 'f'
+    assert f.readline() == ''
+
+
+def test_iterator_file_reads_large_chunks_in_small_pieces():
+    chunks = [''.join(f'{i},{j}\n' for j in range(50000)) for i in range(4)]
+    f = IteratorFile(iter(chunks))
+    pieces = iter(lambda: f.read(8192), '')
+    assert ''.join(pieces) == ''.join(chunks)
+
+
+def test_single_stream():
+    connection = FakeConnection()
+    create_db_manager([connection]).post_results_stream('ERR1', iter(['a,1\n', 'b,2\n']))
+    assert connection.copied == 'a,1\nb,2\n'
+    assert connection.committed
+    assert connection.executed == [('DELETE FROM results WHERE acc=%s', ('ERR1',))]
+
+
+def test_parallel_streams():
+    connections = [FakeConnection(), FakeConnection()]
+    chunks = [f'{i}\n' for i in range(10)]
+    create_db_manager(connections).post_results_stream('ERR1', iter(chunks), n_streams=2)
+    assert sorted(connections[0].copied.split() + connections[1].copied.split(), key=int) == [str(i) for i in range(10)]
+    assert all(connection.committed for connection in connections)
+
+
+def test_failed_stream_rolls_back_all_streams():
+    connections = [FakeConnection(), FakeConnection(fail=True)]
+    with pytest.raises(DBError):
+        create_db_manager(connections).post_results_stream('ERR1', iter(f'{i}\n' for i in range(100)), n_streams=2)
+    assert not any(connection.committed for connection in connections)
+    assert all(connection.rolled_back for connection in connections)
+
+
+def test_producer_error_is_raised():
+    def chunks():
+        yield 'a,1\n'
+        raise ValueError('Feature ID f3 is missing.')
+
+    connection = FakeConnection()
+    with pytest.raises(ValueError, match='f3'):
+        create_db_manager([connection]).post_results_stream('ERR1', chunks())
+    assert connection.rolled_back
+
+
+def test_committed_streams_are_deleted_if_a_commit_fails():
+    connections = [FakeConnection(), FakeConnection(fail_commit=True)]
+    cleanup = FakeConnection()
+    with pytest.raises(DBError):
+        create_db_manager(connections + [cleanup]).post_results_stream('ERR1', iter(f'{i}\n' for i in range(10)),
+                                                                        n_streams=2)
+    assert connections[0].committed
+    assert connections[1].rolled_back
+    assert cleanup.executed == [('DELETE FROM results WHERE acc=%s', ('ERR1',))]
+    assert cleanup.committed
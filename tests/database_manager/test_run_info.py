@@ -0,0 +1,51 @@
+from collections import namedtuple
+from unittest.mock import MagicMock
+
+from database_manager.db_manager import DBManager
+from static.status import Status
+
+Column = namedtuple('Column', 'name')
+
+
+def create_db_manager(cursor):
+    connection = MagicMock()
+    connection.cursor.return_value.__enter__.return_value = cursor
+    manager = DBManager()
+    manager.status_table = 'status'
+    manager.get_connection = MagicMock(return_value=connection)
+    manager.release_connection = MagicMock()
+    return manager, connection
+
+
+def test_get_run_info():
+    cursor = MagicMock()
+    cursor.fetchone.return_value = ('SRR1', 7, 'a@b.c', True, False)
+    cursor.description = [Column(name) for name in ('acc', 'user_id', 'email', 'public', 'email_notification')]
+    manager, connection = create_db_manager(cursor)
+
+    run_info = manager.get_run_info('SRR1')
+
+    assert run_info == {'acc': 'SRR1', 'user_id': 7, 'email': 'a@b.c', 'public': True, 'email_notification': False}
+    assert cursor.execute.call_count == 1
+    assert cursor.execute.call_args.args[1] == ('SRR1',)
+    manager.release_connection.assert_called_once_with(connection)
+
+
+def test_get_run_info_missing_run():
+    cursor = MagicMock()
+    cursor.fetchone.return_value = None
+    manager, _ = create_db_manager(cursor)
+    assert manager.get_run_info('SRR1') is None
+
+
+def test_update_status_is_a_single_statement():
+    cursor = MagicMock()
+    manager, connection = create_db_manager(cursor)
+
+    manager.update_status('SRR1', Status.SUCCESS, output_path='/out')
+
+    assert cursor.execute.call_count == 1
+    sql_stmnt, params = cursor.execute.call_args.args
+    assert 'ON CONFLICT (acc)' in sql_stmnt
+    assert params == ('SRR1', 2, '/out')
+    connection.commit.assert_called_once()
@@ -0,0 +1,86 @@
+import multiprocessing
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, MetricsServer, Registry
+
+
+@pytest.fixture
+def registry():
+    registry = Registry()
+    registry.add(Counter('claimed', 'Claimed studies.'))
+    registry.add(Gauge('ready', 'Ready studies.'))
+    registry.add(Histogram('step_seconds', 'Step durations.', label_names=('step',), buckets=(1, 10)))
+    return registry
+
+
+def test_render(registry):
+    registry.metrics['claimed'].inc()
+    registry.metrics['claimed'].inc(2)
+    registry.metrics['ready'].set(5)
+    for value in (0.5, 5, 50):
+        registry.metrics['step_seconds'].observe(value, step='tools_import')
+
+    lines = registry.render().splitlines()
+    assert 'claimed_total 3' in lines
+    assert 'ready 5' in lines
+    assert 'step_seconds_bucket{step="tools_import",le="1"} 1' in lines
+    assert 'step_seconds_bucket{step="tools_import",le="10"} 2' in lines
+    assert 'step_seconds_bucket{step="tools_import",le="+Inf"} 3' in lines
+    assert 'step_seconds_count{step="tools_import"} 3' in lines
+    assert 'step_seconds_sum{step="tools_import"} 55.5' in lines
+    assert lines[-1] == '# EOF'
+
+
+def test_missing_label(registry):
+    with pytest.raises(ValueError):
+        registry.metrics['step_seconds'].observe(1)
+
+
+def test_timed_db_call_counts_errors():
+    @metrics.timed_db_call
+    def failing_call():
+        raise RuntimeError('Connection lost')
+
+    with pytest.raises(RuntimeError):
+        failing_call()
+
+    operation = failing_call.__qualname__
+    assert metrics.DB_ERRORS.values[(operation,)] == 1
+    assert metrics.DB_DURATION.values[(operation,)][-2] == 1
+
+
+def forward_metrics(q):
+    metrics.forward_to(q)
+    metrics.STUDIES_SUCCEEDED.inc()
+
+
+def test_server_serves_metrics_of_workers():
+    q = multiprocessing.Queue()
+    server = MetricsServer(host='127.0.0.1', port=0, q=q)
+    server.start()
+    try:
+        before = metrics.STUDIES_SUCCEEDED.values.get((), 0)
+        process = multiprocessing.Process(target=forward_metrics, args=(q,))
+        process.start()
+        process.join()
+
+        url = f'http://127.0.0.1:{server.port}/metrics'
+        for _ in range(100):
+            with urllib.request.urlopen(url) as response:
+                body = response.read().decode()
+                assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+            if f'data_engineering_studies_succeeded_total {before + 1}' in body:
+                break
+            time.sleep(0.05)
+        else:
+            pytest.fail('The metrics of the worker were not received.')
+
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://127.0.0.1:{server.port}/other')
+    finally:
+        server.close()
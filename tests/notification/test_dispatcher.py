@@ -0,0 +1,90 @@
+import time
+
+from notification.dispatcher import NotificationDispatcher, RateLimiter
+from notification.message import Message
+from notification.notification_error import NotificationError
+from notification.transports import StubTransport
+
+
+class FailingTransport:
+    def __init__(self):
+        self.attempts = 0
+
+    def send(self, message):
+        self.attempts += 1
+        raise NotificationError(msg='Email address is not verified.', retryable=False)
+
+
+def test_notifications_are_sent_in_the_background():
+    transport = StubTransport()
+    dispatcher = NotificationDispatcher(transport=transport, max_rate=100)
+    dispatcher.start()
+    dispatcher.notify('a@b.c', 'SRR1')
+    dispatcher.notify('d@e.f', 'SRR2')
+    dispatcher.close()
+
+    assert [(message.recipient, message.run_ids) for message in transport.sent] == [('a@b.c', ['SRR1']),
+                                                                                  ('d@e.f', ['SRR2'])]
+    assert transport.sent[0].get_text() == 'SRR1 has been processed successfully.'
+
+
+def test_transient_errors_are_retried():
+    transport = StubTransport(n_failures=2)
+    dispatcher = NotificationDispatcher(transport=transport, max_rate=100, retry_delay=0.01)
+    dispatcher.start()
+    dispatcher.notify('a@b.c', 'SRR1')
+    dispatcher.close()
+
+    [message] = transport.sent
+    assert message.attempt == 3
+
+
+def test_permanent_errors_are_not_retried():
+    transport = FailingTransport()
+    dispatcher = NotificationDispatcher(transport=transport, max_rate=100, retry_delay=0.01)
+    dispatcher.start()
+    dispatcher.notify('a@b.c', 'SRR1')
+    dispatcher.close()
+
+    assert transport.attempts == 1
+
+
+def test_retries_are_dropped_when_closing_times_out():
+    transport = StubTransport(n_failures=1)
+    dispatcher = NotificationDispatcher(transport=transport, max_rate=100, retry_delay=60)
+    dispatcher.start()
+    dispatcher.notify('a@b.c', 'SRR1')
+    dispatcher.close(timeout=0.05)
+
+    assert transport.sent == []
+
+
+def test_notifications_are_batched_into_digests():
+    transport = StubTransport()
+    dispatcher = NotificationDispatcher(transport=transport, max_rate=100, digest_window=60)
+    dispatcher.start()
+    for recipient, run_id in (('a@b.c', 'SRR1'), ('d@e.f', 'SRR2'), ('a@b.c', 'SRR3')):
+        dispatcher.notify(recipient, run_id)
+
+    # The digests are sent when the dispatcher is closed, before their window ends.
+    dispatcher.close()
+
+    messages = {message.recipient: message for message in transport.sent}
+    assert messages['a@b.c'].run_ids == ['SRR1', 'SRR3']
+    assert messages['a@b.c'].get_subject() == '2 Processes Completed'
+    assert messages['d@e.f'].run_ids == ['SRR2']
+
+
+def test_rate_limiter():
+    rate_limiter = RateLimiter(rate=50)
+    start_time = time.monotonic()
+    for _ in range(60):
+        rate_limiter.wait()
+
+    # The first 50 events are a burst, the next 10 wait for 1/50 s each.
+    assert time.monotonic() - start_time >= 0.15
+
+
+def test_digest_lists_the_runs():
+    html = Message('a@b.c', ['SRR1', 'SRR2']).get_html()
+    assert '<li>SRR1</li><li>SRR2</li>' in html
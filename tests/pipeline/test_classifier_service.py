@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pipeline.executors.classifier_client import ClassifierClient
+from pipeline.executors.classifier_service import ClassifierService
+
+
+def load_model(path, version, cache_dir):
+    with open(path) as f:
+        return f.read()
+
+
+def classify_reads(model, input_path, output_path, n_jobs, confidence):
+    with open(output_path, 'w') as f:
+        f.write(model)
+
+
+@pytest.fixture
+def service(tmp_path):
+    # Unix socket paths are limited to about 100 characters.
+    socket_path = os.path.join('/tmp', f'classifier-{os.getpid()}.sock')
+    service = ClassifierService(socket_path=socket_path, cache_dir=str(tmp_path), load_model=load_model,
+                                classify_reads=classify_reads)
+    thread = threading.Thread(target=service.serve_forever, daemon=True)
+    thread.start()
+    while service.server is None or not os.path.exists(socket_path):
+        time.sleep(0.01)
+    yield service
+    service.shutdown()
+    thread.join()
+
+
+def test_classifier_is_hot_swapped(service, tmp_path):
+    classifier_path = os.path.join(tmp_path, 'classifier.qza')
+    output_path = os.path.join(tmp_path, 'taxonomy.qza')
+    with open(classifier_path, 'w') as f:
+        f.write('v1')
+
+    client = ClassifierClient(service.socket_path)
+    first = client.classify(input_path='rep_seqs.qza', classifier_path=classifier_path, output_path=output_path)
+    with open(output_path) as f:
+        assert f.read() == 'v1'
+
+    # Replace the classifier file and swap it without restarting the service.
+    with open(classifier_path, 'w') as f:
+        f.write('v2')
+    client.load(classifier_path)
+
+    second = client.classify(input_path='rep_seqs.qza', classifier_path=classifier_path, output_path=output_path)
+    with open(output_path) as f:
+        assert f.read() == 'v2'
+    assert first['result']['version'] != second['result']['version']
+    assert client.status()['result'] == {'classifier': second['result']['version']}
+
+
+def test_unreachable_service():
+    client = ClassifierClient('/tmp/missing-classifier.sock')
+    with pytest.raises(ConnectionError):
+        client.status()
@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+from pipeline.commands.biom_convert_cmd import BiomConvertCmd
+from pipeline.commands.export_cmd import ExportCmd
+from pipeline.commands.feature_classifier_cmd import FeatureClassifierCmd
+from pipeline.pipeline_error import PipelineError
+from pipeline.scheduler import DagScheduler
+
+
+def create_commands():
+    return [ExportCmd(input_path='table.qza', output_path='out', exported_paths=['feature-table.biom']),
+            BiomConvertCmd(input_path='feature-table.biom', output_path='table.tsv', output_format='tsv'),
+            FeatureClassifierCmd(input_path='rep_seqs.qza', classifier_path='classifier.qza',
+                                 output_path='taxonomy.qza'),
+            ExportCmd(input_path='taxonomy.qza', output_path='out', exported_paths=['taxonomy.tsv'])]
+
+
+def test_dependencies():
+    scheduler = DagScheduler(create_commands(), run=None)
+    assert scheduler.dependencies == [set(), {0}, set(), {2}]
+
+
+def test_independent_branches_run_concurrently():
+    # Both branches must be running at the same time to pass the barrier.
+    barrier = threading.Barrier(2, timeout=5)
+    order = []
+
+    def run(command):
+        if command.get_inputs()[0] in ('table.qza', 'rep_seqs.qza'):
+            barrier.wait()
+        order.append(command.get_outputs()[0])
+
+    DagScheduler(create_commands(), run=run, max_parallel=2).execute()
+    assert order.index('feature-table.biom') < order.index('table.tsv')
+    assert order.index('taxonomy.qza') < order.index('taxonomy.tsv')
+
+
+def test_failure_stops_dependent_commands():
+    executed = []
+
+    def run(command):
+        if command.get_outputs() == ['feature-table.biom']:
+            raise PipelineError(msg='Pipeline error.', study_id='dummy')
+        executed.append(command.get_outputs()[0])
+
+    with pytest.raises(PipelineError):
+        DagScheduler(create_commands(), run=run, max_parallel=1).execute()
+    assert 'table.tsv' not in executed
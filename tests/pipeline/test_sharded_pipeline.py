@@ -0,0 +1,85 @@
+import csv
+import json
+import os
+
+from config import app_config
+from pipeline.commands.feature_table_merge_cmd import FeatureTableMergeCmd
+from pipeline.commands.feature_table_merge_seqs_cmd import FeatureTableMergeSeqsCmd
+from pipeline.commands.paired_denoise_cmd import PairedDenoiseCmd
+from pipeline.demux_paired_pipeline import DemuxPairedPipeline
+from pipeline.executors.executor_factory import ExecutorFactory
+from static.layout import Layout
+from study.study import Study
+
+
+class FlakyExecutor:
+    """
+    Executor that fails the first denoising of the second shard.
+    """
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, command, usage=None):
+        self.executed.append(command)
+        if isinstance(command, PairedDenoiseCmd) and 'shard1' in command.input_path and \
+                self.executed.count(command) == 1:
+            return 1
+        return 0
+
+
+def create_pipeline(tmp_path, monkeypatch, n_samples, shard_size):
+    manifest_path = tmp_path / 'manifest.tsv'
+    with open(manifest_path, 'w') as tsv_file:
+        tsv_writer = csv.writer(tsv_file, delimiter='\t')
+        tsv_writer.writerow(['sample-id', 'forward-absolute-filepath', 'reverse-absolute-filepath'])
+        for i in range(n_samples):
+            tsv_writer.writerow([f'S{i}', f'/in/S{i}_1.fastq.gz', f'/in/S{i}_2.fastq.gz'])
+
+    for key, value in (('denoise_shard_size', shard_size), ('auto_truncation', False), ('public_results_path',
+                                                                                          str(tmp_path))):
+        monkeypatch.setitem(app_config.attributes, key, value)
+
+    study = Study(parent_dir=str(tmp_path), user_id=None, is_public=True)
+    study.id = 'SRR1'
+    study.layout = Layout.PAIRED
+    study.manifest_path = str(manifest_path)
+    return DemuxPairedPipeline(study, logger_name='')
+
+
+def test_small_study_is_not_sharded(tmp_path, monkeypatch):
+    pipeline = create_pipeline(tmp_path, monkeypatch, n_samples=3, shard_size=3)
+    assert pipeline.shards == []
+    assert len(pipeline.denoise_cmds) == 1
+    assert pipeline.denoise_cmds[0].n_threads == 0
+
+
+def test_shards_are_denoised_separately_and_merged(tmp_path, monkeypatch):
+    pipeline = create_pipeline(tmp_path, monkeypatch, n_samples=5, shard_size=2)
+    executor = FlakyExecutor()
+    monkeypatch.setattr(ExecutorFactory, 'get_executor', classmethod(lambda cls, config, logger_name: executor))
+
+    pipeline.execute()
+
+    assert [len(rows) for rows in pipeline.shards] == [2, 2, 1]
+    with open(pipeline.get_shard_path(2, 'manifest.tsv')) as tsv_file:
+        assert list(csv.reader(tsv_file, delimiter='\t'))[1][0] == 'S4'
+
+    # Only the failed shard was retried.
+    denoised = [command.input_path for command in executor.executed if isinstance(command, PairedDenoiseCmd)]
+    assert sorted(denoised) == sorted([pipeline.get_shard_path(shard, 'demux.qza') for shard in (0, 1, 1, 2)])
+
+    [merge_cmd] = [command for command in executor.executed if isinstance(command, FeatureTableMergeCmd)]
+    assert merge_cmd.get_inputs() == [pipeline.get_shard_path(shard, 'feature-table.qza') for shard in range(3)]
+    assert merge_cmd.output_path == pipeline.qza_table_path
+    [merge_seqs_cmd] = [command for command in executor.executed if isinstance(command, FeatureTableMergeSeqsCmd)]
+    assert merge_seqs_cmd.output_path == pipeline.rep_seqs_path
+    assert os.path.isdir(pipeline.get_output_dir())
+
+    # The metrics of each step were recorded, including the retry of the failed shard.
+    with open(pipeline.metrics_path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == len(pipeline.commands)
+    retried = [record for record in records if record['attempts'] == 2]
+    assert [record['step'] for record in retried] == [PairedDenoiseCmd.action]
+    assert all(record['status'] == 'completed' for record in records)
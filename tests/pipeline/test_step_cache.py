@@ -0,0 +1,50 @@
+import os
+
+from pipeline.commands.biom_convert_cmd import BiomConvertCmd
+from pipeline.step_cache import StepCache
+
+
+def write(path, contents):
+    with open(path, 'w') as f:
+        f.write(contents)
+
+
+def test_completed_step_is_valid_until_its_input_changes(tmp_path):
+    input_path = os.path.join(tmp_path, 'feature-table.biom')
+    output_path = os.path.join(tmp_path, 'feature-table.tsv')
+    command = BiomConvertCmd(input_path=input_path, output_path=output_path, output_format='tsv')
+    write(input_path, 'table')
+    write(output_path, 'tsv')
+
+    cache = StepCache(str(tmp_path))
+    assert not cache.is_valid(command)
+    cache.record(command)
+    assert cache.is_valid(command)
+
+    # The record survives a restart.
+    assert StepCache(str(tmp_path)).is_valid(command)
+
+    write(input_path, 'modified table')
+    assert not cache.is_valid(command)
+
+
+def test_step_with_modified_output_is_invalid(tmp_path):
+    input_path = os.path.join(tmp_path, 'feature-table.biom')
+    output_path = os.path.join(tmp_path, 'feature-table.tsv')
+    command = BiomConvertCmd(input_path=input_path, output_path=output_path, output_format='tsv')
+    write(input_path, 'table')
+    write(output_path, 'tsv')
+
+    cache = StepCache(str(tmp_path))
+    cache.record(command)
+    os.remove(output_path)
+    assert not cache.is_valid(command)
+
+
+def test_changed_parameters_invalidate_the_step(tmp_path):
+    input_path = os.path.join(tmp_path, 'feature-table.biom')
+    write(input_path, 'table')
+    cache = StepCache(str(tmp_path))
+    cache.record(BiomConvertCmd(input_path=input_path, output_path=input_path + '.tsv', output_format='tsv'))
+    assert not cache.is_valid(BiomConvertCmd(input_path=input_path, output_path=input_path + '.tsv',
+                                             output_format='json'))
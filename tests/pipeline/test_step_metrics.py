@@ -0,0 +1,60 @@
+import json
+import logging
+import os
+import stat
+import sys
+
+import utils
+from pipeline.commands.import_cmd import ImportCmd
+from pipeline.step_metrics import StepMetrics, add_usage
+from static.input_format import InputFormat
+from static.semantic_type import SemanticType
+
+# Other tests replace utils.run_conda_command with a mock.
+RUN_CONDA_COMMAND = utils.run_conda_command
+
+
+def test_record_is_logged_and_written(tmp_path, caplog):
+    input_path = tmp_path / 'manifest.tsv'
+    input_path.write_text('sample-id\tabsolute-filepath\n')
+    output_path = tmp_path / 'demux.qza'
+    output_path.write_bytes(b'0' * 100)
+    command = ImportCmd(input_type=SemanticType.SD_SINGLE_QUALITY, input_path=str(input_path),
+                        output_path=str(output_path), input_format=InputFormat.SINGLE_PHRED_33)
+
+    metrics = StepMetrics(str(tmp_path / 'metrics.jsonl'), 'SRR1', logging.getLogger('test_step_metrics'))
+    with caplog.at_level(logging.INFO):
+        metrics.record(command, status='completed', wall_s=1.5, usage={'user_cpu_s': 1.0, 'sys_cpu_s': 0.1,
+                                                                        'max_rss_mib': 10.0})
+
+    with open(tmp_path / 'metrics.jsonl') as f:
+        [record] = [json.loads(line) for line in f]
+    assert record['step'] == 'tools_import'
+    assert record['input_bytes'] == len('sample-id\tabsolute-filepath\n')
+    assert record['output_bytes'] == 100
+    assert record['max_rss_mib'] == 10.0
+    assert caplog.records[-1].wall_s == 1.5
+
+
+def test_add_usage():
+    usage = {}
+    add_usage(usage, {'user_cpu_s': 1.0, 'sys_cpu_s': 0.5, 'max_rss_mib': 20.0})
+    add_usage(usage, {'user_cpu_s': 2.0, 'sys_cpu_s': 0.5, 'max_rss_mib': 10.0})
+    assert usage == {'user_cpu_s': 3.0, 'sys_cpu_s': 1.0, 'max_rss_mib': 20.0}
+
+
+def test_run_conda_command_measures_usage(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'run_conda_command', RUN_CONDA_COMMAND)
+    # Stands in for conda and runs the command that follows `run --no-capture-output -n <env>`.
+    conda_path = tmp_path / 'conda'
+    conda_path.write_text('#!/bin/sh\nshift 4\nexec "$@"\n')
+    os.chmod(conda_path, os.stat(conda_path).st_mode | stat.S_IEXEC)
+
+    usage = {}
+    cmd = f'{sys.executable} -c "data = bytearray(64 * 2 ** 20)"'
+    assert utils.run_conda_command(cmd, conda_path=str(conda_path), env='qiime2', usage=usage) == 0
+    assert usage['max_rss_mib'] >= 64
+    assert usage['user_cpu_s'] + usage['sys_cpu_s'] > 0
+
+    assert utils.run_conda_command(f'{sys.executable} -c "exit(3)"', conda_path=str(conda_path), env='qiime2',
+                                   usage={}) == 3
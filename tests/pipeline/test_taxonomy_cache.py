@@ -0,0 +1,83 @@
+import os
+from zipfile import ZipFile
+
+from artifacts import qza_reader
+from config import app_config
+from pipeline.commands.feature_classifier_cmd import FeatureClassifierCmd
+from pipeline.commands.import_cmd import ImportCmd
+from pipeline.executors.executor import Executor
+from pipeline.pipeline_factory import PipelineFactory
+from pipeline.taxonomy_cache import TaxonomyCache
+from static.layout import Layout
+from study.study import Study
+
+
+def write_qza(path, file_name, contents):
+    with ZipFile(path, 'w') as z:
+        z.writestr(f'uuid/data/{file_name}', contents)
+
+
+class FakeExecutor(Executor):
+    """
+    Classifies every sequence as its feature ID and records the classified features.
+    """
+
+    def __init__(self):
+        self.classified = []
+
+    def execute(self, command, usage=None):
+        if isinstance(command, FeatureClassifierCmd):
+            features = list(qza_reader.read_sequences(command.input_path))
+            self.classified.extend(features)
+            rows = ''.join(f'{feature}\tk__{feature}\t0.9\n' for feature in features)
+            write_qza(command.output_path, 'taxonomy.tsv', 'Feature ID\tTaxon\tConfidence\n' + rows)
+        elif isinstance(command, ImportCmd) and command.input_format == 'DNAFASTAFormat':
+            with open(command.input_path) as f:
+                write_qza(command.output_path, 'dna-sequences.fasta', f.read())
+        return 0
+
+
+def test_cache_hits_and_misses(tmp_path):
+    cache = TaxonomyCache(path=os.path.join(tmp_path, 'cache.sqlite'), max_entries=10)
+    cache.put_many({'ACGT': ('k__Bacteria', '0.99')}, classifier_version='v1', params='confidence=0.7')
+    assert cache.get_many({'ACGT', 'TTTT'}, 'v1', 'confidence=0.7') == {'ACGT': ('k__Bacteria', '0.99')}
+    assert cache.get_many({'ACGT'}, 'v2', 'confidence=0.7') == {}
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = TaxonomyCache(path=os.path.join(tmp_path, 'cache.sqlite'), max_entries=2)
+    cache.put_many({'AAAA': ('a', '1')}, 'v1', '')
+    cache.put_many({'CCCC': ('c', '1')}, 'v1', '')
+    cache.get_many({'AAAA'}, 'v1', '')
+    cache.put_many({'GGGG': ('g', '1')}, 'v1', '')
+    assert set(cache.get_many({'AAAA', 'CCCC', 'GGGG'}, 'v1', '')) == {'AAAA', 'GGGG'}
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_only_cache_misses_are_classified(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_config.attributes, 'public_results_path', str(tmp_path))
+    monkeypatch.setitem(app_config.attributes, 'taxonomy_cache_path', os.path.join(tmp_path, 'cache.sqlite'))
+    classifier_path = os.path.join(tmp_path, 'classifier.qza')
+    with open(classifier_path, 'w') as f:
+        f.write('classifier')
+
+    executor = FakeExecutor()
+    for study_id, features in (('study1', ['f1', 'f2']), ('study2', ['f2', 'f3'])):
+        study = Study(parent_dir=os.getcwd(), user_id=None, is_public=True)
+        study.id = study_id
+        study.layout = Layout.SINGLE
+        pipeline = PipelineFactory.generate_pipeline(study=study, logger_name='')
+        os.makedirs(pipeline.output_dir)
+        write_qza(pipeline.rep_seqs_path, 'dna-sequences.fasta',
+                  ''.join(f'>{feature}\n{feature.upper()}ACGT\n' for feature in features))
+
+        command = FeatureClassifierCmd(input_path=pipeline.rep_seqs_path, classifier_path=classifier_path,
+                                       output_path=pipeline.qza_taxonomy_path)
+        pipeline.run_command(executor, command)
+
+        with open(pipeline.cached_taxonomy_path) as f:
+            assert f.read().splitlines()[1:] == [f'{feature}\tk__{feature}\t0.9' for feature in features]
+
+    assert executor.classified == ['f1', 'f2', 'f3']
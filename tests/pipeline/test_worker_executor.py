@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+from pipeline.commands.import_cmd import ImportCmd
+from pipeline.executors.worker_executor import WorkerExecutor
+from static.input_format import InputFormat
+from static.semantic_type import SemanticType
+
+
+@pytest.fixture
+def executor():
+    executor = WorkerExecutor(worker_cmd=[sys.executable, '-m', 'pipeline.executors.fake_qiime_worker'])
+    yield executor
+    executor.close()
+
+
+def test_command_is_executed_by_worker(executor, tmp_path):
+    output_path = os.path.join(tmp_path, 'demux.qza')
+    command = ImportCmd(input_type=SemanticType.SD_SINGLE_QUALITY, input_path='manifest.tsv', output_path=output_path,
+                        input_format=InputFormat.SINGLE_PHRED_33)
+    assert executor.execute(command) == 0
+    assert os.path.isfile(output_path)
+
+
+def test_worker_is_reused(executor):
+    first_pid = executor.send({'action': 'ping'})['result']
+    assert executor.send({'action': 'ping'})['result'] == first_pid
+
+
+def test_worker_is_restarted_after_it_dies(executor):
+    first_pid = executor.send({'action': 'ping'})['result']
+    process = executor.workers[0].process
+    process.kill()
+    process.wait()
+    response = executor.send({'action': 'ping'})
+    assert response['ok']
+    assert response['result'] != first_pid
+
+
+def test_failed_action(executor):
+    response = executor.send({'action': 'fail'})
+    assert not response['ok']
+    assert 'Requested failure' in response['error']
+
+
+def test_concurrent_commands_use_separate_workers():
+    executor = WorkerExecutor(worker_cmd=[sys.executable, '-m', 'pipeline.executors.fake_qiime_worker'], max_workers=2)
+    first = executor.acquire()
+    second = executor.acquire()
+    assert first is not second
+    executor.release(first)
+    executor.release(second)
+    executor.close()
+
+
+def test_response_includes_usage(executor):
+    usage = executor.send({'action': 'ping'})['usage']
+    assert set(usage) == {'user_cpu_s', 'sys_cpu_s', 'max_rss_mib'}
+    assert usage['max_rss_mib'] > 0
@@ -0,0 +1,247 @@
+import csv
+import io
+import os
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+
+from artifacts import qza_reader
+from artifacts.biom_io import densify_rows
+from pipeline.commands.feature_table_filter_samples_cmd import FeatureTableFilterSamplesCmd
+from pipeline.commands.feature_table_merge_cmd import FeatureTableMergeCmd
+from pipeline.commands.feature_table_merge_taxa_cmd import FeatureTableMergeTaxaCmd
+from pipeline.commands.import_cmd import ImportCmd
+from results_merger import PARTIALS_DIR_NAME, MergedResults, StudyResults
+from static.input_format import InputFormat
+from static.merge_engine import MergeEngine
+
+h5py = pytest.importorskip('h5py')
+
+
+def write_table_qza(path, feature_ids, sample_ids, counts):
+    """
+    Write a feature table artifact with the given dense features x samples counts.
+    """
+    counts = np.asarray(counts, dtype=np.float64).reshape(len(feature_ids), len(sample_ids))
+    rows, columns = np.nonzero(counts)
+    buffer = io.BytesIO()
+    with h5py.File(buffer, 'w') as f:
+        f['observation/ids'] = np.array(feature_ids, dtype=object).astype('S')
+        f['sample/ids'] = np.array(sample_ids, dtype=object).astype('S')
+        f['observation/matrix/data'] = counts[rows, columns]
+        f['observation/matrix/indices'] = columns.astype(np.int32)
+        f['observation/matrix/indptr'] = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(feature_ids)))))
+    with ZipFile(path, 'w') as z:
+        z.writestr('uuid/data/feature-table.biom', buffer.getvalue())
+
+
+def write_taxonomy_qza(path, features_to_taxa):
+    contents = 'Feature ID\tTaxon\tConfidence\n' + ''.join(f'{feature_id}\t{taxon}\t{confidence}\n'
+                                                           for feature_id, (taxon, confidence)
+                                                           in features_to_taxa.items())
+    with ZipFile(path, 'w') as z:
+        z.writestr('uuid/data/taxonomy.tsv', contents)
+
+
+def read_counts(path):
+    """
+    Return a dictionary that maps (feature ID, sample ID) pairs to their non-zero counts.
+    """
+    table = qza_reader.read_feature_table(path)
+    dense = densify_rows(table, 0, len(table.feature_ids))
+    return {(table.feature_ids[i], table.sample_ids[j]): dense[i, j] for i, j in zip(*np.nonzero(dense))}
+
+
+class FakeQiime:
+    """
+    Executes the merge commands in Python.
+    """
+
+    def __init__(self, fail_paths=()):
+        self.executed = []
+        self.fail_paths = set(fail_paths)  # Inputs of the merge commands that fail.
+
+    def __call__(self, command):
+        self.executed.append(command)
+        if isinstance(command, FeatureTableMergeCmd) and self.fail_paths.intersection(command.get_inputs()):
+            raise ValueError('Qiime2 exited with return code 1.')
+        if isinstance(command, FeatureTableMergeCmd):
+            counts = {}
+            for path in command.get_inputs():
+                for key, value in read_counts(path).items():
+                    counts[key] = counts.get(key, 0) + value
+            self.write_counts(command.output_path, counts)
+        elif isinstance(command, FeatureTableFilterSamplesCmd):
+            with open(command.sample_metadata) as tsv_file:
+                excluded = {row[0] for row in list(csv.reader(tsv_file, delimiter='\t'))[1:]}
+            counts = {key: value for key, value in read_counts(command.input_path).items() if key[1] not in excluded}
+            self.write_counts(command.output_path, counts)
+        elif isinstance(command, FeatureTableMergeTaxaCmd):
+            features_to_taxa = {}
+            for path in command.get_inputs():
+                for feature_id, taxon in qza_reader.read_taxonomy(path).items():
+                    features_to_taxa.setdefault(feature_id, taxon)
+            write_taxonomy_qza(command.output_path, features_to_taxa)
+        elif isinstance(command, ImportCmd) and command.input_format == InputFormat.BIOM_V210:
+            with ZipFile(command.output_path, 'w') as z:
+                z.write(command.input_path, 'uuid/data/feature-table.biom')
+        elif isinstance(command, ImportCmd):
+            with open(command.input_path) as tsv_file:
+                rows = list(csv.reader(tsv_file, delimiter='\t'))[1:]
+            write_taxonomy_qza(command.output_path, {row[0]: (row[1], row[2]) for row in rows})
+        else:
+            raise ValueError(f'Unexpected command: {command}')
+
+    @staticmethod
+    def write_counts(path, counts):
+        feature_ids = sorted({feature_id for feature_id, _ in counts})
+        sample_ids = sorted({sample_id for _, sample_id in counts})
+        dense = np.zeros((len(feature_ids), len(sample_ids)))
+        for (feature_id, sample_id), value in counts.items():
+            dense[feature_ids.index(feature_id), sample_ids.index(sample_id)] = value
+        write_table_qza(path, feature_ids, sample_ids, dense)
+
+
+def create_study(tmp_path, study_id, feature_ids, n_samples):
+    study_dir = tmp_path / study_id
+    study_dir.mkdir()
+    study = StudyResults(study_id, str(study_dir / 'feature-table.qza'), str(study_dir / 'taxonomy.qza'))
+    sample_ids = [f'{study_id}_S{i}' for i in range(n_samples)]
+    write_table_qza(study.feature_table_path, feature_ids, sample_ids, np.ones((len(feature_ids), n_samples)))
+    write_taxonomy_qza(study.taxonomy_results_path, {feature_id: (f'k__{feature_id}', '0.9')
+                                                     for feature_id in feature_ids})
+    return study
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    output_dir = tmp_path / 'merged'
+    output_dir.mkdir()
+    return str(output_dir)
+
+
+def test_added_study_is_merged_into_existing_results(tmp_path, output_dir):
+    first = create_study(tmp_path, 'SRR1', ['f1', 'f2'], n_samples=2)
+    second = create_study(tmp_path, 'SRR2', ['f2', 'f3'], n_samples=1)
+    qiime = FakeQiime()
+    assert MergedResults(output_dir, execute=qiime).update([first])
+
+    merged_results = MergedResults(output_dir, execute=qiime)
+    assert merged_results.update([first, second])
+    assert not merged_results.update([first, second])
+
+    # Only the new study was merged into the existing results.
+    merge_cmd = [command for command in qiime.executed if isinstance(command, FeatureTableMergeCmd)][-1]
+    assert merge_cmd.get_inputs() == [merged_results.qza_table_path, second.feature_table_path]
+
+    counts = read_counts(merged_results.qza_table_path)
+    assert len(counts) == 6
+    assert set(qza_reader.read_taxonomy(merged_results.qza_taxonomy_path)) == {'f1', 'f2', 'f3'}
+
+
+def test_removed_study_is_filtered_out(tmp_path, output_dir):
+    first = create_study(tmp_path, 'SRR1', ['f1', 'f2'], n_samples=2)
+    second = create_study(tmp_path, 'SRR2', ['f2', 'f3'], n_samples=1)
+    qiime = FakeQiime()
+    merged_results = MergedResults(output_dir, execute=qiime)
+    merged_results.update([first, second])
+    n_merges = len(qiime.executed)
+
+    assert merged_results.update([first])
+    assert not any(isinstance(command, FeatureTableMergeCmd) for command in qiime.executed[n_merges:])
+    assert {sample_id for _, sample_id in read_counts(merged_results.qza_table_path)} == {'SRR1_S0', 'SRR1_S1'}
+    assert set(qza_reader.read_taxonomy(merged_results.qza_taxonomy_path)) == {'f1', 'f2'}
+    assert list(MergedResults(output_dir, execute=qiime).studies) == ['SRR1']
+
+
+def test_overlapping_samples_are_rejected(tmp_path, output_dir):
+    first = create_study(tmp_path, 'SRR1', ['f1'], n_samples=1)
+    duplicate = StudyResults('SRR1_copy', first.feature_table_path, first.taxonomy_results_path)
+    merged_results = MergedResults(output_dir, execute=FakeQiime())
+    merged_results.update([first])
+    with pytest.raises(ValueError):
+        merged_results.update([first, duplicate])
+
+
+def test_results_are_rebuilt_if_the_manifest_does_not_match(tmp_path, output_dir):
+    first = create_study(tmp_path, 'SRR1', ['f1'], n_samples=1)
+    qiime = FakeQiime()
+    merged_results = MergedResults(output_dir, execute=qiime)
+    merged_results.update([first])
+
+    # An interrupted update replaced the merged table after the manifest was written.
+    write_table_qza(merged_results.qza_table_path, ['f9'], ['S9'], [[1]])
+    merged_results = MergedResults(output_dir, execute=qiime)
+    assert merged_results.studies == {}
+    assert not os.path.exists(merged_results.qza_table_path)
+    assert merged_results.update([first])
+
+
+def test_native_engine_merges_without_qiime_merge_commands(tmp_path, output_dir):
+    first = create_study(tmp_path, 'SRR1', ['f1', 'f2'], n_samples=2)
+    second = create_study(tmp_path, 'SRR2', ['f2', 'f3'], n_samples=1)
+    qiime = FakeQiime()
+    merged_results = MergedResults(output_dir, execute=qiime, engine=MergeEngine.NATIVE)
+    assert merged_results.update([first, second])
+    assert all(isinstance(command, ImportCmd) for command in qiime.executed)
+    assert read_counts(merged_results.qza_table_path) == {('f1', 'SRR1_S0'): 1, ('f1', 'SRR1_S1'): 1,
+                                                          ('f2', 'SRR1_S0'): 1, ('f2', 'SRR1_S1'): 1,
+                                                          ('f2', 'SRR2_S0'): 1, ('f3', 'SRR2_S0'): 1}
+
+    assert merged_results.update([second])
+    assert set(read_counts(merged_results.qza_table_path)) == {('f2', 'SRR2_S0'), ('f3', 'SRR2_S0')}
+    assert set(qza_reader.read_taxonomy(merged_results.qza_taxonomy_path)) == {'f2', 'f3'}
+    assert sorted(os.listdir(output_dir)) == ['merged_feature_tables.qza', 'merged_manifest.json',
+                                              'merged_taxonomy_results.qza']
+
+
+def get_merge_inputs(qiime):
+    return [command.get_inputs() for command in qiime.executed if isinstance(command, FeatureTableMergeCmd)]
+
+
+def test_many_studies_are_merged_by_tree_reduction(tmp_path, output_dir):
+    studies = [create_study(tmp_path, f'SRR{i}', [f'f{i}', 'f_shared'], n_samples=1) for i in range(7)]
+    qiime = FakeQiime()
+    merged_results = MergedResults(output_dir, execute=qiime, fan_in=2)
+    assert merged_results.update(studies[:5])
+    assert all(len(inputs) <= 2 for inputs in get_merge_inputs(qiime))
+    assert len(read_counts(merged_results.qza_table_path)) == 10
+    assert not os.path.exists(os.path.join(output_dir, PARTIALS_DIR_NAME))
+
+    # The existing results are merged with the reduced results of the added studies.
+    qiime.executed = []
+    assert merged_results.update(studies)
+    assert get_merge_inputs(qiime)[-1][0] == merged_results.qza_table_path
+    assert len(read_counts(merged_results.qza_table_path)) == 14
+    assert set(qza_reader.read_taxonomy(merged_results.qza_taxonomy_path)) == {f'f{i}' for i in range(7)} | {'f_shared'}
+
+
+def test_failed_batch_is_retried_on_its_own(tmp_path, output_dir):
+    studies = [create_study(tmp_path, f'SRR{i}', [f'f{i}'], n_samples=1) for i in range(4)]
+    qiime = FakeQiime(fail_paths=[studies[2].feature_table_path])
+    merged_results = MergedResults(output_dir, execute=qiime, fan_in=2, retries=2)
+    with pytest.raises(ValueError):
+        merged_results.update(studies)
+    inputs = get_merge_inputs(qiime)
+    assert inputs.count([studies[2].feature_table_path, studies[3].feature_table_path]) == 3
+    assert inputs.count([studies[0].feature_table_path, studies[1].feature_table_path]) == 1
+    assert merged_results.studies == {}
+
+    # The partial result of the batch that succeeded is reused.
+    qiime.fail_paths.clear()
+    qiime.executed = []
+    assert merged_results.update(studies)
+    inputs = get_merge_inputs(qiime)
+    assert [studies[0].feature_table_path, studies[1].feature_table_path] not in inputs
+    assert [studies[2].feature_table_path, studies[3].feature_table_path] in inputs
+    assert len(read_counts(merged_results.qza_table_path)) == 4
+
+
+def test_batches_are_merged_in_worker_processes(tmp_path, output_dir):
+    studies = [create_study(tmp_path, f'SRR{i}', [f'f{i}'], n_samples=2) for i in range(6)]
+    merged_results = MergedResults(output_dir, execute=FakeQiime(), engine=MergeEngine.NATIVE, fan_in=2,
+                                   max_workers=2)
+    assert merged_results.update(studies)
+    assert len(read_counts(merged_results.qza_table_path)) == 12
+    assert set(qza_reader.read_taxonomy(merged_results.qza_taxonomy_path)) == {f'f{i}' for i in range(6)}
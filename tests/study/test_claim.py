@@ -0,0 +1,83 @@
+import json
+import os
+import pickle
+import time
+
+from study.claim import Claim, read_claim
+
+
+def test_only_one_claim_is_acquired(tmp_path):
+    claim_1 = Claim(str(tmp_path))
+    claim_2 = Claim(str(tmp_path))
+    assert claim_1.acquire()
+    assert not claim_2.acquire()
+    assert claim_1.is_held()
+    assert not claim_2.is_held()
+
+    record = read_claim(claim_1.path)
+    assert record['token'] == claim_1.token
+    assert record['pid'] == os.getpid()
+
+
+def test_expired_claim_is_reclaimed(tmp_path):
+    stale = Claim(str(tmp_path), lease=1)
+    assert stale.acquire()
+    with open(stale.path, 'w') as f:
+        json.dump({**stale.get_record(), 'expires_at': time.time() - 1}, f)
+
+    claim = Claim(str(tmp_path))
+    assert claim.acquire()
+    assert claim.reclaimed
+    assert not stale.renew()
+    assert stale.lost
+
+    # The stale holder doesn't remove the new claim.
+    stale.release()
+    assert claim.is_held()
+    claim.release()
+    assert not os.path.exists(claim.path)
+
+
+def test_marker_without_lease_expires_after_default_lease(tmp_path):
+    path = tmp_path / 'claimed.txt'
+    path.write_text('')
+    os.utime(path, (1000, 1000))
+    assert Claim(str(tmp_path)).acquire()
+
+
+def test_heartbeat_renews_the_lease(tmp_path):
+    claim = Claim(str(tmp_path), lease=0.3)
+    assert claim.acquire()
+    expires_at = claim.expires_at
+
+    # The claim is handed to a worker process without its heartbeat.
+    claim = pickle.loads(pickle.dumps(claim))
+    claim.start_heartbeat()
+    time.sleep(0.25)
+    claim.stop_heartbeat()
+    assert read_claim(claim.path)['expires_at'] > expires_at
+
+
+def expire(claim):
+    record = read_claim(claim.path)
+    with open(claim.path, 'w') as f:
+        json.dump({**record, 'expires_at': time.time() - 1}, f)
+
+
+def test_attempts_are_counted_across_reclaims(tmp_path):
+    claim = Claim(str(tmp_path))
+    assert claim.acquire()
+    assert claim.attempts == 1
+
+    for attempts in (2, 3):
+        expire(claim)
+        claim = Claim(str(tmp_path))
+        assert claim.acquire()
+        assert claim.attempts == attempts
+        assert read_claim(claim.path)['attempts'] == attempts
+
+    # A released claim starts over.
+    claim.release()
+    claim = Claim(str(tmp_path))
+    assert claim.acquire()
+    assert claim.attempts == 1
@@ -0,0 +1,104 @@
+import numpy as np
+
+from study import fastq_compressor, fastq_profiler
+
+
+def write_fastq(path, qualities):
+    with open(path, 'w') as f:
+        for i, quality in enumerate(qualities):
+            f.write(f'@read{i}\n{"A" * len(quality)}\n+\n{quality}\n')
+
+
+def test_profile_fastq(tmp_path):
+    path = tmp_path / 'sample_1.fastq'
+    write_fastq(path, ['II#', 'I5', '5II'])
+
+    profile = fastq_profiler.profile_fastq(str(path), chunk_reads=2)
+
+    assert profile.n_reads == 3
+    assert profile.length_counts.tolist() == [0, 0, 1, 2]
+    assert profile.quality_counts[0, 40] == 2
+    assert profile.quality_counts[0, 20] == 1
+    assert profile.quality_counts[2, 2] == 1
+    assert profile.get_quality_quantile(0.5).tolist() == [40, 40, 2]
+
+
+def test_profile_files_merges_the_files(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f'sample{i}_1.fastq'))
+        write_fastq(paths[-1], ['I' * (10 + i)] * 5)
+
+    profile = fastq_profiler.profile_files(paths, max_workers=2)
+
+    assert profile.n_reads == 15
+    assert profile.to_dict()['max_length'] == 12
+    assert profile.to_dict()['min_length'] == 10
+
+
+def test_choose_positions():
+    # 5 low quality leading positions, 100 high quality positions and a low quality tail.
+    quality = '#' * 5 + 'I' * 100 + '#' * 45
+    data = np.frombuffer(''.join(f'@r\n{"A" * 150}\n+\n{quality}\n' for _ in range(10)).encode(), dtype=np.uint8)
+    profile = fastq_profiler.profile_buffer(data)
+    assert profile.choose_positions(min_quality=25) == (5, 105)
+
+    # Reads that are good until their end are not truncated.
+    data = np.frombuffer(b'@r\nAAAA\n+\nIIII\n', dtype=np.uint8)
+    assert fastq_profiler.profile_buffer(data).choose_positions(min_quality=25) == (0, 0)
+
+
+def create_profile(length, good_length, n_reads=10):
+    """
+    Return the profile of reads of the given length whose quality drops after good_length bases.
+    """
+    quality = 'I' * good_length + '#' * (length - good_length)
+    data = ''.join(f'@r\n{"A" * length}\n+\n{quality}\n' for _ in range(n_reads))
+    return fastq_profiler.profile_buffer(np.frombuffer(data.encode(), dtype=np.uint8))
+
+
+def test_paired_reads_are_truncated_to_span_the_amplicon():
+    # A mid-read quality dip in both directions truncates 2x250 reads to 125 + 125 bases, too short for 292 bases.
+    fwd, rev = create_profile(250, 125), create_profile(250, 125)
+    assert fastq_profiler.choose_paired_positions(fwd, rev, min_quality=25) == [(0, 125), (0, 125)]
+
+    positions = fastq_profiler.choose_paired_positions(fwd, rev, min_quality=25, amplicon_length=292)
+    assert positions == [(0, 152), (0, 152)]
+    assert sum(trunc_pos for _, trunc_pos in positions) == 292 + fastq_profiler.MIN_MERGE_OVERLAP
+
+    # The reverse reads are only 160 bases long, so the forward reads take the rest.
+    positions = fastq_profiler.choose_paired_positions(create_profile(250, 125), create_profile(160, 150),
+                                                       min_quality=25, amplicon_length=292)
+    assert positions == [(0, 144), (0, 160)]
+
+    # Long enough truncated reads are left as is.
+    fwd, rev = create_profile(250, 200), create_profile(250, 180)
+    assert fastq_profiler.choose_paired_positions(fwd, rev, min_quality=25, amplicon_length=292) == [(0, 200),
+                                                                                                     (0, 180)]
+
+
+def test_paired_reads_are_not_truncated_if_they_cant_span_the_amplicon():
+    fwd, rev = create_profile(150, 100), create_profile(150, 100)
+    assert fastq_profiler.choose_paired_positions(fwd, rev, min_quality=25, amplicon_length=292) == [(0, 0), (0, 0)]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.fastq'
+    path.write_text('')
+    profile = fastq_profiler.profile_fastq(str(path))
+    assert profile.n_reads == 0
+    assert profile.choose_positions(min_quality=25) == (0, 0)
+
+
+def test_profile_gzip_matches_uncompressed(tmp_path):
+    path = tmp_path / 'sample_1.fastq'
+    write_fastq(path, ['II#', 'I5', '5II'] * 50)
+    expected = fastq_profiler.profile_fastq(str(path))
+
+    gz_path = fastq_compressor.compress_file(str(path))
+    assert not path.exists()
+
+    profile = fastq_profiler.profile_gzip(gz_path, block_size=64)
+    assert profile.n_reads == expected.n_reads
+    assert np.array_equal(profile.quality_counts, expected.quality_counts)
+    assert np.array_equal(profile.length_counts, expected.length_counts)
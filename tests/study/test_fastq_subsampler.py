@@ -0,0 +1,42 @@
+import gzip
+
+import numpy as np
+
+from study import fastq_subsampler
+
+
+def test_select_indices_is_uniform_and_seeded():
+    counts = np.zeros(20, dtype=np.int64)
+    for seed in range(2000):
+        indices = fastq_subsampler.select_indices(20, 5, np.random.default_rng(seed))
+        assert len(np.unique(indices)) == 5
+        assert np.all(np.diff(indices) > 0)
+        counts[indices] += 1
+
+    # Each index is selected with probability 5 / 20.
+    assert np.all(np.abs(counts / 2000 - 0.25) < 0.05)
+
+    rng_1, rng_2 = np.random.default_rng(1), np.random.default_rng(1)
+    assert np.array_equal(fastq_subsampler.select_indices(1000, 10, rng_1),
+                          fastq_subsampler.select_indices(1000, 10, rng_2))
+
+
+def test_write_records_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(fastq_subsampler, 'BLOCK_SIZE', 7)
+    path = tmp_path / 'sample_1.fastq'
+    path.write_text(''.join(f'@r{i}\nACGT\n+\nIIII\n' for i in range(10)).rstrip('\n'))
+    assert fastq_subsampler.count_records(str(path)) == 10
+
+    output_path = str(tmp_path / 'out.fastq.gz')
+    fastq_subsampler.write_records(str(path), output_path, np.array([0, 4, 9]))
+
+    with gzip.open(output_path, 'rt') as f:
+        assert f.read() == ''.join(f'@r{i}\nACGT\n+\nIIII\n' for i in (0, 4, 9))
+
+
+def test_small_samples_are_not_subsampled(tmp_path):
+    path = tmp_path / 'sample_1.fastq'
+    path.write_text('@r\nACGT\n+\nIIII\n')
+    samples_to_files = fastq_subsampler.subsample_samples({'sample': [str(path)]}, max_reads=5, seed=0,
+                                                          output_dir=str(tmp_path / 'out'))
+    assert samples_to_files == {'sample': [str(path)]}
@@ -1,3 +1,4 @@
+import gzip
 import os
 from unittest.mock import Mock
 
@@ -5,8 +6,13 @@ import pytest
 
 import utils
 from database_manager.db_manager import db_manager
+from static.layout import Layout
+from static.study_state import StudyState
 from study.study import InvalidStudyError, Study
 
+# Other tests replace utils.get_file_paths with a mock.
+GET_FILE_PATHS = utils.get_file_paths
+
 
 def test_invalid_parent_dir():
     study = Study(parent_dir='', user_id='', is_public='')
@@ -29,3 +35,41 @@ def test_invalid_paired_fastq_file_names():
 
 
 
+
+def test_compressed_and_uncompressed_fastq_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'get_file_paths', GET_FILE_PATHS)
+    for file_name in ('SRR1_1.fastq', 'SRR1_2.fastq', 'SRR2_1.fastq.gz', 'SRR2_2.fastq.gz'):
+        (tmp_path / file_name).write_text('@r\nA\n+\nI\n')
+    study = Study(parent_dir=str(tmp_path), user_id='', is_public='')
+    study.layout = Layout.PAIRED
+
+    samples_to_files = study.compress_sequencing_files(study.map_samples_to_files())
+
+    assert sorted(os.listdir(tmp_path)) == ['SRR1_1.fastq.gz', 'SRR1_2.fastq.gz', 'SRR2_1.fastq.gz', 'SRR2_2.fastq.gz']
+    assert samples_to_files['SRR1'] == [str(tmp_path / 'SRR1_1.fastq.gz'), str(tmp_path / 'SRR1_2.fastq.gz')]
+    assert Study.get_state(os.listdir(tmp_path) + ['complete.txt']) == StudyState.READY
+
+
+def test_reads_are_capped_per_sample(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'get_file_paths', GET_FILE_PATHS)
+    for direction in (1, 2):
+        with open(tmp_path / f'SRR1_{direction}.fastq', 'w') as f:
+            for i in range(10):
+                f.write(f'@read{i}/{direction}\nACGT\n+\nIIII\n')
+    (tmp_path / 'options.yaml').write_text('max_reads_per_sample: 4\n')
+    study = Study(parent_dir=str(tmp_path), user_id='', is_public='')
+    study.layout = Layout.PAIRED
+
+    assert study.get_max_reads_per_sample() == 4
+    samples_to_files = study.subsample(study.map_samples_to_files(), 4)
+
+    reads = []
+    for path in samples_to_files['SRR1']:
+        assert os.path.dirname(path) == str(tmp_path / 'subsampled')
+        with gzip.open(path, 'rt') as f:
+            reads.append([line.split('/')[0] for line in f.read().splitlines()[::4]])
+    assert len(reads[0]) == 4
+    assert reads[0] == reads[1]
+
+    # The subsampled files are not mapped again.
+    assert study.map_samples_to_files()['SRR1'] == [str(tmp_path / 'SRR1_1.fastq'), str(tmp_path / 'SRR1_2.fastq')]
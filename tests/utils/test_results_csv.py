@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import utils
+
+FEATURE_TABLE = """# Constructed from biom file
+#OTU ID\tS1\tS2
+f1\t10.0\t0.0
+f2\t3.0\t7.0
+"""
+
+TAXONOMY = """Feature ID\tTaxon\tConfidence
+f1\tk__Bacteria; p__Firmicutes\t0.99
+f2\tk__Bacteria\t0.75
+"""
+
+
+def write(path, contents):
+    with open(path, 'w') as f:
+        f.write(contents)
+    return path
+
+
+def test_results_csv(tmp_path):
+    table_path = write(os.path.join(tmp_path, 'table.tsv'), FEATURE_TABLE)
+    taxonomy_path = write(os.path.join(tmp_path, 'taxonomy.tsv'), TAXONOMY)
+    results_path = utils.create_results_csv('ERR1', table_path, taxonomy_path, str(tmp_path))
+    with open(results_path) as f:
+        assert f.read().splitlines() == ['acc,taxon,confidence,abundance',
+                                         'ERR1,k__Bacteria; p__Firmicutes,0.99,10',
+                                         'ERR1,k__Bacteria,0.75,3',
+                                         'ERR1,k__Bacteria; p__Firmicutes,0.99,0',
+                                         'ERR1,k__Bacteria,0.75,7']
+
+
+def test_results_are_built_in_chunks(tmp_path):
+    table_path = write(os.path.join(tmp_path, 'table.tsv'), FEATURE_TABLE)
+    taxonomy_path = write(os.path.join(tmp_path, 'taxonomy.tsv'), TAXONOMY)
+    chunks = list(utils.iter_results_chunks('ERR1', table_path, taxonomy_path, chunk_cells=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+    assert sum(chunk['abundance'].sum() for chunk in chunks) == 20
+
+
+def test_results_csv_strings_have_bounded_rows(tmp_path):
+    table_path = write(os.path.join(tmp_path, 'table.tsv'), FEATURE_TABLE)
+    taxonomy_path = write(os.path.join(tmp_path, 'taxonomy.tsv'), TAXONOMY)
+    blocks = list(utils.iter_results_csv('ERR1', table_path, taxonomy_path, block_rows=3))
+    assert [block.count('\n') for block in blocks] == [3, 1]
+    assert ''.join(blocks).splitlines()[-1] == 'ERR1,k__Bacteria,0.75,7'
+
+
+def test_missing_feature(tmp_path):
+    table_path = write(os.path.join(tmp_path, 'table.tsv'), FEATURE_TABLE + 'f3\t1.0\t1.0\n')
+    taxonomy_path = write(os.path.join(tmp_path, 'taxonomy.tsv'), TAXONOMY)
+    with pytest.raises(ValueError, match='f3'):
+        utils.create_results_csv('ERR1', table_path, taxonomy_path, str(tmp_path))
+
+
+def test_missing_confidence_column(tmp_path):
+    table_path = write(os.path.join(tmp_path, 'table.tsv'), FEATURE_TABLE)
+    taxonomy_path = write(os.path.join(tmp_path, 'taxonomy.tsv'), 'Feature ID\tTaxon\nf1\tk__Bacteria\n')
+    with pytest.raises(ValueError, match='Confidence'):
+        utils.create_results_csv('ERR1', table_path, taxonomy_path, str(tmp_path))
@@ -4,12 +4,22 @@ import shutil
 import subprocess
 import sys
 import time
-from pwd import getpwuid
 from zipfile import ZipFile
 
+import numpy as np
 import pandas as pd
 from pythonjsonlogger import jsonlogger
 
+from artifacts import biom_io, qza_reader
+from artifacts.artifact_error import ArtifactError
+from pipeline import step_metrics
+
+# Number of (sample, feature) cells that are held in memory at once while building the results.
+RESULTS_CHUNK_CELLS = 1000000
+
+# Maximum number of rows in each csv string of the results.
+RESULTS_CSV_BLOCK_ROWS = 10000
+
 
 def get_file_paths(directory, ext):
     """
@@ -25,12 +35,20 @@ def get_file_paths(directory, ext):
     return files
 
 
-def run_conda_command(cmd, conda_path, env):
+def run_conda_command(cmd, conda_path, env, usage=None):
     """
-    Run the shell command in the given conda environment.
+    Run the shell command in the given conda environment. If a usage dictionary is given, the CPU times and peak memory
+    of the command and its descendants are added to it.
     """
     cmd = f'{conda_path} run --no-capture-output -n {env} ' + cmd
-    process = subprocess.run(cmd, shell=True)
+    if usage is None:
+        process = subprocess.run(cmd, shell=True)
+        return process.returncode
+
+    process = subprocess.Popen(cmd, shell=True)
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    step_metrics.add_usage(usage, step_metrics.get_usage(rusage))
 
     return process.returncode
 
@@ -84,23 +102,55 @@ def get_runtime(start_time):
     return '%dh:%dm:%ds' % (hours, mins, secs)
 
 
+# Fields that are added to every log record emitted by this process.
+logging_context = {'worker': 'main'}
+
+
+class LoggingContextFilter(logging.Filter):
+    """
+    Logging filter that adds the fields in the logging context to each log record.
+    """
+
+    def filter(self, record):
+        for key, value in logging_context.items():
+            setattr(record, key, value)
+        return True
+
+
+def set_logging_context(**fields):
+    """
+    Update the logging context of this process (e.g. the name of the worker that processes studies).
+    """
+    logging_context.update(fields)
+
+
 def setup_logger(logger_name, logging_level):
     """
-    Create a logger and return it.
+    Create a logger and return it. Return the existing logger if it has already been set up in this process.
     """
     logger = logging.getLogger(logger_name)
 
+    if logger.handlers:
+        logger.setLevel(logging_level)
+        return logger
+
     stdout_handler = logging.StreamHandler(stream=sys.stdout)
     file_handler = logging.FileHandler(logger_name + '.log')
 
-    stdout_format = logging.Formatter("%(name)s: %(asctime)s | %(levelname)s | %(filename)s:%(lineno)s | %(message)s")
+    stdout_format = logging.Formatter("%(name)s: %(asctime)s | %(levelname)s | %(worker)s | %(filename)s:%(lineno)s | "
+                                      "%(message)s")
 
-    json_format = jsonlogger.JsonFormatter("%(name)s %(asctime)s %(levelname)s %(filename)s %(lineno)s %(message)s",
+    json_format = jsonlogger.JsonFormatter("%(name)s %(asctime)s %(levelname)s %(worker)s %(filename)s %(lineno)s "
+                                           "%(message)s",
                                            datefmt="%Y-%m-%dT%H:%M:%SZ")
 
     stdout_handler.setFormatter(stdout_format)
     file_handler.setFormatter(json_format)
 
+    context_filter = LoggingContextFilter()
+    stdout_handler.addFilter(context_filter)
+    file_handler.addFilter(context_filter)
+
     logger.addHandler(stdout_handler)
     logger.addHandler(file_handler)
 
@@ -113,24 +163,29 @@ def create_txt(file_path, contents=''):
     """
     Create a text file if it doesn't already exist.
     """
-    if os.path.isfile(file_path):
-        return
-
     try:
-        with open(file_path, 'w') as f:
+        with open(file_path, 'x') as f:
             if contents:
                 f.write(contents)
+    except FileExistsError:
+        return
     except Exception:
         raise ValueError(f'Unable to create {file_path}.')
 
 
-def create_results_csv(study_id, feature_table_path, taxonomy_results_path, output_dir):
+def read_taxonomy_results(taxonomy_results_path):
     """
-    Create a csv file that includes Qiime2 results.
+    Load the taxonomy results tsv file, or the taxonomy artifact, into a data frame indexed by feature ID. Raise a
+    ValueError if the Taxon or Confidence column is missing.
     """
-    # Load the tsv files into dictionaries
-    feature_table = pd.read_csv(feature_table_path, index_col=0, skiprows=1, sep='\t').to_dict()
-    features_to_taxa = pd.read_csv(taxonomy_results_path, index_col=0, sep='\t').to_dict()
+    if taxonomy_results_path.endswith('.qza'):
+        try:
+            features_to_taxa = pd.read_csv(qza_reader.read_payload(taxonomy_results_path, 'taxonomy.tsv'),
+                                           index_col=0, sep='\t')
+        except (ArtifactError, OSError) as e:
+            raise ValueError(str(e))
+    else:
+        features_to_taxa = pd.read_csv(taxonomy_results_path, index_col=0, sep='\t')
 
     # Validate the taxonomy results file
     if 'Taxon' not in features_to_taxa:
@@ -139,27 +194,98 @@ def create_results_csv(study_id, feature_table_path, taxonomy_results_path, outp
     if 'Confidence' not in features_to_taxa:
         raise ValueError(f'Confidence column is missing in {taxonomy_results_path}.')
 
-    csv_contents = []
+    features_to_taxa.index = features_to_taxa.index.astype(str)
+    return features_to_taxa[~features_to_taxa.index.duplicated()]
 
-    # Populate csv contents list
-    for features_to_counts in feature_table.values():
-        for feature, abundance in features_to_counts.items():
-            try:
-                taxon = features_to_taxa['Taxon'][feature]
-                confidence = features_to_taxa['Confidence'][feature]
-            except KeyError:
-                raise ValueError(f'Feature ID {feature} is missing in {taxonomy_results_path}.')
 
-            csv_contents.append(f'{study_id},{taxon},{confidence},{int(abundance)}\n')
+def iter_results_chunks(study_id, feature_table_path, taxonomy_results_path, chunk_cells=RESULTS_CHUNK_CELLS):
+    """
+    Yield data frames with acc, taxon, confidence, and abundance columns that include a row for each (sample, feature)
+    pair in the feature table. The feature table is read in chunks of about chunk_cells cells so that memory usage
+    doesn't depend on the size of the table. Raise a ValueError if a feature is missing in the taxonomy results.
+    The feature table may be a biom tsv file or a feature table artifact.
+    """
+    features_to_taxa = read_taxonomy_results(taxonomy_results_path)
+
+    if feature_table_path.endswith('.qza'):
+        yield from iter_artifact_results_chunks(study_id, feature_table_path, features_to_taxa, taxonomy_results_path,
+                                                chunk_cells)
+        return
+
+    # Read the header to size the chunks. The first line of a biom tsv file is a comment.
+    with open(feature_table_path, 'r') as f:
+        f.readline()
+        n_samples = max(1, len(f.readline().rstrip('\n').split('\t')) - 1)
 
-    # Create the csv file
+    chunks = pd.read_csv(feature_table_path, index_col=0, skiprows=1, sep='\t',
+                         chunksize=max(1, chunk_cells // n_samples))
+    for chunk in chunks:
+        chunk.index = chunk.index.astype(str)
+
+        missing = chunk.index.difference(features_to_taxa.index)
+        if len(missing):
+            raise ValueError(f'Feature ID {missing[0]} is missing in {taxonomy_results_path}.')
+
+        yield build_results_frame(study_id=study_id,
+                                  taxa=features_to_taxa.loc[chunk.index],
+                                  abundances=chunk.to_numpy())
+
+
+def iter_artifact_results_chunks(study_id, feature_table_path, features_to_taxa, taxonomy_results_path, chunk_cells):
+    """
+    Yield the results data frames for a feature table artifact. The sparse counts are densified a chunk at a time.
+    """
+    try:
+        table = qza_reader.read_feature_table(feature_table_path)
+    except (ArtifactError, OSError) as e:
+        raise ValueError(str(e))
+
+    feature_ids = pd.Index(table.feature_ids)
+    missing = feature_ids.difference(features_to_taxa.index)
+    if len(missing):
+        raise ValueError(f'Feature ID {missing[0]} is missing in {taxonomy_results_path}.')
+
+    chunk_size = max(1, chunk_cells // max(1, len(table.sample_ids)))
+    for start in range(0, len(feature_ids), chunk_size):
+        yield build_results_frame(study_id=study_id,
+                                  taxa=features_to_taxa.loc[feature_ids[start:start + chunk_size]],
+                                  abundances=biom_io.densify_rows(table, start, start + chunk_size))
+
+
+def build_results_frame(study_id, taxa, abundances):
+    """
+    Return the results data frame for a features x samples matrix of abundances and the taxonomy results of the
+    features. Rows are ordered by sample, then by feature.
+    """
+    n_samples = abundances.shape[1]
+    return pd.DataFrame({'acc': study_id,
+                         'taxon': np.tile(taxa['Taxon'].to_numpy(), n_samples),
+                         'confidence': np.tile(taxa['Confidence'].to_numpy(), n_samples),
+                         'abundance': abundances.ravel(order='F').astype(np.int64)})
+
+
+def iter_results_csv(study_id, feature_table_path, taxonomy_results_path, block_rows=RESULTS_CSV_BLOCK_ROWS):
+    """
+    Yield the results as csv strings without a header. Each string includes at most block_rows rows.
+    """
+    for chunk in iter_results_chunks(study_id, feature_table_path, taxonomy_results_path):
+        for start in range(0, len(chunk), block_rows):
+            yield chunk.iloc[start:start + block_rows].to_csv(header=False, index=False)
+
+
+def create_results_csv(study_id, feature_table_path, taxonomy_results_path, output_dir):
+    """
+    Create a csv file that includes Qiime2 results.
+    """
     results_csv_path = os.path.join(output_dir, 'results.csv')
     with open(results_csv_path, "w") as results:
         results.write('acc,taxon,confidence,abundance\n')
-        results.writelines(csv_contents)
+        for chunk in iter_results_chunks(study_id, feature_table_path, taxonomy_results_path):
+            chunk.to_csv(results, header=False, index=False)
 
     return results_csv_path
 
+
 def unzip(zip_file_path, output_dir):
     """
     Unzip the given file in the output directory
@@ -167,11 +293,3 @@ def unzip(zip_file_path, output_dir):
     with ZipFile(zip_file_path, 'r') as z:
         z.extractall(path=output_dir)
 
-
-def is_file_owned_by_me(file_path):
-    """
-    Return true if I am the owner of the given file. Otherwise, return false.
-    """
-    file_owner = getpwuid(os.stat(file_path).st_uid).pw_name
-    myself = getpwuid(os.getuid()).pw_name
-    return file_owner == myself
\ No newline at end of file